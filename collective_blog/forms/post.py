@@ -52,7 +52,8 @@ class PostForm(ModelForm, BaseFormRenderer):
                     'viewportMargin': float('inf'),
                 },
                 additional_modes=['markdown', 'python', 'javascript'],
-                js_var_format='editor_%s'
+                js_var_format='editor_%s',
+                preview='collective_blog.Post.content',
             ),
             'blog': LightSelect(),
             'author': HiddenInput(),
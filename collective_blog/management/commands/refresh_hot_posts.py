@@ -0,0 +1,85 @@
+"""Recompute hot scores and window ratings of posts
+
+Hot scores and window ratings are updated when posts are voted
+(see `PostVote.vote_for`) and when buffered ratings are flushed
+(see `flush_hot`). Window ratings of posts that left a window are
+reset by this command (see `window_rating`), so it should be run
+periodically, more often than every `--hours`. It also picks up scores
+that were missed, e.g. if a flush failed. By default, only posts
+created or voted during the last `--hours`, and posts that left
+a window during this time, are checked; run it with `--all`
+after ratings are repaired by `reconcile_votes`.
+
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from collective_blog.models import Post, PostVoteBucket
+from collective_blog.models.post import RATING_WINDOWS
+
+
+class Command(BaseCommand):
+    help = ('Recomputes hot scores and window ratings of posts whose '
+            'rating or window has changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts checked and updated '
+                                 'by a single query.')
+        parser.add_argument('--hours', type=int, default=2,
+                            help='Check posts created or voted during '
+                                 'this number of hours.')
+        parser.add_argument('--all', action='store_true', default=False,
+                            help='Check all posts.')
+
+    def handle(self, *args, **options):
+        self.run(options['batch_size'], options['verbosity'],
+                 None if options['all'] else options['hours'])
+
+    def run(self, batch_size=1000, verbosity=1, hours=2):
+        """Check recent posts
+
+        :param hours: Only check posts created, voted, or moved out
+          of a window during this number of hours. If None, all posts
+          are checked.
+        :return: A dict with numbers of `checked` and `updated` posts.
+
+        """
+        stats = dict(checked=0, updated=0)
+
+        posts = Post.objects.order_by('pk')
+        if hours is not None:
+            now = timezone.now()
+            since = now - timedelta(hours=hours)
+            voted = (PostVoteBucket.objects
+                     .filter(hour__gte=PostVoteBucket.get_hour(since))
+                     .values('object'))
+            recent = Q(created__gt=since) | Q(pk__in=voted)
+            for name, window in RATING_WINDOWS:
+                recent |= Q(created__gt=since - window,
+                            created__lte=now - window)
+            posts = posts.filter(recent)
+
+        last_pk = None
+        while True:
+            batch = posts
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+
+            stats['checked'] += len(pks)
+            stats['updated'] += Post.update_scores(
+                Post.objects.filter(pk__in=pks))
+
+        if verbosity >= 1:
+            self.stdout.write('%d posts checked, %d updated' % (
+                stats['checked'], stats['updated']))
+
+        return stats
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 08:44
+from __future__ import unicode_literals
+
+import collective_blog.models.post
+from django.db import migrations, models
+import s_markdown.bulk
+import s_markdown.datatype
+import s_markdown.extensions.autolink
+import s_markdown.extensions.automail
+import s_markdown.extensions.cut
+import s_markdown.extensions.escape
+import s_markdown.extensions.fenced_code
+import s_markdown.extensions.semi_sane_lists
+import s_markdown.extensions.strikethrough
+import s_markdown.models
+import s_markdown.renderer
+
+
+def fill_excerpts(apps, schema_editor):
+    """Compute excerpts from the stored html cache
+
+    Stale cache rows get correct excerpts on the next save
+    or after running the `rerender_markdown` command.
+
+    """
+    Post = apps.get_model('collective_blog', 'Post')
+    field = Post._meta.get_field('_content_html')
+    split = s_markdown.models.HtmlCacheDescriptor.split
+    for batch in s_markdown.bulk.iter_batches(field, 500, with_html=True,
+                                              with_source=False):
+        rows = []
+        for pk, html in batch:
+            if not html:
+                continue
+            _, html = split(html)
+            rows.append((pk, dict(
+                _content_excerpt=collective_blog.models.post.html_before_cut(html),
+                _content_cut_caption=collective_blog.models.post.html_cut_caption(html))))
+        s_markdown.bulk.update_cache(field, rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collective_blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='_content_cut_caption',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='_content_excerpt',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='_content_html',
+            field=s_markdown.models.HtmlCacheField(blank=True, default='', derived={'_content_cut_caption': collective_blog.models.post.html_cut_caption, '_content_excerpt': collective_blog.models.post.html_before_cut}, editable=False, markdown_field=s_markdown.models.MarkdownField(cls_name='content_cls', default=s_markdown.datatype.Markdown(html='', renderer=s_markdown.renderer.BaseRenderer(extensions=['markdown.extensions.smarty', 'markdown.extensions.abbr', 'markdown.extensions.def_list', 'markdown.extensions.tables', 'markdown.extensions.smart_strong', s_markdown.extensions.fenced_code.FencedCodeExtension(), s_markdown.extensions.escape.EscapeHtmlExtension(), s_markdown.extensions.semi_sane_lists.SemiSaneListExtension(), s_markdown.extensions.strikethrough.StrikethroughExtension(), s_markdown.extensions.autolink.AutolinkExtension(), s_markdown.extensions.automail.AutomailExtension(), s_markdown.extensions.cut.CutExtension(anchor='cut')]), source=''), markdown=s_markdown.datatype.Markdown, renderer=s_markdown.renderer.BaseRenderer(extensions=['markdown.extensions.smarty', 'markdown.extensions.abbr', 'markdown.extensions.def_list', 'markdown.extensions.tables', 'markdown.extensions.smart_strong', s_markdown.extensions.fenced_code.FencedCodeExtension(), s_markdown.extensions.escape.EscapeHtmlExtension(), s_markdown.extensions.semi_sane_lists.SemiSaneListExtension(), s_markdown.extensions.strikethrough.StrikethroughExtension(), s_markdown.extensions.autolink.AutolinkExtension(), s_markdown.extensions.automail.AutomailExtension(), s_markdown.extensions.cut.CutExtension(anchor='cut')]), renderer_name='content_renderer', verbose_name='Content'), null=True),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+import collective_blog.models.blog
+import collective_blog.models.comment
+import collective_blog.models.post
+from django.db import migrations
+import s_voting.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collective_blog', '0004_compress_html_cache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='membership',
+            name='overall_comments_rating',
+            field=s_voting.models.VoteCacheField(default=0, group_by={'blog': 'object__post__blog', 'user': 'object__author'}, query=collective_blog.models.blog._overall_comments_rating_cache_query, vote_model=collective_blog.models.comment.CommentVote),
+        ),
+        migrations.AlterField(
+            model_name='membership',
+            name='overall_posts_rating',
+            field=s_voting.models.VoteCacheField(default=0, group_by={'blog': 'object__blog', 'user': 'object__author'}, query=collective_blog.models.blog._overall_posts_rating_cache_query, vote_model=collective_blog.models.post.PostVote),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 09:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collective_blog', '0005_membership_rating_group_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostVoteBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('score', models.IntegerField(default=0)),
+                ('object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_buckets', to='collective_blog.Post')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='postvotebucket',
+            unique_together=set([('object', 'hour')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='postvotebucket',
+            index_together=set([('hour', 'object', 'score')]),
+        ),
+    ]
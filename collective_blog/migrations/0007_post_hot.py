@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 09:15
+from __future__ import unicode_literals
+
+import collective_blog.models.post
+from django.db import migrations, models
+
+
+def fill_hot(apps, schema_editor):
+    """Compute hot scores of existing posts"""
+    Post = apps.get_model('collective_blog', 'Post')
+    hot_score = collective_blog.models.post.hot_score
+    posts = Post.objects.order_by('pk').values_list('pk', 'rating', 'created')
+
+    last_pk = None
+    while True:
+        batch = posts
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:500])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+
+        Post.objects.filter(pk__in=[row[0] for row in batch]).update(
+            hot=models.Case(
+                *[models.When(pk=pk, then=models.Value(
+                    hot_score(rating, created)))
+                  for pk, rating, created in batch],
+                output_field=models.FloatField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collective_blog', '0006_post_vote_bucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(fill_hot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 09:29
+from __future__ import unicode_literals
+
+import collective_blog.models.post
+from django.db import migrations, models
+import s_markdown.bulk
+import s_markdown.datatype
+import s_markdown.extensions.autolink
+import s_markdown.extensions.automail
+import s_markdown.extensions.comment
+import s_markdown.extensions.cut
+import s_markdown.extensions.escape
+import s_markdown.extensions.fenced_code
+import s_markdown.extensions.semi_sane_lists
+import s_markdown.extensions.strikethrough
+import s_markdown.models
+import s_markdown.renderer
+import s_markdown.text
+
+
+def fill_hashes(apps, schema_editor):
+    """Copy hashes of the stored html into the hash columns"""
+    for model_name in ['Post', 'Comment']:
+        model = apps.get_model('collective_blog', model_name)
+        field = model._meta.get_field('_content_html')
+        split = s_markdown.models.HtmlCacheDescriptor.split
+        for batch in s_markdown.bulk.iter_batches(field, 500, with_html=True,
+                                                  with_source=False):
+            s_markdown.bulk.update_cache(field, [
+                (pk, dict(_content_hash=split(html)[0]))
+                for pk, html in batch if html])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collective_blog', '0008_post_word_count_from_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='_content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=80, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='_content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=80, null=True),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='_content_html',
+            field=s_markdown.models.HtmlCacheField(blank=True, compress=True, default='', editable=False, hash_field='_content_hash', markdown_field=s_markdown.models.MarkdownField(cls_name='content_cls', default=s_markdown.datatype.Markdown(html='', renderer=s_markdown.renderer.BaseRenderer(extensions=['markdown.extensions.smarty', 'markdown.extensions.abbr', 'markdown.extensions.def_list', 'markdown.extensions.tables', 'markdown.extensions.smart_strong', s_markdown.extensions.fenced_code.FencedCodeExtension(), s_markdown.extensions.escape.EscapeHtmlExtension(), s_markdown.extensions.semi_sane_lists.SemiSaneListExtension(), s_markdown.extensions.strikethrough.StrikethroughExtension(), s_markdown.extensions.autolink.AutolinkExtension(), s_markdown.extensions.automail.AutomailExtension(), s_markdown.extensions.comment.CommentExtension()]), source=''), markdown=s_markdown.datatype.Markdown, renderer=s_markdown.renderer.BaseRenderer(extensions=['markdown.extensions.smarty', 'markdown.extensions.abbr', 'markdown.extensions.def_list', 'markdown.extensions.tables', 'markdown.extensions.smart_strong', s_markdown.extensions.fenced_code.FencedCodeExtension(), s_markdown.extensions.escape.EscapeHtmlExtension(), s_markdown.extensions.semi_sane_lists.SemiSaneListExtension(), s_markdown.extensions.strikethrough.StrikethroughExtension(), s_markdown.extensions.autolink.AutolinkExtension(), s_markdown.extensions.automail.AutomailExtension(), s_markdown.extensions.comment.CommentExtension()]), renderer_name='content_renderer', verbose_name='Comment'), null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='_content_html',
+            field=s_markdown.models.HtmlCacheField(blank=True, compress=True, default='', derived={'_content_cut_caption': collective_blog.models.post.html_cut_caption, '_content_excerpt': collective_blog.models.post.html_before_cut, '_content_text': s_markdown.text.plain_text, '_content_word_count': ('_content_text', s_markdown.text.word_count)}, editable=False, hash_field='_content_hash', markdown_field=s_markdown.models.MarkdownField(cls_name='content_cls', default=s_markdown.datatype.Markdown(html='', renderer=s_markdown.renderer.BaseRenderer(extensions=['markdown.extensions.smarty', 'markdown.extensions.abbr', 'markdown.extensions.def_list', 'markdown.extensions.tables', 'markdown.extensions.smart_strong', s_markdown.extensions.fenced_code.FencedCodeExtension(), s_markdown.extensions.escape.EscapeHtmlExtension(), s_markdown.extensions.semi_sane_lists.SemiSaneListExtension(), s_markdown.extensions.strikethrough.StrikethroughExtension(), s_markdown.extensions.autolink.AutolinkExtension(), s_markdown.extensions.automail.AutomailExtension(), s_markdown.extensions.cut.CutExtension(anchor='cut')]), source=''), markdown=s_markdown.datatype.Markdown, renderer=s_markdown.renderer.BaseRenderer(extensions=['markdown.extensions.smarty', 'markdown.extensions.abbr', 'markdown.extensions.def_list', 'markdown.extensions.tables', 'markdown.extensions.smart_strong', s_markdown.extensions.fenced_code.FencedCodeExtension(), s_markdown.extensions.escape.EscapeHtmlExtension(), s_markdown.extensions.semi_sane_lists.SemiSaneListExtension(), s_markdown.extensions.strikethrough.StrikethroughExtension(), s_markdown.extensions.autolink.AutolinkExtension(), s_markdown.extensions.automail.AutomailExtension(), s_markdown.extensions.cut.CutExtension(anchor='cut')]), renderer_name='content_renderer', verbose_name='Content'), null=True),
+        ),
+        migrations.RunPython(fill_hashes, migrations.RunPython.noop),
+    ]
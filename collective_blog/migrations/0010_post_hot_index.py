@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 09:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collective_blog', '0009_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='hot',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('hot', 'id')]),
+        ),
+    ]
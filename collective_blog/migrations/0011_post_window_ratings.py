@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 09:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils import timezone
+
+import datetime
+
+
+def fill_window_ratings(apps, schema_editor):
+    """Copy ratings of recent posts to their window ratings
+
+    See `collective_blog.models.post.window_rating`.
+
+    """
+    Post = apps.get_model('collective_blog', 'Post')
+    now = timezone.now()
+    for name, days in [('day_rating', 1), ('month_rating', 30)]:
+        Post.objects.filter(
+            created__gt=now - datetime.timedelta(days=days)).update(
+            **{name: models.F('rating')})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collective_blog', '0010_post_hot_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='day_rating',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='month_rating',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('hot', 'id'), ('day_rating', 'id'), ('month_rating', 'id')]),
+        ),
+        migrations.RunPython(fill_window_ratings, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
 from .blog import Blog, Membership
-from .post import Post, PostVote
+from .post import Post, PostVote, PostVoteBucket
 from .comment import Comment, CommentVote
 from .tag import Tag, TaggedItem
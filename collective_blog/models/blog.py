@@ -8,14 +8,7 @@ from collective_blog.utils.errors import PermissionCheckFailed
 
 from s_markdown.models import MarkdownField, HtmlCacheField
 from s_markdown.datatype import Markdown
-from s_markdown.renderer import BaseRenderer
-from s_markdown.extensions import (FencedCodeExtension,
-                                   EscapeHtmlExtension,
-                                   SemiSaneListExtension,
-                                   StrikethroughExtension,
-                                   AutomailExtension,
-                                   AutolinkExtension,
-                                   CommentExtension)
+from s_markdown.registry import get_renderer
 from s_appearance.utils.icons import ICONS
 from s_voting.models import VoteCacheField
 
@@ -38,22 +31,7 @@ class Blog(models.Model):
 
     about = MarkdownField(blank=True,
                           markdown=Markdown,
-                          renderer=BaseRenderer(
-                              extensions=[
-                                  'markdown.extensions.smarty',
-                                  'markdown.extensions.abbr',
-                                  'markdown.extensions.def_list',
-                                  'markdown.extensions.tables',
-                                  'markdown.extensions.smart_strong',
-                                  FencedCodeExtension(),
-                                  EscapeHtmlExtension(),
-                                  SemiSaneListExtension(),
-                                  StrikethroughExtension(),
-                                  AutolinkExtension(),
-                                  AutomailExtension(),
-                                  CommentExtension(),
-                              ]
-                          ),
+                          renderer=get_renderer('bio'),
                           verbose_name=_('About this blog'))
 
     _about_html = HtmlCacheField(about)
@@ -460,8 +438,12 @@ class Membership(models.Model):
     can_manage_permissions_flag = models.BooleanField(
         default=False, verbose_name=_("Can manage permissions"))
 
-    overall_posts_rating = VoteCacheField(PostVote, _overall_posts_rating_cache_query)
-    overall_comments_rating = VoteCacheField(CommentVote, _overall_comments_rating_cache_query)
+    overall_posts_rating = VoteCacheField(
+        PostVote, _overall_posts_rating_cache_query,
+        group_by={'user': 'object__author', 'blog': 'object__blog'})
+    overall_comments_rating = VoteCacheField(
+        CommentVote, _overall_comments_rating_cache_query,
+        group_by={'user': 'object__author', 'blog': 'object__post__blog'})
 
     # Common methods
     # --------------
@@ -8,14 +8,7 @@ from collective_blog.settings import settings
 from collective_blog.utils.errors import PermissionCheckFailed
 from s_markdown.models import MarkdownField, HtmlCacheField
 from s_markdown.datatype import Markdown
-from s_markdown.renderer import BaseRenderer
-from s_markdown.extensions import (FencedCodeExtension,
-                                   EscapeHtmlExtension,
-                                   SemiSaneListExtension,
-                                   StrikethroughExtension,
-                                   AutomailExtension,
-                                   AutolinkExtension,
-                                   CommentExtension)
+from s_markdown.registry import get_renderer
 from s_voting.models import AbstractVote, VoteCacheField
 
 
@@ -52,25 +45,14 @@ class Comment(MPTTModel):
                              db_index=True)
 
     content = MarkdownField(markdown=Markdown,
-                            renderer=BaseRenderer(
-                                extensions=[
-                                    'markdown.extensions.smarty',
-                                    'markdown.extensions.abbr',
-                                    'markdown.extensions.def_list',
-                                    'markdown.extensions.tables',
-                                    'markdown.extensions.smart_strong',
-                                    FencedCodeExtension(),
-                                    EscapeHtmlExtension(),
-                                    SemiSaneListExtension(),
-                                    StrikethroughExtension(),
-                                    AutolinkExtension(),
-                                    AutomailExtension(),
-                                    CommentExtension(),
-                                ]
-                            ),
+                            renderer=get_renderer('comment'),
                             verbose_name=_('Comment'))
 
-    _content_html = HtmlCacheField(content)
+    _content_html = HtmlCacheField(content, compress=True,
+                                   hash_field='_content_hash')
+
+    _content_hash = models.CharField(max_length=80, blank=True, null=True,
+                                     editable=False)
 
     created = models.DateTimeField(blank=True, editable=False,
                                    auto_now_add=True)
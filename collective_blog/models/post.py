@@ -1,7 +1,8 @@
 """Post and its rating"""
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, When, Value, F
 from django.utils.translation import ugettext_lazy as _, ugettext as __
 from django.utils import timezone
 
@@ -10,30 +11,105 @@ from collective_blog.utils.errors import PermissionCheckFailed
 
 from s_markdown.models import MarkdownField, HtmlCacheField
 from s_markdown.datatype import Markdown
-from s_markdown.renderer import BaseRenderer
-from s_markdown.extensions import (FencedCodeExtension,
-                                   EscapeHtmlExtension,
-                                   SemiSaneListExtension,
-                                   StrikethroughExtension,
-                                   AutomailExtension,
-                                   AutolinkExtension,
-                                   CutExtension)
+from s_markdown.registry import get_renderer
+from s_markdown.text import plain_text, word_count
 
 from taggit.managers import TaggableManager
 
 from uuslug import uuslug
 
-from s_voting.models import AbstractVote, VoteCacheField
+from s_voting.models import AbstractVote, AbstractVoteBucket, VoteCacheField
+from s_voting.buffer import is_buffered
+from s_voting.signals import deltas_flushed
 
+import datetime
+import math
 import re
 
 from .tag import TaggedItem
 
 
+cut_pattern = re.compile(r'<!-- cut here '
+                         r'(\{\{(?P<caption>.+?)\}\} )?'
+                         r'-->')
+
+
+def html_before_cut(html):
+    """Returns html before cut (or the whole html if there is no cut)"""
+    m = cut_pattern.search(html)
+
+    if m is None:
+        return html
+    else:
+        return html[:m.start()]
+
+
+def html_cut_caption(html):
+    """Returns cut caption or an empty string if it is not specified"""
+    m = cut_pattern.search(html)
+
+    if m is None or m.group('caption') is None:
+        return ''
+    else:
+        return m.group('caption')
+
+
+# The hot score is the order of magnitude of the rating plus the age,
+# so a post needs ten times more votes to stay above a post published
+# `HOT_GRAVITY` seconds later. It does not depend on the current time,
+# so it only changes when the rating changes.
+HOT_EPOCH = datetime.datetime(2016, 1, 1, tzinfo=timezone.utc)
+HOT_GRAVITY = 45000
+
+
+def hot_score(rating, created):
+    """Hot score of a post with the given rating and publication time"""
+    if created is None:
+        return 0
+    order = math.log10(max(abs(rating), 1))
+    sign = (rating > 0) - (rating < 0)
+    seconds = (created - HOT_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_GRAVITY, 7)
+
+
+# Windows of the best posts feeds by the fields of their ratings
+RATING_WINDOWS = (
+    ('day_rating', datetime.timedelta(days=1)),
+    ('month_rating', datetime.timedelta(days=30)),
+)
+
+
+def window_rating(rating, created, window, now=None):
+    """Rating of a post for the best feed of the given window
+
+    The feed lists posts created during the window, so all votes
+    of these posts were received during the window. Older posts
+    get zero, so they sink to the bottom of the window rating index.
+
+    """
+    if now is None:
+        now = timezone.now()
+    if created is None or created <= now - window:
+        return 0
+    return rating
+
+
+class PostVoteBucket(AbstractVoteBucket):
+    """Votes for a post received during an hour
+
+    Used to find recently voted posts (see `refresh_hot_posts`).
+
+    """
+    object = models.ForeignKey('Post', on_delete=models.CASCADE,
+                               related_name='vote_buckets')
+
+
 class PostVote(AbstractVote):
     object = models.ForeignKey('Post', on_delete=models.CASCADE,
                                related_name='votes')
 
+    bucket_model = PostVoteBucket
+
     @classmethod
     def vote_for(cls, user, obj, vote):
         if user.pk == obj.author.pk:
@@ -45,7 +121,11 @@ class PostVote(AbstractVote):
             membership = None
 
         if obj.can_be_voted_by(user, membership):
-            super(PostVote, cls).vote_for(user, obj, vote)
+            with transaction.atomic():
+                super(PostVote, cls).vote_for(user, obj, vote)
+                # A buffered rating is refreshed on flush (see `flush_hot`)
+                if not is_buffered(Post, 'rating'):
+                    Post.update_scores(Post.objects.filter(pk=obj.pk))
         else:
             raise PermissionCheckFailed(__("You can't vote for this post"))
 
@@ -69,25 +149,35 @@ class Post(models.Model):
 
     content = MarkdownField(blank=False,
                             markdown=Markdown,
-                            renderer=BaseRenderer(
-                                extensions=[
-                                    'markdown.extensions.smarty',
-                                    'markdown.extensions.abbr',
-                                    'markdown.extensions.def_list',
-                                    'markdown.extensions.tables',
-                                    'markdown.extensions.smart_strong',
-                                    FencedCodeExtension(),
-                                    EscapeHtmlExtension(),
-                                    SemiSaneListExtension(),
-                                    StrikethroughExtension(),
-                                    AutolinkExtension(),
-                                    AutomailExtension(),
-                                    CutExtension(anchor='cut'),
-                                ]
-                            ),
+                            renderer=get_renderer('post'),
                             verbose_name=_('Content'))
 
-    _content_html = HtmlCacheField(content)
+    # Html of code-heavy posts is several times larger than the source
+    _content_html = HtmlCacheField(content, compress=True, derived={
+        '_content_excerpt': html_before_cut,
+        '_content_cut_caption': html_cut_caption,
+        '_content_text': plain_text,
+        '_content_word_count': ('_content_text', word_count),
+    }, hash_field='_content_hash')
+
+    # Compressed html can't be matched by prefix, so its hash is copied
+    # here for the bulk operations (see `HtmlCacheField.unchanged`).
+    _content_hash = models.CharField(max_length=80, blank=True, null=True,
+                                     editable=False)
+
+    # Feeds only display the part of the post before cut,
+    # so we store it separately to avoid loading the whole html.
+    _content_excerpt = models.TextField(blank=True, null=True,
+                                        editable=False)
+
+    _content_cut_caption = models.TextField(blank=True, null=True,
+                                            editable=False)
+
+    # Plain text for search, snippets, etc.
+    _content_text = models.TextField(blank=True, null=True, editable=False)
+
+    _content_word_count = models.PositiveIntegerField(null=True,
+                                                      editable=False)
 
     created = models.DateTimeField(blank=True, null=True, editable=False)
 
@@ -100,6 +190,13 @@ class Post(models.Model):
 
     rating = VoteCacheField(PostVote)
 
+    # See `hot_score`
+    hot = models.FloatField(default=0, editable=False)
+
+    # See `window_rating`
+    day_rating = models.IntegerField(default=0, editable=False)
+    month_rating = models.IntegerField(default=0, editable=False)
+
     tags = TaggableManager(verbose_name=_('Tags'),
                            help_text=_('A comma-separated list of tags'),
                            through=TaggedItem)
@@ -139,20 +236,54 @@ class Post(models.Model):
 
         self.slug = self.slug.lower()
 
+        self.hot = hot_score(self.rating, self.created)
+        for name, window in RATING_WINDOWS:
+            setattr(self, name, window_rating(self.rating, self.created,
+                                              window))
+
         super(Post, self).save(force_insert, force_update, using, update_fields)
 
-    cut_pattern = re.compile(r'<!-- cut here '
-                             r'(\{\{(?P<caption>.+?)\}\} )?'
-                             r'-->')
+    @classmethod
+    def update_scores(cls, queryset):
+        """Recompute hot scores and window ratings of the given posts
+
+        Only posts whose scores changed are written, with a single query.
+
+        :param queryset: A queryset of posts.
+        :return: Number of updated posts.
+
+        """
+        names = ['hot'] + [name for name, window in RATING_WINDOWS]
+        now = timezone.now()
+
+        scores = {}
+        for row in queryset.values_list('pk', 'rating', 'created', *names):
+            pk, rating, created = row[:3]
+            values = (hot_score(rating, created), ) + tuple(
+                window_rating(rating, created, window, now)
+                for name, window in RATING_WINDOWS)
+            if values != tuple(row[3:]):
+                scores[pk] = values
+
+        if not scores:
+            return 0
+
+        return cls.objects.filter(pk__in=list(scores)).update(**dict(
+            (name, Case(
+                *[When(pk=pk, then=Value(values[i]))
+                  for pk, values in sorted(scores.items())],
+                default=F(name),
+                output_field=cls._meta.get_field(name)))
+            for i, name in enumerate(names)))
+
+    cut_pattern = cut_pattern
 
     def content_before_cut(self):
         """Returns html before cut"""
-        m = self.cut_pattern.search(self.content.html_force)
-
-        if m is None:
-            return self.content.html_force
+        if self._content_excerpt is not None:
+            return self._content_excerpt
         else:
-            return self.content.html_force[:m.start()]
+            return html_before_cut(self.content.html_force)
 
     def cut_caption(self):
         """Returns cut caption, if specified, or the default one.
@@ -163,13 +294,12 @@ class Post(models.Model):
         The markdown engine should sanitize it.
 
         """
-        m = self.cut_pattern.search(self.content.html_force)
-
-        if (m is None or 'caption' not in m.groupdict() or
-                m.groupdict()['caption'] is None):
-            return _('Read more ->')
+        if self._content_excerpt is not None:
+            caption = self._content_cut_caption
         else:
-            return m.groupdict()['caption']
+            caption = html_cut_caption(self.content.html_force)
+
+        return caption or _('Read more ->')
 
     def can_be_seen_by_user(self, user, membership):
         """Check if this post can be seen by the user passed"""
@@ -195,6 +325,21 @@ class Post(models.Model):
         verbose_name = _("Post")
         verbose_name_plural = _("Posts")
         ordering = ("-created",)
+        # Pages of the hot and best feeds (see `HotFeedView`
+        # and `GenericBestFeedView`)
+        index_together = (("hot", "id"),
+                          ("day_rating", "id"),
+                          ("month_rating", "id"))
 
     def __str__(self):
         return str(self.heading)
+
+
+def flush_hot(sender, field_name, pks, **kwargs):
+    """Refresh hot scores and window ratings when buffered ratings
+    are flushed"""
+    if field_name == 'rating':
+        Post.update_scores(Post.objects.filter(pk__in=pks))
+
+
+deltas_flushed.connect(flush_hot, sender=Post)
@@ -0,0 +1,179 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+import datetime
+
+from .models import (Blog, Membership, Post, PostVote, PostVoteBucket,
+                     Comment, CommentVote)
+from .models.post import hot_score
+from .management.commands.refresh_hot_posts import (
+    Command as RefreshHotCommand)
+
+
+def create_post(author, name='Votes'):
+    blog = Blog.objects.create(name=name, type='O')
+    Membership.objects.create(blog=blog, user=author)
+    return Post.objects.create(author=author, blog=blog, heading=name,
+                               content='Text', is_draft=False)
+
+
+class BestFeedTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username='voter%d' % i)
+                       for i in range(3)]
+
+    def test_day_best_feed(self):
+        day_ago = timezone.now() - datetime.timedelta(days=1, hours=2)
+
+        # A popular post voted yesterday
+        old = create_post(self.author, name='Old')
+        for voter in self.voters:
+            PostVote.vote_for(voter, old, 1)
+        PostVoteBucket.objects.update(hour=PostVoteBucket.get_hour(day_ago))
+        Post.objects.filter(pk=old.pk).update(created=day_ago)
+
+        # A new post that trends now
+        trending = create_post(self.author, name='Trending')
+        PostVote.vote_for(self.voters[0], trending, 1)
+
+        # An old post voted now is not the best of the day
+        voted = create_post(self.author, name='Voted')
+        Post.objects.filter(pk=voted.pk).update(created=day_ago)
+        PostVote.vote_for(self.voters[1], voted, 1)
+
+        # A new post that was not voted
+        new = create_post(self.author, name='New')
+
+        response = self.client.get(reverse('feed_day_best'))
+        self.assertEqual([p.pk for p in response.context['object_list']],
+                         [trending.pk, new.pk])
+        self.assertEqual(response.context['object_list'][0].day_rating, 1)
+
+        response = self.client.get(reverse('feed_month_best'))
+        self.assertEqual([p.pk for p in response.context['object_list']],
+                         [old.pk, voted.pk, trending.pk, new.pk])
+        self.assertEqual(Post.objects.get(pk=voted.pk).day_rating, 0)
+
+
+class HotTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username='voter%d' % i)
+                       for i in range(3)]
+
+    def test_hot_score(self):
+        now = timezone.now()
+        later = now + datetime.timedelta(hours=12.5)
+        self.assertAlmostEqual(hot_score(10, now), hot_score(1, later))
+        self.assertGreater(hot_score(2, now), hot_score(0, now))
+        self.assertGreater(hot_score(0, now), hot_score(-2, now))
+        self.assertEqual(hot_score(10, None), 0)
+
+    def test_hot_feed(self):
+        popular = create_post(self.author, name='Popular')
+        new = create_post(self.author, name='New')
+        Post.objects.filter(pk=popular.pk).update(
+            created=timezone.now() - datetime.timedelta(hours=2))
+
+        response = self.client.get(reverse('feed_hot'))
+        self.assertEqual([p.pk for p in response.context['object_list']],
+                         [new.pk, popular.pk])
+
+        for voter in self.voters:
+            PostVote.vote_for(voter, popular, 1)
+
+        popular = Post.objects.get(pk=popular.pk)
+        self.assertEqual(popular.hot, hot_score(3, popular.created))
+
+        response = self.client.get(reverse('feed_hot'))
+        self.assertEqual([p.pk for p in response.context['object_list']],
+                         [popular.pk, new.pk])
+
+    def test_hot_feed_pages(self):
+        posts = [create_post(self.author, name='Post %d' % i)
+                 for i in range(12)]
+        Post.objects.filter(pk=posts[5].pk).update(hot=posts[6].hot)
+        expected = list(Post.objects.order_by('-hot', '-pk')
+                        .values_list('pk', flat=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('feed_hot'))
+        table = 'FROM %s' % connection.ops.quote_name(Post._meta.db_table)
+        post_queries = [q['sql'] for q in queries.captured_queries
+                        if table in q['sql']]
+        self.assertEqual(len(post_queries), 1)
+        self.assertNotIn('DISTINCT', post_queries[0])
+        self.assertEqual([p.pk for p in response.context['object_list']],
+                         expected[:10])
+
+        response = self.client.get(response.context['next_url'])
+        self.assertEqual([p.pk for p in response.context['object_list']],
+                         expected[10:])
+        self.assertNotIn('next_url', response.context)
+
+        response = self.client.get(reverse('feed_hot') + '?before=x')
+        self.assertEqual(response.status_code, 404)
+
+    def test_refresh_command(self):
+        post = create_post(self.author)
+        left = create_post(self.author, name='Left')
+        old = create_post(self.author, name='Old')
+        now = timezone.now()
+        Post.objects.filter(pk=left.pk).update(
+            created=now - datetime.timedelta(days=1, minutes=1))
+        Post.objects.filter(pk=old.pk).update(
+            created=now - datetime.timedelta(days=3))
+        Post.objects.update(rating=100, day_rating=100, month_rating=100)
+
+        stats = RefreshHotCommand().run(batch_size=1, verbosity=0)
+        self.assertEqual(stats, dict(checked=2, updated=2))
+        post = Post.objects.get(pk=post.pk)
+        self.assertEqual(post.hot, hot_score(100, post.created))
+        self.assertEqual(post.day_rating, 100)
+
+        # Left the day window
+        left = Post.objects.get(pk=left.pk)
+        self.assertEqual((left.day_rating, left.month_rating), (0, 100))
+
+        stats = RefreshHotCommand().run(batch_size=1, verbosity=0,
+                                        hours=None)
+        self.assertEqual(stats, dict(checked=3, updated=1))
+
+
+class PostViewTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voter = User.objects.create_user('voter', password='123')
+        self.post = create_post(self.author)
+
+        # A tree of 200 comments, every fourth one is voted
+        parents = [None]
+        for i in range(200):
+            comment = Comment.objects.create(author=self.author,
+                                             post=self.post,
+                                             parent=parents[i // 4],
+                                             content='Comment %d' % i)
+            parents.append(comment)
+            if i % 4 == 0:
+                CommentVote.objects.create(user=self.voter, object=comment,
+                                           vote=1 if i % 8 else -1)
+
+    def test_post_view(self):
+        self.client.login(username='voter', password='123')
+        url = reverse('view_post', kwargs=dict(post_slug=self.post.slug))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        vote_queries = [q for q in queries.captured_queries
+                        if 'collective_blog_commentvote' in q['sql']]
+        self.assertEqual(len(vote_queries), 1)
+
+        self.assertEqual(response.content.count(b'&quot;state&quot;: 1'), 25)
+        self.assertEqual(response.content.count(b'&quot;state&quot;: -1'), 25)
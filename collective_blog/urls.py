@@ -14,6 +14,7 @@ urlpatterns = [
     url(r'^jsi18n/$', javascript_catalog, js_info_dict, name='javascript-catalog'),
 
     url(r'^u/', include('user.urls')),
+    url(r'^md/', include('s_markdown.urls')),
 
     url(r'^b/v/(?P<blog_slug>[a-zA-Z0-9_-]+)/$',
         BlogView.as_view(), name='view_blog'),
@@ -63,6 +64,8 @@ urlpatterns = [
     url(r'^t/(?P<tag_slug>[^/]+)/(?P<page>[0-9]+)/$', TagFeedView.as_view(), name='feed_tag'),
     url(r'^t/(?P<tag_slug>[^/]+)/$', TagFeedView.as_view(), name='feed_tag'),
 
+    url(r'^feed-hot/$', HotFeedView.as_view(), name='feed_hot'),
+
     url(r'^feed-best/(?P<page>[0-9]+)/$', BestFeedView.as_view(), name='feed_best'),
     url(r'^feed-best/$', BestFeedView.as_view(), name='feed_best'),
 
@@ -1,5 +1,6 @@
 from .feed import (GenericFeedView, FeedView,
                    BestFeedView, DayBestFeedView, MonthBestFeedView,
+                   HotFeedView,
                    PersonalFeedView, MyPostsFeedView, TagFeedView)
 from .post import (PostView, VotePostView,
                    CreatePostView, EditPostView, DeletePostView)
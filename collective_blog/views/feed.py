@@ -3,7 +3,7 @@ from datetime import timedelta
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
 from django.db.models import Q
-from django.http import HttpResponsePermanentRedirect
+from django.http import Http404, HttpResponsePermanentRedirect
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -52,9 +52,11 @@ class GenericFeedView(ListView):
                     is_draft=False))
 
     def _get_queryset(self):
+        # Feeds display pre-cut excerpts only (see `Post.content_before_cut`)
         return (Post.objects
                 .select_related('author', 'blog')
                 .prefetch_related('tags')
+                .defer('content', '_content_html')
                 .distinct())
 
 
@@ -70,29 +72,34 @@ class FeedView(GenericFeedView):
 
 
 class GenericBestFeedView(FeedView):
-    """A view for displaying feed ordered by rating"""
+    """A view for displaying feed ordered by rating
+
+    If `time` is set, only posts created during this time are shown,
+    ordered by a window rating of the same period (see `window_rating`).
+
+    """
     template_name = 'collective_blog/feed.html'
     time = None
+    ordering = ('-rating', )
 
     def get_queryset(self):
-        query = (
-            super(GenericBestFeedView, self).get_queryset()
-            .order_by('-rating')
-        )
+        query = super(GenericBestFeedView, self).get_queryset()
         if self.time is not None:
             query = query.filter(created__gt=timezone.now() - self.time)
-        return query
+        return query.order_by(*self.get_ordering())
 
 
 class DayBestFeedView(GenericBestFeedView):
     template_name = 'collective_blog/feed.html'
     time = timedelta(days=1)
+    ordering = ('-day_rating', '-pk')
     type = 'feed_day_best'
 
 
 class MonthBestFeedView(GenericBestFeedView):
     template_name = 'collective_blog/feed.html'
     time = timedelta(days=30)
+    ordering = ('-month_rating', '-pk')
     type = 'feed_month_best'
 
 
@@ -101,6 +108,69 @@ class BestFeedView(GenericBestFeedView):
     type = 'feed_best'
 
 
+class HotFeedView(FeedView):
+    """A view for displaying feed ordered by hot score (see `hot_score`)
+
+    Pages are selected by the `(hot, pk)` of the last post of the previous
+    page (the `before` parameter), so the `(hot, id)` index is read
+    from the cursor on and posts are neither counted nor skipped.
+
+    """
+    template_name = 'collective_blog/feed.html'
+    type = 'feed_hot'
+    context_object_name = 'post_list'
+    paginate_by = None
+    page_size = 10
+
+    def get_cursor(self):
+        """Returns the `(hot, pk)` tuple from the `before` parameter or None"""
+        before = self.request.GET.get('before')
+        if not before:
+            return None
+        try:
+            hot, pk = before.split('_')
+            return float(hot), int(pk)
+        except ValueError:
+            raise Http404()
+
+    def get_queryset(self):
+        # Visibility is checked with a subquery, so posts are not
+        # duplicated by membership joins and need no DISTINCT
+        query = (Post.objects
+                 .select_related('author', 'blog')
+                 .prefetch_related('tags')
+                 .defer('content', '_content_html')
+                 .filter(is_draft=False))
+
+        if self.request.user.is_anonymous():
+            query = query.filter(blog__type='O')
+        else:
+            blogs = (Membership.objects
+                     .filter(user=self.request.user,
+                             role__in=['O', 'M', 'A'])
+                     .values('blog'))
+            query = query.filter(Q(blog__type='O') | Q(blog__in=blogs))
+
+        cursor = self.get_cursor()
+        if cursor is not None:
+            hot, pk = cursor
+            query = query.filter(Q(hot__lt=hot) | Q(hot=hot, pk__lt=pk))
+
+        return query.order_by('-hot', '-pk')
+
+    def get_context_data(self, **kwargs):
+        posts = list(self.object_list[:self.page_size + 1])
+        kwargs['object_list'] = posts[:self.page_size]
+        context = super(HotFeedView, self).get_context_data(**kwargs)
+
+        if len(posts) > self.page_size:
+            last = posts[self.page_size - 1]
+            context['next_url'] = '%s?before=%r_%d' % (
+                reverse(self.type), last.hot, last.pk)
+
+        return context
+
+
 @method_decorator(login_required, 'dispatch')
 class PersonalFeedView(FeedView):
     """A view for displaying personal feed ordered by time"""
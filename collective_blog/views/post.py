@@ -57,6 +57,10 @@ class PostView(GenericPostView):
             .distinct()
         )
 
+        # Votes for all comments are fetched at once
+        self_votes = CommentVote.objects.all().user_votes(
+            self.request.user, context['comments'])
+
         for comment in context['comments']:
             comment.rating_data = {
                 'model': CommentVote,
@@ -64,7 +68,8 @@ class PostView(GenericPostView):
                 'obj': comment,
                 'disabled': self.request.user.is_anonymous(),
                 'use_colors': True,
-                'color_threshold': [0, 0]
+                'color_threshold': [0, 0],
+                'self_vote': self_votes.get(comment.pk, 0),
             }
 
         context['can_comment'] = self.object.blog and not self.object.is_draft and self.object.blog.check_can_comment(self.request.user)
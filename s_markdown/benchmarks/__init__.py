@@ -0,0 +1,23 @@
+"""Benchmarks for the markdown renderer
+
+Each module can be run with `python -m s_markdown.benchmarks.<name>`.
+
+"""
+
+import os
+
+
+def setup():
+    """Configure django settings unless the project settings are used
+
+    Renderers read settings (the render cache, profiling, etc.).
+    Benchmarks measure bare renderers, so empty settings are enough.
+    Only `s_markdown` is installed, so its models can be imported.
+
+    """
+    import django
+    from django.conf import settings
+
+    if 'DJANGO_SETTINGS_MODULE' not in os.environ and not settings.configured:
+        settings.configure(INSTALLED_APPS=['s_markdown'])
+        django.setup()
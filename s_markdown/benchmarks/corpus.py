@@ -0,0 +1,143 @@
+"""Synthetic markdown corpus
+
+Documents are generated from a seed, so every run of the benchmark
+suite renders exactly the same corpus.
+
+"""
+
+from __future__ import division
+
+import random
+
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua enim '
+         'ad minim veniam quis nostrud exercitation ullamco laboris nisi '
+         'aliquip ex ea commodo consequat duis aute irure in reprehenderit '
+         'voluptate velit esse cillum fugiat nulla pariatur').split()
+
+CODE = '''def function_%(n)d(items):
+    """Process items"""
+    result = []
+    for item in items:
+        if item %% %(n)d == 0:
+            result.append(item * 2)
+    return result
+'''
+
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def sentence(rng):
+    """A sentence with occasional inline markup"""
+    parts = words(rng, rng.randint(5, 15)).split()
+    if rng.random() < 0.3:
+        i = rng.randrange(len(parts))
+        parts[i] = '*%s*' % parts[i]
+    if rng.random() < 0.2:
+        i = rng.randrange(len(parts))
+        parts[i] = '**%s**' % parts[i]
+    if rng.random() < 0.1:
+        i = rng.randrange(len(parts))
+        parts[i] = '`%s`' % parts[i]
+    return ' '.join(parts).capitalize() + '.'
+
+
+def paragraph(rng, sentences=None):
+    if sentences is None:
+        sentences = rng.randint(2, 6)
+    return ' '.join(sentence(rng) for _ in range(sentences))
+
+
+def url(rng):
+    return 'https://%s.example.com/%s/%s?id=%d' % (
+        rng.choice(WORDS), rng.choice(WORDS), rng.choice(WORDS),
+        rng.randint(1, 10000))
+
+
+def short_comment(rng):
+    return paragraph(rng, rng.randint(1, 3))
+
+
+def long_post(rng):
+    parts = []
+    for section in range(rng.randint(4, 8)):
+        parts.append('## %s' % words(rng, 4).capitalize())
+        for _ in range(rng.randint(2, 5)):
+            parts.append(paragraph(rng))
+        if section == 1:
+            parts.append('----cut----')
+    return '\n\n'.join(parts)
+
+
+def code_post(rng):
+    parts = []
+    for _ in range(rng.randint(3, 8)):
+        parts.append(paragraph(rng, 2))
+        parts.append('```python\n%s```' % (CODE % dict(n=rng.randint(1, 1000))))
+    return '\n\n'.join(parts)
+
+
+def table(rng):
+    columns = rng.randint(3, 6)
+    rows = [' | '.join(words(rng, 1) for _ in range(columns))
+            for _ in range(rng.randint(5, 30))]
+    header = ' | '.join(words(rng, 1).capitalize() for _ in range(columns))
+    return '\n'.join([header, ' | '.join(['---'] * columns)] + rows)
+
+
+def tables(rng):
+    parts = []
+    for _ in range(rng.randint(1, 3)):
+        parts.append(paragraph(rng, 2))
+        parts.append(table(rng))
+    return '\n\n'.join(parts)
+
+
+def nested_list(rng, depth=0, max_depth=6):
+    lines = []
+    for _ in range(rng.randint(2, 4)):
+        lines.append('    ' * depth + '* ' + words(rng, rng.randint(2, 6)))
+        if depth < max_depth and rng.random() < 0.6:
+            lines.extend(nested_list(rng, depth + 1, max_depth))
+    return lines
+
+
+def nested_lists(rng):
+    return '\n'.join(nested_list(rng))
+
+
+def urls(rng):
+    parts = []
+    for _ in range(rng.randint(3, 8)):
+        text = words(rng, rng.randint(3, 10)).split()
+        for _ in range(rng.randint(2, 6)):
+            text.insert(rng.randrange(len(text) + 1), url(rng))
+        parts.append(' '.join(text))
+    return '\n\n'.join(parts)
+
+
+# Document generators by category name
+CATEGORIES = [
+    ('short_comments', short_comment),
+    ('long_posts', long_post),
+    ('code_posts', code_post),
+    ('tables', tables),
+    ('nested_lists', nested_lists),
+    ('urls', urls),
+]
+
+
+def generate(size=50, seed=0):
+    """Generate the corpus
+
+    :param size: Number of documents in each category.
+    :param seed: Random seed.
+    :return: A list of `(category, documents)` pairs.
+
+    """
+    rng = random.Random(seed)
+    return [(name, [generator(rng) for _ in range(size)])
+            for name, generator in CATEGORIES]
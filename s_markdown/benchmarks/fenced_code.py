@@ -0,0 +1,61 @@
+"""Render time of documents with many fenced code blocks
+
+Usage: `python -m s_markdown.benchmarks.fenced_code`.
+
+Cold runs render every code block from scratch. Warm runs reuse
+highlighted blocks, so they mostly measure the preprocessing itself.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import timeit
+
+from s_markdown.benchmarks import setup
+from s_markdown.renderer import BaseRenderer
+from s_markdown.extensions import FencedCodeExtension, CutExtension
+from s_markdown.extensions.fenced_code import highlight_cache
+
+
+BLOCK = '''Paragraph number %(n)s with some *emphasis*.
+
+```python
+def function_%(n)s(x):
+    return x * %(n)s
+```
+'''
+
+
+def document(blocks):
+    """A document with the given number of fenced code blocks"""
+    parts = [BLOCK % dict(n=n) for n in range(blocks)]
+    parts.insert(len(parts) // 2, '----cut----\n')
+    return '\n'.join(parts)
+
+
+def measure(renderer, source, cold, repeat):
+    def run():
+        if cold:
+            highlight_cache.clear()
+        renderer.convert(source)
+
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main(sizes=(1, 10, 100, 1000), repeat=3):
+    setup()
+
+    renderer = BaseRenderer(extensions=[FencedCodeExtension(),
+                                        CutExtension(anchor='cut')])
+
+    print('%8s %12s %12s' % ('blocks', 'cold, ms', 'warm, ms'))
+    for size in sizes:
+        source = document(size)
+        cold = measure(renderer, source, True, repeat)
+        warm = measure(renderer, source, False, repeat)
+        print('%8d %12.2f %12.2f' % (size, cold * 1000, warm * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Memory and time of loading a page of comments
+
+Usage: `python -m s_markdown.benchmarks.instances [--rows 5000]`.
+
+Builds model instances the way the ORM does (`Model.from_db`) from rows
+that hold a markdown source and its html cache, like a comment tree
+of a big post. Reports memory allocated by the instances and the time
+to build them, then the same after reading the html of every instance.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import gc
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from s_markdown.benchmarks import setup, corpus
+
+
+def get_model():
+    """A comment-like model
+
+    It's never saved, so it needs no table.
+
+    """
+    from django.apps import apps
+    from django.db import models
+
+    from s_markdown.models import MarkdownField, HtmlCacheField
+    from s_markdown.registry import get_renderer
+
+    try:
+        return apps.get_model('s_markdown', 'BenchmarkComment')
+    except LookupError:
+        pass
+
+    class BenchmarkComment(models.Model):
+        content = MarkdownField(renderer=get_renderer('comment'))
+        _content_html = HtmlCacheField(content)
+
+        class Meta:
+            app_label = 's_markdown'
+            managed = False
+
+    return BenchmarkComment
+
+
+def measure(model, field_names, rows, access, trace=False):
+    """Build instances from rows
+
+    :param access: Read the html of every instance.
+    :param trace: Measure memory instead of time.
+    :return: Allocated KiB or elapsed seconds.
+
+    """
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    start = timeit.default_timer()
+
+    instances = [model.from_db('default', field_names, row) for row in rows]
+    if access:
+        for instance in instances:
+            instance.content.html
+
+    elapsed = timeit.default_timer() - start
+    if trace:
+        try:
+            return tracemalloc.get_traced_memory()[0] / 1024
+        finally:
+            tracemalloc.stop()
+    return elapsed
+
+
+def run(rows=5000, seed=0, repeat=3):
+    """Run the benchmark
+
+    :return: A dict with results for instances that were only loaded
+      (`loaded`) and for instances whose html was read (`accessed`).
+
+    """
+    setup()
+
+    model = get_model()
+    field = model._meta.get_field('_content_html')
+
+    sources = [source for category, documents in corpus.generate(100, seed)
+               if category == 'short_comments' for source in documents]
+    envelopes = dict((source, field.render(source)) for source in sources)
+
+    field_names = ['id', 'content', '_content_html']
+    data = [(i, sources[i % len(sources)], envelopes[sources[i % len(sources)]])
+            for i in range(rows)]
+
+    results = {'rows': rows}
+    for name, access in [('loaded', False), ('accessed', True)]:
+        elapsed = min(measure(model, field_names, data, access)
+                      for _ in range(repeat))
+        memory = (measure(model, field_names, data, access, trace=True)
+                  if tracemalloc is not None else None)
+        results[name] = {'memory_kb': memory, 'ms': elapsed * 1000}
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=5000,
+                        help='Number of model instances.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs; the best time is taken.')
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, repeat=args.repeat)
+
+    print('%-10s %12s %10s' % ('rows: %d' % results['rows'],
+                               'memory, KiB', 'time, ms'))
+    for name in ['loaded', 'accessed']:
+        r = results[name]
+        print('%-10s %12s %10.1f' % (
+            name, '%.1f' % r['memory_kb'] if r['memory_kb'] is not None
+            else '-', r['ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Size and fetch time of plain and compressed html cache columns
+
+Usage: `python -m s_markdown.benchmarks.storage`.
+
+Renders the synthetic corpus (see `corpus`) with the `post` renderer
+and stores the html the way `HtmlCacheField` does: as text or
+as zlib-compressed blobs (`compress=True`). Each variant is stored
+in its own in-memory sqlite database.
+
+For each corpus category, reports the average html size, the size
+of the table (in database pages), and the time to fetch all rows
+and decode them to html strings. Tables are in memory, so the fetch
+time shows the decompression overhead but not the saved I/O.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import sqlite3
+import timeit
+
+from s_markdown.benchmarks import setup, corpus
+
+
+def build(envelopes, compress):
+    """Create an in-memory table with the given html
+
+    :param envelopes: Html strings with the hash prepended.
+    :param compress: Store compressed blobs instead of text.
+    :return: Database connection.
+
+    """
+    from s_markdown.models import compress_html
+
+    db = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE post (id INTEGER PRIMARY KEY, html %s)' %
+               ('BLOB' if compress else 'TEXT'))
+    if compress:
+        rows = [(sqlite3.Binary(compress_html(e)),) for e in envelopes]
+    else:
+        rows = [(e,) for e in envelopes]
+    db.executemany('INSERT INTO post (html) VALUES (?)', rows)
+    db.commit()
+    return db
+
+
+def table_size(db):
+    """Size of the database in bytes"""
+    page_count = db.execute('PRAGMA page_count').fetchone()[0]
+    page_size = db.execute('PRAGMA page_size').fetchone()[0]
+    return page_count * page_size
+
+
+def measure_fetch(db, compress, repeat):
+    """Best time to fetch and decode all rows"""
+    from s_markdown.models import decompress_html
+
+    def run():
+        for value, in db.execute('SELECT html FROM post'):
+            if compress:
+                decompress_html(value)
+
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def run(size=50, seed=0, repeat=5):
+    """Run the benchmark
+
+    :return: A list of dicts, one for each corpus category.
+
+    """
+    setup()
+
+    from s_markdown.models import HtmlCacheDescriptor, compress_html
+    from s_markdown.registry import get_renderer
+
+    renderer = get_renderer('post')
+    results = []
+
+    for category, sources in corpus.generate(size, seed):
+        envelopes = [HtmlCacheDescriptor.hash(source, renderer) +
+                     renderer.convert(source) for source in sources]
+
+        result = {'corpus': category, 'documents': len(envelopes)}
+        for name, compress in [('plain', False), ('compressed', True)]:
+            db = build(envelopes, compress)
+            result[name] = {
+                'table_kb': table_size(db) / 1024,
+                'fetch_ms': measure_fetch(db, compress, repeat) * 1000,
+            }
+            db.close()
+
+        result['html_bytes'] = (sum(len(e.encode('utf-8'))
+                                    for e in envelopes) / len(envelopes))
+        result['compressed_bytes'] = (sum(len(compress_html(e))
+                                          for e in envelopes) / len(envelopes))
+
+        results.append(result)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=50,
+                        help='Number of documents in each category.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Corpus seed.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of fetches; the best time is taken.')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.seed, args.repeat)
+
+    print('%-16s %10s %10s %12s %12s %10s %10s' % (
+        'corpus', 'html, B', 'zlib, B', 'table, KiB', 'zlib, KiB',
+        'fetch, ms', 'zlib, ms'))
+    for r in results:
+        print('%-16s %10.0f %10.0f %12.1f %12.1f %10.3f %10.3f' % (
+            r['corpus'], r['html_bytes'], r['compressed_bytes'],
+            r['plain']['table_kb'], r['compressed']['table_kb'],
+            r['plain']['fetch_ms'], r['compressed']['fetch_ms']))
+
+
+if __name__ == '__main__':
+    main()
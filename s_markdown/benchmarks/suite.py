@@ -0,0 +1,233 @@
+"""Render speed regression suite
+
+Usage:
+
+    python -m s_markdown.benchmarks.suite [--output results.json]
+    python -m s_markdown.benchmarks.suite --compare baseline.json
+
+Renders the synthetic corpus (see `corpus`) with every renderer
+profile from the registry and reports, for each renderer and category,
+throughput (docs/sec), p50 and p99 latency and peak memory allocated
+while rendering the category.
+
+In compare mode, results are checked against a saved baseline.
+The command exits with status 1 if any throughput or p99 latency is
+worse than the baseline by more than the threshold.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import markdown
+
+from s_markdown.benchmarks import setup, corpus
+from s_markdown.extensions.fenced_code import highlight_cache
+from s_markdown.registry import profiles, get_renderer
+
+
+FORMAT_VERSION = 1
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    values = sorted(values)
+    rank = max(int(round(p / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def renderers():
+    """Distinct renderers of registry profiles
+
+    :return: A list of `(name, renderer)` pairs. Profiles that share
+      a renderer are listed under one name, e.g. `bio,comment`.
+
+    """
+    names = {}
+    for name in sorted(profiles):
+        names.setdefault(get_renderer(name), []).append(name)
+
+    return sorted((','.join(names), renderer)
+                  for renderer, names in names.items())
+
+
+def measure_time(renderer, documents, repeat):
+    """Render each document and return the best latency of each"""
+    latencies = [float('inf')] * len(documents)
+
+    for _ in range(repeat):
+        # Measure cold renders: user content is rarely seen twice
+        highlight_cache.clear()
+        for i, document in enumerate(documents):
+            start = timeit.default_timer()
+            renderer.convert(document)
+            latencies[i] = min(latencies[i], timeit.default_timer() - start)
+
+    return latencies
+
+
+def measure_memory(renderer, documents):
+    """Peak memory allocated while rendering documents, in KiB"""
+    if tracemalloc is None:
+        return None
+
+    highlight_cache.clear()
+    tracemalloc.start()
+    try:
+        for document in documents:
+            renderer.convert(document)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run(size=50, seed=0, repeat=3):
+    """Run the suite
+
+    :param size: Number of documents in each corpus category.
+    :param seed: Corpus seed.
+    :param repeat: Number of passes; the best latency is taken.
+    :return: A json-serializable dict.
+
+    """
+    setup()
+
+    documents = corpus.generate(size, seed)
+    results = []
+
+    for name, renderer in renderers():
+        # Build the markdown instance before measuring
+        renderer.convert('')
+
+        for category, sources in documents:
+            gc.collect()
+            latencies = measure_time(renderer, sources, repeat)
+            results.append({
+                'renderer': name,
+                'fingerprint': renderer.fingerprint,
+                'corpus': category,
+                'documents': len(sources),
+                'docs_per_sec': len(sources) / sum(latencies),
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'peak_memory_kb': measure_memory(renderer, sources),
+            })
+
+    return {
+        'version': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'markdown': markdown.version,
+        'size': size,
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """Compare results with a baseline
+
+    :param threshold: Allowed relative slowdown.
+    :return: A list of `(result, baseline_result, regressions)` tuples,
+      where `regressions` lists names of metrics that got worse.
+
+    """
+    base = dict(((r['renderer'], r['corpus']), r)
+                for r in baseline['results'])
+
+    report = []
+
+    for result in current['results']:
+        old = base.get((result['renderer'], result['corpus']))
+        regressions = []
+        if old is not None:
+            if result['docs_per_sec'] < old['docs_per_sec'] * (1 - threshold):
+                regressions.append('docs_per_sec')
+            if result['p99_ms'] > old['p99_ms'] * (1 + threshold):
+                regressions.append('p99_ms')
+        report.append((result, old, regressions))
+
+    return report
+
+
+def print_results(results):
+    print('%-24s %-16s %10s %10s %10s %12s' % (
+        'renderer', 'corpus', 'docs/s', 'p50, ms', 'p99, ms', 'memory, KiB'))
+    for r in results['results']:
+        print('%-24s %-16s %10.1f %10.3f %10.3f %12s' % (
+            r['renderer'], r['corpus'], r['docs_per_sec'],
+            r['p50_ms'], r['p99_ms'],
+            '%.1f' % r['peak_memory_kb']
+            if r['peak_memory_kb'] is not None else '-'))
+
+
+def print_report(report):
+    print('%-24s %-16s %18s %18s' % (
+        'renderer', 'corpus', 'docs/s', 'p99, ms'))
+    for result, old, regressions in report:
+        if old is None:
+            print('%-24s %-16s %18s %18s' % (
+                result['renderer'], result['corpus'], 'new', 'new'))
+            continue
+        print('%-24s %-16s %8.1f (%+6.1f%%) %8.3f (%+6.1f%%) %s' % (
+            result['renderer'], result['corpus'],
+            result['docs_per_sec'],
+            (result['docs_per_sec'] / old['docs_per_sec'] - 1) * 100,
+            result['p99_ms'],
+            (result['p99_ms'] / old['p99_ms'] - 1) * 100,
+            'REGRESSION' if regressions else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=50,
+                        help='Number of documents in each category.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Corpus seed.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of passes over the corpus.')
+    parser.add_argument('--output', default=None,
+                        help='Save results as json to this file '
+                             '(use `-` for stdout).')
+    parser.add_argument('--compare', default=None,
+                        help='Compare results with a saved baseline.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed relative slowdown in compare mode.')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.seed, args.repeat)
+
+    if args.output == '-':
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        print_results(results)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report = compare(baseline, results, args.threshold)
+        print()
+        print_report(report)
+        if any(regressions for _, _, regressions in report):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
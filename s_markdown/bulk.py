@@ -0,0 +1,256 @@
+"""Bulk operations over html cache columns
+
+These helpers are used by management commands that process every row
+with an `HtmlCacheField` without loading model instances.
+
+"""
+
+from django.apps import apps
+from django.db import connections
+from django.db.models import Case, When, Value, Q
+
+import django
+
+import multiprocessing
+
+from collections import deque
+from functools import reduce
+from operator import or_
+
+from .models import HtmlCacheField, MarkdownField
+
+
+def html_cache_fields(labels=None):
+    """Find all `HtmlCacheField`s of installed models
+
+    :param labels: A list of `app_label` or `app_label.Model` strings.
+      If given, only matching models are returned.
+    :return: A list of `HtmlCacheField` instances.
+
+    """
+    return model_fields(HtmlCacheField, labels)
+
+
+def markdown_fields(labels=None):
+    """Find all `MarkdownField`s of installed models
+
+    See `html_cache_fields`.
+
+    """
+    return model_fields(MarkdownField, labels)
+
+
+def model_fields(field_cls, labels=None):
+    """Find all fields of the given class in installed models"""
+    result = []
+
+    for model in apps.get_models():
+        opts = model._meta
+        if opts.proxy or not opts.managed:
+            continue
+        if labels and not (opts.app_label in labels or
+                           opts.label in labels):
+            continue
+        result.extend(field for field in opts.concrete_fields
+                      if isinstance(field, field_cls))
+
+    return result
+
+
+def field_label(field):
+    """A unique name of the field, e.g. `collective_blog.Post._content_html`"""
+    return '%s.%s' % (field.model._meta.label, field.name)
+
+
+def get_field(label):
+    """Inverse of the `field_label`"""
+    model_label, name = label.rsplit('.', 1)
+    return apps.get_model(model_label)._meta.get_field(name)
+
+
+def iter_batches(field, batch_size, start=None, with_html=False,
+                 with_source=True, with_hash=False):
+    """Stream rows that have the given html cache field
+
+    Rows are fetched in the primary key order using keyset pagination,
+    so no query scans more than `batch_size` rows past the previous batch.
+
+    :param field: An `HtmlCacheField` instance.
+    :param batch_size: Number of rows in a batch.
+    :param start: Skip rows with primary key less than or equal to this.
+    :param with_html: Fetch the cache column along with the source.
+    :param with_source: Fetch the source column. Data migrations should
+      pass `False` as markdown fields of historical models are not bound
+      to their html cache fields.
+    :param with_hash: Append the stored hash of the html to each row
+      (see `HtmlCacheField.stored_hash`).
+    :return: Iterator over lists of `(pk, source)`, `(pk, source, html)`
+      or `(pk, html)` tuples, followed by the hash if `with_hash` is set.
+
+    """
+    columns = ['pk']
+    if with_source:
+        columns.append(field.markdown_field.attname)
+    if with_html:
+        columns.append(field.attname)
+    if with_hash:
+        columns.append(field.hash_attname)
+
+    queryset = field.model._default_manager.order_by('pk')
+
+    while True:
+        if start is not None:
+            batch = queryset.filter(pk__gt=start)
+        else:
+            batch = queryset
+        batch = list(batch.values_list(*columns)[:batch_size])
+
+        if not batch:
+            return
+
+        if with_hash:
+            batch = [row[:-1] + (field.stored_hash(row[-1]), )
+                     for row in batch]
+
+        yield batch
+
+        start = batch[-1][0]
+
+
+def update_cache(field, rows, hashes=None):
+    """Write html cache for a batch of rows with a single query
+
+    :param field: An `HtmlCacheField` instance.
+    :param rows: A list of `(pk, columns)` pairs where `columns` is a dict
+      that maps field names to values (see `HtmlCacheField.render_columns`).
+    :param hashes: A dict that maps primary keys to hashes of the html
+      that was read along with the sources (see `iter_batches`). If given,
+      rows that have been edited or re-rendered since they were read
+      are left as is (see `HtmlCacheField.unchanged`).
+    :return: Number of updated rows. Rows that were left as is
+      are not counted.
+
+    """
+    if not rows:
+        return 0
+
+    names = set()
+    for pk, columns in rows:
+        names.update(columns)
+
+    opts = field.model._meta
+
+    def condition(pk):
+        if hashes is None:
+            return Q(pk=pk)
+        return Q(pk=pk) & field.unchanged(hashes[pk])
+
+    values = {}
+    for name in names:
+        column_field = opts.get_field(name)
+        values[column_field.attname] = Case(
+            *[When(condition(pk), then=Value(columns[name],
+                                             output_field=column_field))
+              for pk, columns in rows if name in columns],
+            default=column_field.get_col(opts.db_table),
+            output_field=column_field)
+
+    if hashes is None:
+        matched = Q(pk__in=[pk for pk, columns in rows])
+    else:
+        matched = reduce(or_, [condition(pk) for pk, columns in rows])
+
+    return field.model._default_manager.filter(matched).update(**values)
+
+
+def _init_worker():
+    """Make sure that django is set up in spawned processes"""
+    django.setup()
+
+
+def _apply(func, label, args):
+    """Call the function in a worker process
+
+    Fields are passed by their labels (see `field_label`).
+
+    """
+    return func(get_field(label), *args)
+
+
+class _Result(object):
+    """Mimics `AsyncResult` for in-process calls"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class BatchPool(object):
+    def __init__(self, processes=1):
+        """A pool of worker processes that process batches of rows
+
+        Used by the management commands to render rows while the main
+        process fetches and writes them.
+
+        :param processes: Number of worker processes. If 1, batches
+          are processed in the current process.
+
+        """
+        self.processes = processes
+
+        if processes > 1:
+            # Forked workers should not share database connections.
+            connections.close_all()
+            self.pool = multiprocessing.Pool(processes,
+                                             initializer=_init_worker)
+        else:
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def submit(self, func, field, *args):
+        """Call `func(field, *args)` in a worker
+
+        :param func: A module-level function.
+        :return: An object with the `get()` method that returns the result.
+
+        """
+        if self.pool is None:
+            return _Result(func(field, *args))
+        else:
+            return self.pool.apply_async(_apply,
+                                         (func, field_label(field), args))
+
+    def imap(self, func, field, batches, *args):
+        """Process batches keeping a few of them in flight
+
+        :param func: A module-level function `func(field, work, *args)`.
+        :param batches: An iterable of `(batch, work)` pairs. `work`
+          is sent to the worker, `batch` is returned with the result.
+        :return: Iterator over `(batch, result)` pairs in the input order.
+
+        """
+        # Keep workers busy while the caller fetches and writes rows
+        pending = deque()
+
+        for batch, work in batches:
+            pending.append((batch, self.submit(func, field, work, *args)))
+            if len(pending) > max(self.processes, 1) * 2:
+                batch, result = pending.popleft()
+                yield batch, result.get()
+
+        while pending:
+            batch, result = pending.popleft()
+            yield batch, result.get()
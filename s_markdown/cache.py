@@ -0,0 +1,152 @@
+"""Caches for rendered markdown
+
+The render cache is content-addressed: entries are keyed on the renderer
+fingerprint and the hash of the source. So identical sources rendered
+by identically configured renderers share one entry, and entries never
+become stale (a changed renderer has a different fingerprint).
+
+The render cache is configured with the `S_MARKDOWN_RENDER_CACHE` setting:
+
+    S_MARKDOWN_RENDER_CACHE = {
+        # Number of entries in the in-process LRU tier
+        'SIZE': 1000,
+        # Alias of a django cache used as a shared tier (optional)
+        'BACKEND': 'default',
+        # Timeout for the shared tier (optional)
+        'TIMEOUT': 60 * 60 * 24,
+        # Longer sources are not cached (optional)
+        'MAX_LENGTH': 64 * 1024,
+    }
+
+If the setting is not set, nothing is cached.
+
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.utils import encoding
+
+from collections import OrderedDict
+from hashlib import md5
+import threading
+
+
+class LRUCache(object):
+    def __init__(self, size):
+        """A thread-safe in-process cache with least recently used eviction
+
+        :param size: Maximum number of entries.
+
+        """
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RenderCache(object):
+    def __init__(self, size=1000, backend=None, timeout=None,
+                 max_length=64 * 1024):
+        """Two-tier cache of rendered html
+
+        :param size: Number of entries in the in-process tier.
+        :param backend: An alias of a django cache for the shared tier.
+          If None, only the in-process tier is used.
+        :param timeout: Timeout for the shared tier.
+        :param max_length: Sources longer than this are not cached.
+
+        """
+        self.local = LRUCache(size)
+        self.backend = caches[backend] if backend is not None else None
+        self.timeout = timeout
+        self.max_length = max_length
+
+    @staticmethod
+    def key(renderer, source):
+        """Build a cache key for the given renderer and source"""
+        source = encoding.force_text(source).encode('utf-8')
+        return 's_markdown:%s:%s' % (renderer.fingerprint,
+                                     md5(source).hexdigest())
+
+    def get(self, renderer, source):
+        """Returns cached html or None"""
+        if len(source) > self.max_length:
+            return None
+
+        key = self.key(renderer, source)
+
+        html = self.local.get(key)
+        if html is None and self.backend is not None:
+            html = self.backend.get(key)
+            if html is not None:
+                self.local.set(key, html)
+        return html
+
+    def set(self, renderer, source, html):
+        if len(source) > self.max_length:
+            return
+
+        key = self.key(renderer, source)
+
+        self.local.set(key, html)
+        if self.backend is not None:
+            if self.timeout is not None:
+                self.backend.set(key, html, self.timeout)
+            else:
+                self.backend.set(key, html)
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Returns the render cache configured in settings or None"""
+    global _render_cache
+
+    config = getattr(settings, 'S_MARKDOWN_RENDER_CACHE', None)
+    if config is None:
+        return None
+
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache(
+                    size=config.get('SIZE', 1000),
+                    backend=config.get('BACKEND'),
+                    timeout=config.get('TIMEOUT'),
+                    max_length=config.get('MAX_LENGTH', 64 * 1024))
+
+    return _render_cache
+
+
+def _reset_render_cache(setting, **kwargs):
+    global _render_cache
+    if setting == 'S_MARKDOWN_RENDER_CACHE':
+        _render_cache = None
+
+
+setting_changed.connect(_reset_render_cache)
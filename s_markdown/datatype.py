@@ -8,6 +8,10 @@ from django.utils import encoding
 
 
 class Markdown(object):
+    # One object is created for each markdown field of each loaded
+    # model instance, so they are kept small.
+    __slots__ = ('_source', '_renderer', '_html', '_is_dirty', '_is_pending')
+
     # TODO tests
     def __init__(self, renderer, source, html=None):
         """Markdown data type contains source markdown data and cached html
@@ -21,6 +25,7 @@ class Markdown(object):
         """
         self._source = source
         self._renderer = renderer
+        self._is_pending = False
 
         if html is None:
             self._html = ''
@@ -29,6 +34,18 @@ class Markdown(object):
             self._html = html
             self._is_dirty = False
 
+    def __getstate__(self):
+        """Pickle slots along with the `__dict__` of subclasses"""
+        state = dict(getattr(self, '__dict__', {}))
+        state.update((name, getattr(self, name)) for name in Markdown.__slots__)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        # Objects pickled before `_is_pending` was added lack it
+        self._is_pending = state.get('_is_pending', False)
+
     @property
     def source(self):
         """Source accessor
@@ -50,6 +67,7 @@ class Markdown(object):
         """
         self._source = value
         self._is_dirty = True
+        self._is_pending = False
 
     @property
     def html(self):
@@ -74,6 +92,19 @@ class Markdown(object):
         """
         return self._is_dirty
 
+    @property
+    def is_pending(self):
+        """Background render state accessor
+
+        :return: True if the html is a placeholder (the previous html
+          or escaped source) that will be replaced by a background render.
+
+        Pending objects are not dirty, so accessing `html_force`
+        returns the placeholder instead of rendering synchronously.
+
+        """
+        return self._is_pending
+
     @property
     def html_force(self):
         """Clean html accessor
@@ -98,6 +129,7 @@ class Markdown(object):
         if self.is_dirty or force:
             self._html = self._renderer(encoding.force_text(self._source))
             self._is_dirty = False
+            self._is_pending = False
 
     def deconstruct(self):
         """Deconstruct this field for further serialization
@@ -53,30 +53,52 @@ class CutPreprocessor(Preprocessor):
         r'[ ]*-{4,}', re.MULTILINE | re.DOTALL | re.VERBOSE | re.IGNORECASE)
 
     def run(self, lines):
-        """Match cut tags and store them in the htmlStash
+        """Match the first cut tag and store it in the htmlStash
+
+        Only lines that contain `----` are examined. The text is joined
+        only if a caption may span several lines.
 
         :param lines: Lines of code.
 
         """
 
-        text = '\n'.join(lines)
-
-        m = self.block_re.search(text)
+        for i, line in enumerate(lines):
+            if '----' not in line:
+                continue
 
-        if m is not None:
-            if 'caption' in m.groupdict() and m.groupdict()['caption'] is not None:
-                html = '<!-- cut here {{ %s }} -->' % escape(m.groupdict()['caption'])
+            # Only a caption may contain a line break
+            joined = '{{' in line
+            if joined:
+                text = '\n'.join(lines[i:])
+                rest = []
             else:
-                html = '<!-- cut here -->'
-
-            if self.anchor:
-                html += '<a name="%s"></a>' % escape(self.anchor)
-
-            placeholder = self.markdown.htmlStash.store(html,
-                                                        safe=True)
+                text = line
+                rest = lines[i + 1:]
+
+            m = self.block_re.search(text)
+
+            if m is not None:
+                placeholder = self.markdown.htmlStash.store(self.html(m),
+                                                            safe=True)
+                return (lines[:i] +
+                        text[:m.start()].split('\n') +
+                        [placeholder] +
+                        text[m.end():].split('\n') +
+                        rest)
+            elif joined:
+                # The rest of the text has been searched already
+                break
+
+        return lines
+
+    def html(self, m):
+        """Build html for the matched cut tag"""
+        if 'caption' in m.groupdict() and m.groupdict()['caption'] is not None:
+            html = '<!-- cut here {{ %s }} -->' % escape(m.groupdict()['caption'])
+        else:
+            html = '<!-- cut here -->'
 
-            text = '%s\n%s\n%s' % (text[:m.start()],
-                                   placeholder,
-                                   text[m.end():])
+        if self.anchor:
+            html += '<a name="%s"></a>' % escape(self.anchor)
 
-        return text.split('\n')
+        return html
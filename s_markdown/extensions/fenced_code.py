@@ -13,6 +13,7 @@ from __future__ import unicode_literals
 from markdown.extensions import Extension
 from markdown.preprocessors import Preprocessor
 
+from hashlib import md5
 import re
 
 from pygments import highlight
@@ -22,6 +23,9 @@ from pygments.util import ClassNotFound
 
 from django.utils.html import escape
 from django.utils.deconstruct import deconstructible
+from django.utils import encoding
+
+from ..cache import LRUCache
 
 
 @deconstructible
@@ -64,51 +68,123 @@ class Formatter(HtmlFormatter):
         yield 0, '</ol></pre>'
 
 
+# Lexers are looked up by a language name.
+# `None` is stored for unknown languages.
+_lexers = {}
+
+# Formatter has no per-language options so a single instance is enough.
+_formatter = Formatter()
+
+# Highlighted blocks keyed on `(lang, md5(code))`.
+highlight_cache = LRUCache(1024)
+
+
+def get_lexer(lang):
+    """Returns a cached lexer for the language or None if there is no lexer"""
+    try:
+        return _lexers[lang]
+    except KeyError:
+        try:
+            lexer = get_lexer_by_name(lang, stripall=True)
+        except ClassNotFound:
+            lexer = None
+        _lexers[lang] = lexer
+        return lexer
+
+
+def render_code(lang, code):
+    """Render a code block
+
+    Results are memoized so re-rendering a document where only the prose
+    has changed reuses already highlighted blocks.
+
+    :param lang: Language name. May be empty.
+    :param code: Code to render.
+    :return: Html.
+
+    """
+    key = (lang, md5(encoding.force_bytes(code)).hexdigest())
+
+    html = highlight_cache.get(key)
+    if html is not None:
+        return html
+
+    lexer = get_lexer(lang)
+    if lexer is not None:
+        html = highlight(code, lexer, _formatter)
+    else:
+        html = escape(code)
+        html = html.split('\n')
+        while html and not html[-1].strip():
+            html.pop()
+        if lang:
+            html = ''.join(map(lambda x: '<li>%s</li>' % x, html))
+            html = '<ol>%s</ol>' % html
+        else:
+            html = '\n'.join(html)
+        html = '<pre>%s</pre>' % html
+
+    highlight_cache.set(key, html)
+    return html
+
+
 class FencedBlockPreprocessor(Preprocessor):
     """Main fenced code block renderer"""
 
-    block_re = re.compile(
-        r'(?P<fence>^(?:`{3}))[ ]*'
-        r'(?P<lang>[a-zA-Z0-9_+-]*)?[ ]*\n'
-        r'(?P<code>.*?)(?<=\n)'
-        r'(?P=fence)[ ]*$', re.MULTILINE | re.DOTALL | re.VERBOSE)
+    open_re = re.compile(r'^`{3}[ ]*(?P<lang>[a-zA-Z0-9_+-]*)[ ]*$')
+
+    close_re = re.compile(r'^`{3}[ ]*$')
 
     def run(self, lines):
         """Match and store Fenced Code Blocks in the HtmlStash
 
+        Lines are scanned once, front to back. Each block is replaced with
+        a placeholder surrounded by empty lines.
+
+        A block starts with a line like ```` ```lang ```` and ends with
+        the nearest following ```` ``` ```` line. An opening fence without
+        a closing one is left as is.
+
         :param lines: Lines of code.
 
         """
+        # Indices of all lines that can close a block. Openers are visited
+        # in order, so the nearest closing fence is found by moving
+        # a pointer forward and the whole scan is linear.
+        closing = [i for i, line in enumerate(lines)
+                   if line.startswith('```') and self.close_re.match(line)]
+        next_closing = 0
+
+        result = []
+
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+
+            m = None
+            if line.startswith('```'):
+                m = self.open_re.match(line)
+
+            if m is not None:
+                while (next_closing < len(closing) and
+                       closing[next_closing] <= i):
+                    next_closing += 1
+
+                if next_closing < len(closing):
+                    end = closing[next_closing]
+
+                    code = lines[i + 1:end]
+                    code = '\n'.join(code) + '\n' if code else ''
+                    code = render_code(m.group('lang'), code)
+
+                    placeholder = self.markdown.htmlStash.store(code,
+                                                                safe=True)
+                    result.extend(['', placeholder, ''])
+
+                    i = end + 1
+                    continue
+
+            result.append(line)
+            i += 1
 
-        text = "\n".join(lines)
-        while 1:
-            m = self.block_re.search(text)
-            if m:
-                lang = ''
-                if m.group('lang'):
-                    lang = m.group('lang')
-
-                try:
-                    lexer = get_lexer_by_name(lang, stripall=True)
-                    formatter = Formatter()
-                    code = highlight(m.group('code'), lexer, formatter)
-                except ClassNotFound:
-                    code = escape(m.group('code'))
-                    code = code.split('\n')
-                    while code and not code[-1].strip():
-                        code.pop()
-                    if lang:
-                        code = ''.join(map(lambda x: '<li>%s</li>' % x, code))
-                        code = '<ol>%s</ol>' % code
-                    else:
-                        code = '\n'.join(code)
-                    code = '<pre>%s</pre>' % code
-
-                placeholder = self.markdown.htmlStash.store(code, safe=True)
-                text = '%s\n%s\n%s' % (text[:m.start()],
-                                       placeholder,
-                                       text[m.end():])
-            else:
-                break
-
-        return text.split("\n")
+        return result
@@ -9,7 +9,7 @@ from django import forms
 from django.core import exceptions
 
 from .datatype import Markdown
-from .renderer import BaseRenderer
+from .registry import get_renderer
 from .widgets import MarkdownTextarea
 
 
@@ -30,7 +30,9 @@ class MarkdownFormField(forms.fields.CharField):
         self.source_validators = source_validators + _source_validators
 
         self.markdown_cls = kwargs.pop('markdown', Markdown)
-        self.renderer = kwargs.pop('renderer', BaseRenderer())
+        self.renderer = kwargs.pop('renderer', None)
+        if self.renderer is None:
+            self.renderer = get_renderer('default')
 
         defaults = {'widget': MarkdownTextarea}
         defaults.update(kwargs)
@@ -0,0 +1,166 @@
+"""Block-level incremental rendering
+
+A long document is split into top-level blocks (paragraphs, lists,
+fenced code, etc.), and each block is rendered and cached separately.
+When one paragraph of a long post is edited, only that paragraph is
+rendered again; the other blocks come from the render cache
+(see `s_markdown.cache`).
+
+Some constructs affect the whole document:
+
+- reference link and abbreviation definitions are appended to every
+  block, so changing a definition changes every block (and every block
+  is rendered again);
+- sources with raw html blocks (when html is not escaped) and sources
+  with several cut tags are not split at all.
+
+Incremental rendering is configured with the `S_MARKDOWN_INCREMENTAL`
+setting:
+
+    S_MARKDOWN_INCREMENTAL = {
+        # Shorter sources are rendered as a whole
+        'MIN_LENGTH': 4 * 1024,
+    }
+
+If the setting or the render cache is not set, sources are always
+rendered as a whole. The mode is opt-in: its html may differ from
+a full render in empty lines between top-level elements, so enabling
+it changes the html stored for long documents.
+
+"""
+
+from django.conf import settings
+
+from markdown.preprocessors import ReferencePreprocessor
+from markdown.extensions.abbr import ABBR_REF_RE
+
+import re
+
+from .extensions.fenced_code import FencedBlockPreprocessor
+
+
+# Lines that continue the previous block even after an empty line:
+# indented lines, list items, quotes, and definitions.
+continuation_re = re.compile(r'^([ \t]|[*+-][ \t]|\d+\.[ \t]|>|:[ \t])')
+
+definition_re = re.compile(r'^[ ]{0,3}:[ ]{1,3}')
+
+
+def is_enabled(text):
+    """Check whether the text should be rendered block by block"""
+    config = getattr(settings, 'S_MARKDOWN_INCREMENTAL', None)
+    if config is None:
+        return False
+    return len(text) >= config.get('MIN_LENGTH', 4 * 1024)
+
+
+def is_blank(line):
+    return not line.strip(' \t')
+
+
+def split(md, text):
+    """Split the source into blocks that can be rendered separately
+
+    Joining rendered blocks with a newline gives the same html
+    as rendering the whole source, up to empty lines between
+    top-level elements.
+
+    :param md: A `markdown.Markdown` instance the blocks are rendered with.
+      It is used to find out which syntax is enabled.
+    :param text: Source markdown string.
+    :return: List of block sources or None if the source can't be split.
+
+    """
+    preprocessors = md.preprocessors
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+
+    if 'html_block' in preprocessors:
+        if any(line.lstrip(' ').startswith('<') for line in lines):
+            return None
+
+    if 'cut' in preprocessors:
+        cuts = [line for line in lines if '----' in line and
+                'cut' in line.lower()]
+        if len(cuts) > 1 or any('{{' in line and '}}' not in line
+                                for line in cuts):
+            return None
+
+    fenced = 'fenced_code_block' in preprocessors
+    references = 'reference' in preprocessors
+    abbreviations = 'abbr' in preprocessors
+    definition_lists = 'deflist' in md.parser.blockprocessors
+
+    open_re = FencedBlockPreprocessor.open_re
+    close_re = FencedBlockPreprocessor.close_re
+
+    blocks = []
+    definitions = []
+    current = []
+    after_blank = False
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        if is_blank(line):
+            current.append(line)
+            after_blank = True
+            i += 1
+            continue
+
+        if after_blank and current and not continuation_re.match(line):
+            blocks.append(current)
+            current = []
+        after_blank = False
+
+        if fenced and line.startswith('```') and open_re.match(line):
+            # The whole fenced block goes as is
+            for end in range(i + 1, len(lines)):
+                if lines[end].startswith('```') and close_re.match(lines[end]):
+                    current.extend(lines[i:end + 1])
+                    i = end + 1
+                    break
+            else:
+                current.append(line)
+                i += 1
+            continue
+
+        if references:
+            m = ReferencePreprocessor.RE.match(line)
+            if m is not None:
+                definitions.append(line)
+                title = m.group(5) or m.group(6) or m.group(7)
+                if (not title and i + 1 < len(lines) and
+                        ReferencePreprocessor.TITLE_RE.match(lines[i + 1])):
+                    definitions.append(lines[i + 1])
+
+        if abbreviations and ABBR_REF_RE.match(line):
+            definitions.append(line)
+
+        current.append(line)
+        i += 1
+
+    if current:
+        blocks.append(current)
+
+    if definition_lists:
+        # Adjacent definition lists are merged into a single one
+        merged = []
+        for block in blocks:
+            if (merged and any(definition_re.match(l) for l in block) and
+                    any(definition_re.match(l) for l in merged[-1])):
+                merged[-1].extend(block)
+            else:
+                merged.append(block)
+        blocks = merged
+
+    if len(blocks) < 2:
+        return None
+
+    blocks = ['\n'.join(block) for block in blocks]
+
+    if definitions:
+        context = '\n\n' + '\n'.join(definitions)
+        blocks = [block + context for block in blocks]
+
+    return blocks
@@ -0,0 +1,225 @@
+"""Isolated rendering with a time budget
+
+Some inputs make markdown regexps backtrack for a very long time.
+To protect web workers from them, rendering can be moved to worker
+processes. Each render runs in its own worker. If a render exceeds
+the time budget, only its worker is killed, and the source is rendered
+as escaped plain text instead (see `fallback`). Every such event
+is logged and sent as the `render_timeout` signal.
+
+Isolation is configured with the `S_MARKDOWN_ISOLATION` setting:
+
+    S_MARKDOWN_ISOLATION = {
+        # Time budget for a single render, in seconds
+        'TIMEOUT': 2,
+        # Number of worker processes (optional)
+        'PROCESSES': 2,
+    }
+
+If the setting is not set, markdown is rendered in the current thread.
+
+"""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.html import linebreaks
+from django.utils import six
+
+import logging
+import multiprocessing
+import threading
+
+from .signals import render_timeout
+
+
+logger = logging.getLogger(__name__)
+
+
+class FallbackHtml(six.text_type):
+    """Html returned instead of a render that exceeded its time budget
+
+    Such html is saved to the html cache as pending, so it is not
+    rendered again when loaded. The render is retried by the render
+    queue or the `rerender_markdown` command (see `HtmlCacheDescriptor`).
+
+    """
+
+
+def fallback(text):
+    """Render the source as escaped plain text
+
+    :return: A `FallbackHtml` string.
+
+    """
+    return FallbackHtml(linebreaks(text, autoescape=True))
+
+
+def _serve(conn):
+    """Render markdown in a worker process until the pipe is closed"""
+    # Renderers that were sent to this worker, by fingerprint
+    renderers = {}
+
+    while True:
+        try:
+            renderer, text = conn.recv()
+        except EOFError:
+            return
+
+        renderer = renderers.setdefault(renderer.fingerprint, renderer)
+        try:
+            conn.send((True, renderer.convert(text)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+class Worker(object):
+    def __init__(self):
+        """A worker process that renders one source at a time"""
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve,
+                                               args=(child_conn, ))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def convert(self, renderer, text, timeout):
+        """Render markdown in the worker
+
+        :return: A pair `(ok, result)`. `result` is the rendered html
+          if `ok` is set, or the exception raised by the renderer.
+        :raises multiprocessing.TimeoutError: If the render
+          exceeds the timeout. The worker should be killed then.
+
+        """
+        self.conn.send((renderer, text))
+        if not self.conn.poll(timeout):
+            raise multiprocessing.TimeoutError()
+        return self.conn.recv()
+
+    def kill(self):
+        self.conn.close()
+        self.process.terminate()
+        self.process.join()
+
+
+class IsolatedRenderer(object):
+    def __init__(self, timeout, processes=2):
+        """Runs renderers in worker processes
+
+        Workers are started on demand. Renders beyond the number
+        of processes wait for a free worker.
+
+        :param timeout: Time budget for a single render, in seconds.
+        :param processes: Number of worker processes.
+
+        """
+        self.timeout = timeout
+        self.processes = processes
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(processes)
+
+    def acquire(self):
+        """Take an idle worker or start a new one"""
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Worker()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, worker, alive=True):
+        """Return the worker taken by `acquire`
+
+        :param alive: If False, the worker is killed.
+
+        """
+        try:
+            if alive:
+                with self._lock:
+                    self._idle.append(worker)
+            else:
+                worker.kill()
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.kill()
+
+    def convert(self, renderer, text):
+        """Render markdown within the time budget
+
+        :param renderer: A `BaseRenderer` instance.
+        :param text: Source markdown string.
+        :return: Rendered html or None if the time budget is exceeded.
+
+        """
+        worker = self.acquire()
+
+        try:
+            ok, result = worker.convert(renderer, text, self.timeout)
+        except multiprocessing.TimeoutError:
+            # A render can't be interrupted, so the worker is killed.
+            # Renders in other workers are not affected.
+            self.release(worker, alive=False)
+        except Exception:
+            # The worker died or the pipe is broken
+            self.release(worker, alive=False)
+            raise
+        else:
+            self.release(worker)
+            if not ok:
+                raise result
+            return result
+
+        logger.warning('Markdown render exceeded its time budget',
+                       extra={'renderer': renderer.fingerprint,
+                              'length': len(text),
+                              'timeout': self.timeout})
+        render_timeout.send(sender=renderer, source=text,
+                            timeout=self.timeout)
+
+        return None
+
+
+_isolated_renderer = None
+_isolated_renderer_lock = threading.Lock()
+
+
+def get_isolated_renderer():
+    """Returns the isolated renderer configured in settings or None"""
+    global _isolated_renderer
+
+    config = getattr(settings, 'S_MARKDOWN_ISOLATION', None)
+    if config is None:
+        return None
+
+    # Daemonic processes (e.g. workers of the `rerender_markdown` command)
+    # are not allowed to have children.
+    if multiprocessing.current_process().daemon:
+        return None
+
+    if _isolated_renderer is None:
+        with _isolated_renderer_lock:
+            if _isolated_renderer is None:
+                _isolated_renderer = IsolatedRenderer(
+                    timeout=config['TIMEOUT'],
+                    processes=config.get('PROCESSES', 2))
+
+    return _isolated_renderer
+
+
+def _reset_isolated_renderer(setting, **kwargs):
+    global _isolated_renderer
+    if setting == 'S_MARKDOWN_ISOLATION' and _isolated_renderer is not None:
+        _isolated_renderer.close()
+        _isolated_renderer = None
+
+
+setting_changed.connect(_reset_isolated_renderer)
@@ -0,0 +1,141 @@
+"""Check html cache of all markdown fields
+
+Html that was left stale by queryset updates of the source, raw SQL
+or a disabled `HtmlCacheField` is only re-rendered when it is accessed,
+and the stale derived fields (see `HtmlCacheField`) are kept until then.
+This command compares the hash of every cached html with its source.
+Fields with a `hash_field` are checked without reading the html.
+
+"""
+
+from __future__ import division
+
+from django.core.management.base import BaseCommand
+
+import multiprocessing
+import time
+
+from s_markdown.bulk import (html_cache_fields, field_label, iter_batches,
+                             update_cache, BatchPool)
+from s_markdown.models import HtmlCacheDescriptor
+
+
+def check_batch(field, batch, repair):
+    """Find rows with stale html
+
+    :param field: An `HtmlCacheField` instance.
+    :param batch: A list of `(pk, source, hash)` tuples, where `hash`
+      is the stored hash of the html (see `HtmlCacheField.stored_hash`).
+    :param repair: Render stale rows.
+    :return: A tuple `(stale, pending, rows)`. `stale` is a list of primary
+      keys of stale rows, `pending` is the number of rows that wait for
+      a background render (see `RenderTask`), and `rows` is a list
+      of `(pk, columns)` pairs for stale rows if `repair` is set.
+
+    """
+    renderer = field.markdown_field.renderer
+
+    stale = []
+    pending = 0
+
+    for pk, source, hash_str in batch:
+        if hash_str == HtmlCacheDescriptor.hash(source, renderer):
+            continue
+        elif hash_str == HtmlCacheDescriptor.pending_hash(source):
+            pending += 1
+        else:
+            stale.append(pk)
+
+    rows = []
+    if repair:
+        sources = dict((pk, source) for pk, source, hash_str in batch)
+        rows = [(pk, field.render_columns(sources[pk])) for pk in stale]
+
+    return stale, pending, rows
+
+
+class Command(BaseCommand):
+    help = ('Finds stale html cache of markdown fields and re-renders it '
+            'using a pool of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', nargs='*', metavar='app_label[.Model]',
+                            help='Only process the given apps or models.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows fetched and updated '
+                                 'by a single query.')
+        parser.add_argument('--processes', type=int,
+                            default=multiprocessing.cpu_count(),
+                            help='Number of worker processes. Use 1 to '
+                                 'check in the current process.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only report stale rows, '
+                                 'don\'t write anything.')
+
+    def handle(self, *args, **options):
+        self.run(html_cache_fields(options['labels']), **options)
+
+    def run(self, fields, batch_size=500, processes=1, dry_run=False,
+            verbosity=1, **kwargs):
+        """Check the given html cache fields
+
+        :param fields: A list of `HtmlCacheField` instances.
+        :return: A dict that maps field labels to dicts with numbers
+          of `checked`, `stale`, `pending` and `repaired` rows.
+
+        """
+        self.batch_size = batch_size
+        self.processes = processes
+        self.dry_run = dry_run
+        self.verbosity = verbosity
+
+        with BatchPool(self.processes) as self.pool:
+            return dict((field_label(field), self.process(field))
+                        for field in fields)
+
+    def process(self, field):
+        """Check all rows of the given field"""
+        label = field_label(field)
+
+        stats = dict(checked=0, stale=0, pending=0, repaired=0)
+        started = time.time()
+
+        # Only hashes are read (see `HtmlCacheField.hash_attname`), so
+        # the html column is read only for fields without the `hash_field`
+        batches = ((batch, batch)
+                   for batch in iter_batches(field, self.batch_size,
+                                             with_hash=True))
+
+        for batch, result in self.pool.imap(check_batch, field, batches,
+                                            not self.dry_run):
+            stale, pending_count, rows = result
+
+            stats['checked'] += len(batch)
+            stats['stale'] += len(stale)
+            stats['pending'] += pending_count
+
+            if stale and self.verbosity >= 2:
+                self.stdout.write('%s: stale rows %s' % (
+                    label, ', '.join(str(pk) for pk in stale)))
+
+            if rows:
+                # Rows edited in the meantime are not overwritten
+                hashes = dict((row[0], row[-1]) for row in batch)
+                stats['repaired'] += update_cache(field, rows, hashes)
+
+            self.report(label, stats, started)
+
+        if self.verbosity >= 1:
+            self.stdout.write(
+                '%s: %d rows checked, %d stale, %d pending, %d repaired' % (
+                    label, stats['checked'], stats['stale'],
+                    stats['pending'], stats['repaired']))
+
+        return stats
+
+    def report(self, label, stats, started):
+        if self.verbosity >= 1:
+            elapsed = time.time() - started
+            self.stdout.write('%s: %d rows (%.1f rows/s)' % (
+                label, stats['checked'],
+                stats['checked'] / elapsed if elapsed else 0))
@@ -0,0 +1,97 @@
+"""Profile markdown renderers on the contents of the database
+
+Use this command to see which extensions are responsible
+for render latency (see `s_markdown.profiling`).
+
+"""
+
+from __future__ import division
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+import json
+
+from s_markdown.bulk import markdown_fields, field_label
+from s_markdown.profiling import get_profile
+
+
+class Command(BaseCommand):
+    help = ('Renders markdown stored in the database with profiling '
+            'enabled and reports time spent in each extension.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', nargs='*', metavar='app_label[.Model]',
+                            help='Only profile the given apps or models.')
+        parser.add_argument('--limit', type=int, default=1000,
+                            help='Number of rows rendered for each field.')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of the slowest processors shown '
+                                 'for each renderer.')
+        parser.add_argument('--json', action='store_true', default=False,
+                            help='Output profiles as json.')
+
+    def handle(self, *args, **options):
+        profiles = self.run(markdown_fields(options['labels']),
+                            limit=options['limit'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(profiles, indent=2, sort_keys=True))
+        else:
+            for profile in profiles:
+                self.write_profile(profile, options['top'])
+
+    def run(self, fields, limit=1000):
+        """Profile renderers of the given markdown fields
+
+        Fields that share a renderer configuration are profiled together.
+
+        :param fields: A list of `MarkdownField` instances.
+        :param limit: Number of rows rendered for each field.
+        :return: A list of profiles (see `Profile.as_dict`) with
+          the renderer `fingerprint` and the list of `fields` added.
+
+        """
+        renderers = {}
+        labels = {}
+
+        for field in fields:
+            renderers.setdefault(field.renderer.fingerprint, field.renderer)
+            labels.setdefault(field.renderer.fingerprint, []).append(
+                field_label(field))
+
+        for renderer in renderers.values():
+            get_profile(renderer).clear()
+
+        with override_settings(S_MARKDOWN_PROFILING=True):
+            for field in fields:
+                renderer = renderers[field.renderer.fingerprint]
+                sources = (field.model._default_manager
+                           .values_list(field.attname, flat=True)
+                           .order_by('-pk')[:limit])
+                for source in sources:
+                    renderer.convert(source or '')
+
+        profiles = []
+
+        for fingerprint, renderer in renderers.items():
+            profile = get_profile(renderer).as_dict()
+            profile.update(fingerprint=fingerprint,
+                           fields=labels[fingerprint])
+            profiles.append(profile)
+
+        return profiles
+
+    def write_profile(self, profile, top):
+        self.stdout.write(', '.join(profile['fields']))
+        self.stdout.write('  %d renders, %.3f s total, %.3f ms/render' % (
+            profile['renders'], profile['seconds'],
+            profile['seconds'] * 1000 / profile['renders']
+            if profile['renders'] else 0))
+
+        for timing in profile['timings'][:top]:
+            self.stdout.write('  %-16s %-24s %8d calls %10.3f ms' % (
+                timing['kind'], timing['name'], timing['calls'],
+                timing['seconds'] * 1000))
+
+        self.stdout.write('')
@@ -0,0 +1,86 @@
+"""Process queued renders of large markdown documents
+
+See `s_markdown.models.RenderTask`.
+
+"""
+
+from django.core.management.base import BaseCommand
+
+import datetime
+import time
+import traceback
+
+from s_markdown.models import RenderTask, RenderTimeout
+
+
+class Command(BaseCommand):
+    help = ('Renders html of large markdown documents '
+            'that were saved with pending html.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Exit when the queue is empty.')
+        parser.add_argument('--sleep', type=float, default=1,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of tasks fetched by a single query.')
+        parser.add_argument('--lease', type=float, default=300,
+                            help='Seconds after which a task claimed by '
+                                 'a failed or dead worker is retried. '
+                                 'Doubles with each attempt.')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Number of times a task is claimed '
+                                 'before it is left in the queue.')
+
+    def handle(self, *args, **options):
+        while True:
+            done = self.run(options['batch_size'], options['verbosity'],
+                            options['lease'], options['max_attempts'])
+            if not done:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+
+    def run(self, batch_size=100, verbosity=1, lease=300, max_attempts=5):
+        """Process a batch of tasks
+
+        Tasks are claimed for the `lease` seconds before rendering,
+        so several workers can process the same queue. A task is removed
+        once its html is written. A task that fails or times out is retried
+        when its lease expires. After `max_attempts` claims it is left in
+        the queue, and its row keeps the pending html until it is saved
+        again or re-rendered with the `rerender_markdown` command.
+
+        :return: Number of claimed tasks.
+
+        """
+        lease = datetime.timedelta(seconds=lease)
+        done = 0
+
+        tasks = RenderTask.available(lease, max_attempts)[:batch_size]
+        for task in tasks:
+            if not task.claim(lease):
+                continue
+
+            done += 1
+
+            try:
+                written = task.run()
+            except RenderTimeout:
+                self.stderr.write('%s %s: render timed out (attempt %d)' % (
+                    task.field, task.object_id, task.attempts + 1))
+                continue
+            except Exception:
+                self.stderr.write('%s %s: render failed (attempt %d)\n%s' % (
+                    task.field, task.object_id, task.attempts + 1,
+                    traceback.format_exc()))
+                continue
+
+            task.done()
+
+            if verbosity >= 2:
+                self.stdout.write('%s %s: %s' % (
+                    task.field, task.object_id,
+                    'rendered' if written else 'skipped'))
+
+        return done
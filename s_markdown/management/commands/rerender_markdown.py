@@ -0,0 +1,124 @@
+"""Re-render html cache of all markdown fields
+
+Use this command after changing the extensions of a renderer.
+
+"""
+
+from __future__ import division
+
+from django.core.management.base import BaseCommand
+
+import json
+import multiprocessing
+import os
+import time
+
+from s_markdown.bulk import (html_cache_fields, field_label, iter_batches,
+                             update_cache, BatchPool)
+
+
+def render_batch(field, batch):
+    """Render a batch of sources
+
+    :param field: An `HtmlCacheField` instance.
+    :param batch: A list of `(pk, source)` pairs.
+    :return: A list of `(pk, columns)` pairs
+      (see `HtmlCacheField.render_columns`).
+
+    """
+    return [(pk, field.render_columns(source)) for pk, source in batch]
+
+
+class Command(BaseCommand):
+    help = ('Re-renders html cache of all markdown fields '
+            'using a pool of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', nargs='*', metavar='app_label[.Model]',
+                            help='Only process the given apps or models.')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of rows fetched and updated '
+                                 'by a single query.')
+        parser.add_argument('--processes', type=int,
+                            default=multiprocessing.cpu_count(),
+                            help='Number of worker processes. Use 1 to '
+                                 'render in the current process.')
+        parser.add_argument('--checkpoint', default=None,
+                            help='A file to store the progress in. If the '
+                                 'file exists, the command resumes from '
+                                 'the saved position. The file is removed '
+                                 'once all rows are processed.')
+
+    def handle(self, *args, **options):
+        self.run(html_cache_fields(options['labels']), **options)
+
+    def run(self, fields, batch_size=200, processes=1, checkpoint=None,
+            verbosity=1, **kwargs):
+        """Re-render the given html cache fields
+
+        :param fields: A list of `HtmlCacheField` instances.
+
+        """
+        self.batch_size = batch_size
+        self.processes = processes
+        self.checkpoint = checkpoint
+        self.verbosity = verbosity
+
+        self.progress = self.load_checkpoint()
+
+        with BatchPool(self.processes) as self.pool:
+            for field in fields:
+                self.process(field)
+
+        if self.checkpoint is not None and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def load_checkpoint(self):
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return {}
+        with open(self.checkpoint) as f:
+            return json.load(f)
+
+    def save_checkpoint(self):
+        if self.checkpoint is None:
+            return
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.progress, f)
+        os.rename(tmp, self.checkpoint)
+
+    def process(self, field):
+        """Re-render all rows of the given field"""
+        label = field_label(field)
+        start = self.progress.get(label)
+
+        queryset = field.model._default_manager.all()
+        if start is not None:
+            queryset = queryset.filter(pk__gt=start)
+        total = queryset.count()
+
+        if self.verbosity >= 1:
+            self.stdout.write('%s: %d rows to render' % (label, total))
+
+        done = 0
+        started = time.time()
+
+        batches = (
+            (batch, [(pk, source) for pk, source, hash_str in batch])
+            for batch in iter_batches(field, self.batch_size, start,
+                                      with_hash=True))
+
+        for batch, rows in self.pool.imap(render_batch, field, batches):
+            # Rows edited in the meantime are not overwritten
+            hashes = dict((pk, hash_str) for pk, source, hash_str in batch)
+            update_cache(field, rows, hashes)
+            self.progress[label] = batch[-1][0]
+            self.save_checkpoint()
+            done += len(rows)
+            self.report(label, done, total, started)
+
+    def report(self, label, done, total, started):
+        if self.verbosity >= 1:
+            elapsed = time.time() - started
+            self.stdout.write('%s: %d/%d rows (%.1f rows/s)' % (
+                label, done, total, done / elapsed if elapsed else 0))
@@ -1,15 +1,83 @@
 """Markdown model fields"""
 
-from django.db.models import TextField, NOT_PROVIDED
-from django.utils import encoding
+from django.apps import apps
+from django.conf import settings
+from django.db import models, IntegrityError, transaction
+from django.db.models import TextField, NOT_PROVIDED, signals, Q
+from django.utils import encoding, six, timezone
 from django.core import exceptions
+from django.core.cache import cache
 
 from .datatype import Markdown
-from .renderer import BaseRenderer
+from .registry import get_renderer
 from .forms import MarkdownFormField
+from .isolation import fallback, FallbackHtml
 
 from hashlib import md5
 import re
+import uuid
+import zlib
+
+
+def is_deferred(instance, field):
+    """Check if the field was deferred when the instance was loaded
+
+    Django doesn't set deferred fields when initializing model instances
+    (see `Model.from_db`), so they are missing from the instance `__dict__`.
+    This is the same check as in `Model.get_deferred_fields`.
+
+    Fields of instances that are being created are never deferred.
+
+    :param instance: A model instance.
+    :param field: A model field.
+
+    """
+    return (not instance._state.adding and
+            field.attname not in instance.__dict__)
+
+
+def load_deferred(instance, field):
+    """Fetch the raw value of a deferred field from the database
+
+    :param instance: A model instance.
+    :param field: A model field.
+    :return: Raw database value.
+
+    """
+    return (type(instance)._base_manager
+            .db_manager(instance._state.db)
+            .filter(pk=instance.pk)
+            .values_list(field.attname, flat=True)
+            .get())
+
+
+def compress_html(html):
+    """Compress html for a binary column
+
+    :param html: Html string.
+    :return: Zlib-compressed utf-8 bytes.
+
+    """
+    return zlib.compress(encoding.force_bytes(html))
+
+
+def decompress_html(value):
+    """Inverse of the `compress_html`
+
+    Values that were written before compression was turned on
+    are returned as is.
+
+    :param value: Raw database value (bytes, buffer, memoryview, or text).
+    :return: Html string.
+
+    """
+    if isinstance(value, six.text_type):
+        return value
+    value = bytes(value)
+    try:
+        return zlib.decompress(value).decode('utf-8')
+    except zlib.error:
+        return value.decode('utf-8')
 
 
 class HtmlCacheDescriptor(object):
@@ -27,10 +95,28 @@ class HtmlCacheDescriptor(object):
         check that the html that is being set to the `markdown._html` is clean.
 
         When getting html value, this class prepends
-        the md5 hash of the source string to the html data.
+        the md5 hash of the source string and the renderer fingerprint
+        to the html data.
 
         When setting html value, we check if the hash is correct.
         If the hash is correct, we set `is_dirty` flag to be false.
+        Html rendered by a renderer with different extensions
+        (or by an older version of this code) is considered dirty
+        and will be re-rendered on the first access to `html_force`.
+
+        Sources longer than the `S_MARKDOWN_BACKGROUND_RENDER['MIN_LENGTH']`
+        setting are not rendered on save. Instead, the previous html
+        (or escaped source) is saved with a `pending` mark instead of
+        the renderer fingerprint, and the render is queued
+        (see `RenderTask`). Pending html is considered clean.
+        Html of a render that exceeded its time budget (see `isolation`)
+        is saved as pending too, and the render is retried by the render
+        queue or the `rerender_markdown` command.
+
+        Both fields may be deferred (see `QuerySet.defer`). If the markdown
+        field is deferred, the html is kept in the instance `__dict__`
+        until the source is loaded. If the html field is deferred,
+        it is loaded on the first access to the markdown field.
 
         :param destination_field: Object to which the descriptor is pointing.
 
@@ -38,39 +124,64 @@ class HtmlCacheDescriptor(object):
         self.destination_field = destination_field
         self.self_field = self_field
 
-    def setup(self, instance, html=None):
-        """Set up the state if it's empty
+    def setup(self, instance, field):
+        """Attach cached html to the markdown object
 
-        We can't do that when the model instance is created because we have
-        no access to the initialization process. Thus, we set up the class
-        on first read/write operation.
+        Called by the `MarkdownDescriptor` each time the markdown object
+        is accessed. Loads the html if it is deferred.
 
         :param instance: A model instance.
-        :param html: Default html content.
+        :param field: The `Markdown` object of the instance.
 
         """
+        value = instance.__dict__.get(self.self_field.name)
 
-        markdown_cls = getattr(instance, self.destination_field.cls_name)
+        if value is self:
+            return
+        elif value is None:
+            if not is_deferred(instance, self.self_field):
+                return
+            value = load_deferred(instance, self.self_field)
 
-        if self.destination_field.name not in instance.__dict__:
-            instance.__dict__[self.destination_field.name] = markdown_cls(self.destination_field.renderer, '', html)
-        if self.self_field.name not in instance.__dict__:
-            instance.__dict__[self.self_field.name] = self
+        self.load(field, value)
+        instance.__dict__[self.self_field.name] = self
+
+        if field.is_dirty and not instance._state.adding:
+            self.self_field.enqueue_stale(instance)
 
     @staticmethod
-    def hash(string):
+    def hash(string, renderer=None):
         """Calculate and returns the hash of the source markdown data
 
         It is used to check that the cached data is up-to-date.
 
+        If the renderer is given, its fingerprint is added to the hash.
+        Thus, html rendered with another set of extensions
+        is considered dirty.
+
         :param string: A string that needs to be cached.
+        :param renderer: A renderer that is used to render the string.
         :return: A hash string.
 
         """
+        fingerprint = getattr(renderer, 'fingerprint', None)
+        if fingerprint is None:
+            return '<!-- %s -->' % HtmlCacheDescriptor.source_hash(string)
+        else:
+            return '<!-- %s %s -->' % (HtmlCacheDescriptor.source_hash(string),
+                                       fingerprint)
+
+    @staticmethod
+    def pending_hash(string):
+        """Returns the hash that marks html of a queued render"""
+        return '<!-- %s pending -->' % HtmlCacheDescriptor.source_hash(string)
+
+    @staticmethod
+    def source_hash(string):
         source = '%s\t%s' % (len(encoding.force_text(string)), encoding.force_text(string))
-        return '<!-- %s -->' % md5(source.encode()).hexdigest()
+        return md5(source.encode()).hexdigest()
 
-    hash_re = re.compile(r'^<!-- [a-zA-Z0-9]{32} -->')
+    hash_re = re.compile(r'^<!-- [a-zA-Z0-9]{32}( [a-zA-Z0-9]{32}| pending)? -->')
 
     @classmethod
     def split(cls, html):
@@ -86,31 +197,69 @@ class HtmlCacheDescriptor(object):
         else:
             return html[:hash_match.end()], html[hash_match.end():]
 
-    def __get__(self, instance, owner):
-        self.setup(instance, '')
-
-        field = instance.__dict__[self.destination_field.name]
+    def load(self, field, value):
+        """Set html of the markdown object from a raw database value
 
-        return self.hash(field.source) + field.html_force
+        The html is clean only if both the source hash and the renderer
+        fingerprint match. The source is hashed even if it was read
+        from the same row as the html, since queryset updates
+        (e.g. `QuerySet.update`) may change the source alone.
 
-    def __set__(self, instance, value):
-        self.setup(instance, '')
+        :param field: A `Markdown` object.
+        :param value: Html with the hash prepended.
 
+        """
         if value is None:
             value = ''
 
         hash_str, html = self.split(encoding.force_text(value))
 
-        field = instance.__dict__[self.destination_field.name]
-
         field._html = html
+        field._is_pending = False
 
         # Check that the cache is up-to-date
-        if hash_str == self.hash(field.source):
+        if hash_str == self.hash(field.source, field._renderer):
             field._is_dirty = False
+        elif hash_str == self.pending_hash(field.source):
+            field._is_dirty = False
+            field._is_pending = True
         else:
             field._is_dirty = True
 
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        field = getattr(instance, self.destination_field.name)
+
+        if field.is_dirty and self.self_field.render_in_background(field.source):
+            # Keep the previous html until the background render is done
+            field._html = field._html or fallback(field.source)
+            field._is_dirty = False
+            field._is_pending = True
+
+        if field.is_pending:
+            return self.pending_hash(field.source) + field.html
+
+        html = field.html_force
+        if isinstance(html, FallbackHtml):
+            # The render exceeded its time budget. The fallback is saved
+            # as pending, so it is not rendered again when it is loaded.
+            field._is_pending = True
+            return self.pending_hash(field.source) + html
+        else:
+            return self.hash(field.source, field._renderer) + html
+
+    def __set__(self, instance, value):
+        field = instance.__dict__.get(self.destination_field.name)
+        if isinstance(field, Markdown):
+            self.load(field, value)
+            instance.__dict__[self.self_field.name] = self
+        else:
+            # The markdown object is not built yet (or the source
+            # is deferred), so the hash is checked when it is built.
+            instance.__dict__[self.self_field.name] = value or ''
+
 
 class HtmlCacheField(TextField):
     def __init__(self, markdown_field, *args, **kwargs):
@@ -137,9 +286,33 @@ class HtmlCacheField(TextField):
         is not safe since we don't check the input.
         See the `HtmlCacheDescriptor` documentation.
 
+        :param derived: A dict that maps names of sibling model fields
+          to functions. Each function receives rendered html (without
+          the hash) and returns a value for its field. A value may also
+          be a pair `(name, function)`; then the function receives
+          the value of another derived field instead of the html. Derived fields are
+          updated whenever the model is saved and whenever the cache
+          is re-rendered in bulk. Functions should be defined
+          at the module level so that they can be serialized in migrations.
+        :param compress: Store zlib-compressed html in a binary column.
+          Values are compressed and decompressed transparently, so the
+          descriptor and bulk operations see plain html. Compressed
+          columns can't be searched with text lookups (`startswith`, etc.).
+          To compress an existing column, see the `compress_html_cache`
+          migration of `collective_blog`.
+        :param hash_field: Name of a sibling `CharField` that stores a copy
+          of the hash (see `HtmlCacheDescriptor.hash`). It is written along
+          with the html. Bulk operations and the render queue compare it to
+          check that the html wasn't changed since it was read
+          (see `unchanged`). Required for compressed fields, since their
+          hash can't be matched by prefix.
+
         """
         kwargs.update(dict(editable=False, blank=True, null=True, default=''))
         self.markdown_field = markdown_field
+        self.derived = kwargs.pop('derived', None) or {}
+        self.compress = kwargs.pop('compress', False)
+        self.hash_field = kwargs.pop('hash_field', None)
         super(HtmlCacheField, self).__init__(*args, **kwargs)
 
     def deconstruct(self):
@@ -148,9 +321,184 @@ class HtmlCacheField(TextField):
 
         if self.markdown_field is not None:
             kwargs.update(dict(markdown_field=self.markdown_field))
+        if self.derived:
+            kwargs.update(dict(derived=self.derived))
+        if self.compress:
+            kwargs.update(dict(compress=True))
+        if self.hash_field is not None:
+            kwargs.update(dict(hash_field=self.hash_field))
 
         return name, path, args, kwargs
 
+    def get_internal_type(self):
+        if self.compress:
+            return 'BinaryField'
+        return super(HtmlCacheField, self).get_internal_type()
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super(HtmlCacheField, self).get_db_prep_value(value, connection,
+                                                              prepared)
+        if self.compress and value is not None:
+            return connection.Database.Binary(compress_html(value))
+        return value
+
+    def get_db_converters(self, connection):
+        converters = super(HtmlCacheField, self).get_db_converters(connection)
+        if self.compress:
+            converters.append(self.decompress)
+        return converters
+
+    @staticmethod
+    def decompress(value, expression, connection, context):
+        if value is None:
+            return value
+        return decompress_html(value)
+
+    def derive(self, html):
+        """Compute values of derived fields
+
+        :param html: Rendered html without the hash.
+        :return: A dict that maps field names to their values.
+
+        """
+        values = {}
+        for name, func in self.derived.items():
+            if not isinstance(func, (tuple, list)):
+                values[name] = func(html)
+        for name, func in self.derived.items():
+            if isinstance(func, (tuple, list)):
+                source, func = func
+                values[name] = func(values[source])
+        return values
+
+    def update_derived(self, sender, instance, update_fields=None, **kwargs):
+        """Update derived fields and the hash field before the model
+        instance is saved"""
+        if update_fields is not None and self.name not in update_fields:
+            return
+        hash_str, html = HtmlCacheDescriptor.split(getattr(instance,
+                                                           self.name))
+        for name, value in self.derive(html).items():
+            setattr(instance, name, value)
+        if self.hash_field is not None:
+            setattr(instance, self.hash_field, hash_str)
+
+    @property
+    def hash_attname(self):
+        """Column to read the stored hash from (see `stored_hash`)"""
+        if self.hash_field is not None:
+            return self.model._meta.get_field(self.hash_field).attname
+        return self.attname
+
+    def stored_hash(self, value):
+        """Extract the hash from a value of the `hash_attname` column"""
+        if self.hash_field is not None:
+            return value or ''
+        return HtmlCacheDescriptor.split(value or '')[0]
+
+    def unchanged(self, hash_str):
+        """Build a filter for rows whose html still has the given hash
+
+        Writers that render html outside of a model save use it
+        to skip rows that were edited or re-rendered after they were read.
+
+        :param hash_str: The hash that was read (see `stored_hash`).
+        :return: A `Q` object.
+
+        """
+        if self.hash_field is not None:
+            condition = Q(**{self.hash_field: hash_str})
+            column = self.hash_field
+        elif self.compress:
+            raise exceptions.ImproperlyConfigured(
+                'Set `hash_field` of the compressed html cache field '
+                '%s.%s' % (self.model._meta.label, self.name))
+        else:
+            condition = Q(**{self.attname + '__startswith': hash_str})
+            column = self.attname
+
+        if not hash_str:
+            condition |= Q(**{column + '__isnull': True})
+
+        return condition
+
+    def render_in_background(self, source):
+        """Check if the source should be rendered by the render queue
+
+        See `RenderTask`.
+
+        """
+        config = getattr(settings, 'S_MARKDOWN_BACKGROUND_RENDER', None)
+        return config is not None and len(source) >= config.get('MIN_LENGTH', 0)
+
+    def enqueue_render(self, sender, instance, update_fields=None, **kwargs):
+        """Queue the render if pending html was saved"""
+        if update_fields is not None and self.name not in update_fields:
+            return
+        if getattr(settings, 'S_MARKDOWN_BACKGROUND_RENDER', None) is None:
+            return
+        field = instance.__dict__.get(self.markdown_field.name)
+        if isinstance(field, Markdown) and field.is_pending:
+            # The source may have changed, so the render gets all attempts
+            RenderTask.enqueue(self, instance.pk, reset_attempts=True)
+
+    def enqueue_stale(self, instance):
+        """Queue the render of stale html loaded from the database
+
+        Stale html (e.g. of another renderer) is rendered again on access
+        but is not written back, and neither are the derived fields that
+        are read without the html. If background rendering is on,
+        the render queue writes both (see `RenderTask.run`).
+        Otherwise, run the `check_markdown_cache` command.
+
+        A row is queued at most once per
+        `S_MARKDOWN_BACKGROUND_RENDER['STALE_INTERVAL']` seconds
+        (an hour by default), as marked in the default cache, so reads
+        don't write to the database each time they load stale html.
+
+        """
+        config = getattr(settings, 'S_MARKDOWN_BACKGROUND_RENDER', None)
+        if config is None:
+            return
+        key = 's_markdown:stale:%s.%s:%s' % (self.model._meta.label,
+                                             self.name, instance.pk)
+        if cache.add(key, True, config.get('STALE_INTERVAL', 60 * 60)):
+            RenderTask.enqueue(self, instance.pk)
+
+    def render(self, source):
+        """Render the source and wrap the result into a cache envelope
+
+        The result can be written to the database column directly.
+        Used for bulk operations that bypass model instances.
+
+        :param source: Source markdown string.
+        :return: Html with the hash prepended.
+
+        """
+        source = encoding.force_text(source)
+        renderer = self.markdown_field.renderer
+        html = renderer(source)
+        if isinstance(html, FallbackHtml):
+            # See `HtmlCacheDescriptor.__get__`
+            return HtmlCacheDescriptor.pending_hash(source) + html
+        return HtmlCacheDescriptor.hash(source, renderer) + html
+
+    def render_columns(self, source):
+        """Render the source and compute values of all dependent columns
+
+        :param source: Source markdown string.
+        :return: A dict that maps field names to their new values. Includes
+          this field and all derived fields.
+
+        """
+        envelope = self.render(source)
+        hash_str, html = HtmlCacheDescriptor.split(envelope)
+        columns = self.derive(html)
+        columns[self.name] = envelope
+        if self.hash_field is not None:
+            columns[self.hash_field] = hash_str
+        return columns
+
     def contribute_to_class(self, cls, name, *args, **kwargs):
         """Register the field and add ancillary attributes
 
@@ -161,7 +509,14 @@ class HtmlCacheField(TextField):
         super(HtmlCacheField, self).contribute_to_class(cls, name,
                                                         *args, **kwargs)
 
-        setattr(cls, self.name, HtmlCacheDescriptor(self, self.markdown_field))
+        self.descriptor = HtmlCacheDescriptor(self, self.markdown_field)
+        self.markdown_field._html_field = self
+
+        setattr(cls, self.name, self.descriptor)
+
+        if self.derived or self.hash_field is not None:
+            signals.pre_save.connect(self.update_derived, sender=cls)
+        signals.post_save.connect(self.enqueue_render, sender=cls)
 
 
 class ClsDescriptor(object):
@@ -188,21 +543,48 @@ class MarkdownDescriptor(object):
         no access to the initialization process. Thus, we set up the class
         on first read/write operation.
 
+        Model initialization stores the raw source in the instance `__dict__`
+        (see `__set__`), so the `Markdown` object is only built for fields
+        that are actually accessed.
+
+        If the field is deferred, the source is loaded from the database.
+
         :param instance: A model instance.
         :param value: Default source content.
 
         """
+        name = self.destination_field.name
+        field = instance.__dict__.get(name)
 
-        markdown_cls = getattr(instance, self.destination_field.cls_name)
+        if not isinstance(field, Markdown):
+            if name in instance.__dict__:
+                value = field
+            elif is_deferred(instance, self.destination_field):
+                value = load_deferred(instance, self.destination_field)
+
+            markdown_cls = getattr(instance, self.destination_field.cls_name)
+            field = markdown_cls(self.destination_field.renderer,
+                                 encoding.force_text(value or ''))
+            instance.__dict__[name] = field
 
-        if self.destination_field.name not in instance.__dict__:
-            instance.__dict__[self.destination_field.name] = markdown_cls(self.destination_field.renderer, value)
+        html_field = self.destination_field._html_field
+        if html_field is not None:
+            html_field.descriptor.setup(instance, field)
 
     def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
         self.setup(instance, '')
         return instance.__dict__[self.destination_field.name]
 
     def __set__(self, instance, value):
+        if (instance._state.adding and
+                self.destination_field.name not in instance.__dict__):
+            # Model initialization (e.g. `Model.from_db`)
+            instance.__dict__[self.destination_field.name] = value
+            return
+
         self.setup(instance, '')
 
         markdown_cls = getattr(instance, self.destination_field.cls_name)
@@ -211,7 +593,7 @@ class MarkdownDescriptor(object):
             instance.__dict__[self.destination_field.name] = value
         else:
             field = instance.__dict__[self.destination_field.name]
-            field._source = encoding.force_text(value)
+            field.source = encoding.force_text(value)
 
 
 class MarkdownField(TextField):
@@ -262,7 +644,9 @@ class MarkdownField(TextField):
         self.html_validators = kwargs.pop('html_validators', [])
 
         self.markdown_cls = kwargs.pop('markdown', Markdown)
-        self.renderer = kwargs.pop('renderer', BaseRenderer())
+        self.renderer = kwargs.pop('renderer', None)
+        if self.renderer is None:
+            self.renderer = get_renderer('default')
         self.cls_name = kwargs.pop('cls_name', None)
         self.renderer_name = kwargs.pop('renderer_name', None)
 
@@ -435,3 +819,148 @@ class MarkdownField(TextField):
         setattr(cls, self.cls_name, ClsDescriptor(self.markdown_cls))
         setattr(cls, self.renderer_name, self.renderer)
         setattr(cls, self.name, MarkdownDescriptor(self))
+
+
+class RenderTimeout(Exception):
+    """Raised by `RenderTask.run` if the render exceeded its time budget"""
+
+
+class RenderTask(models.Model):
+    """A queued render of a single html cache value
+
+    Tasks are created when pending html is saved
+    (see `HtmlCacheDescriptor`) and processed by the `render_queue`
+    management command.
+
+    A worker claims a task for a limited time (a lease) and removes it
+    once the html is written. If the worker fails or dies, or the render
+    exceeds its time budget, the task is claimed again when the lease
+    expires. The lease doubles with each attempt, so failing renders
+    back off.
+
+    """
+    field = models.CharField(max_length=255)
+    object_id = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+
+    # A random token of the worker that holds the lease
+    owner = models.CharField(max_length=32, blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    # Number of attempts after which the lease stops growing
+    backoff_steps = 6
+
+    class Meta:
+        unique_together = [('field', 'object_id')]
+        ordering = ['created', 'pk']
+
+    @classmethod
+    def enqueue(cls, field, pk, reset_attempts=False):
+        """Queue a render unless it is already queued
+
+        :param field: An `HtmlCacheField` instance.
+        :param pk: Primary key of the model instance.
+        :param reset_attempts: Reset the number of attempts of a queued
+          task, so a task that reached `max_attempts` is tried again.
+          Otherwise, renders that keep failing stay stopped.
+
+        """
+        label = '%s.%s' % (field.model._meta.label, field.name)
+
+        # A claimed task may be rendering the previous source. Releasing
+        # the lease keeps the task in the queue when that render is done.
+        queued = cls.objects.filter(field=label, object_id=str(pk))
+        values = dict(owner=None, claimed_at=None)
+        if reset_attempts:
+            values.update(attempts=0)
+        if queued.update(**values):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(field=label, object_id=str(pk))
+        except IntegrityError:
+            # Queued concurrently
+            pass
+
+    @classmethod
+    def available(cls, lease, max_attempts=None):
+        """Tasks that are not claimed or whose lease has expired
+
+        :param lease: Lease duration of the first attempt, a `timedelta`.
+        :param max_attempts: Skip tasks that were claimed this many times.
+
+        """
+        now = timezone.now()
+        expired = Q(claimed_at__isnull=True)
+        for attempt in range(1, cls.backoff_steps):
+            expired |= Q(attempts=attempt,
+                         claimed_at__lt=now - lease * 2 ** (attempt - 1))
+        expired |= Q(attempts__gte=cls.backoff_steps,
+                     claimed_at__lt=now - lease * 2 ** (cls.backoff_steps - 1))
+
+        tasks = cls.objects.filter(expired)
+        if max_attempts is not None:
+            tasks = tasks.filter(attempts__lt=max_attempts)
+        return tasks
+
+    def claim(self, lease):
+        """Take the task for the lease duration
+
+        :param lease: Lease duration, a `timedelta`.
+        :return: False if the task was taken by another worker.
+
+        """
+        owner = uuid.uuid4().hex
+        claimed = type(self).available(lease).filter(pk=self.pk).update(
+            owner=owner, claimed_at=timezone.now(),
+            attempts=models.F('attempts') + 1)
+        if claimed:
+            self.owner = owner
+        return claimed > 0
+
+    def done(self):
+        """Remove the claimed task from the queue
+
+        :return: False if the lease was lost (the task was claimed
+          by another worker or queued again).
+
+        """
+        return type(self).objects.filter(
+            pk=self.pk, owner=self.owner).delete()[0] > 0
+
+    def run(self):
+        """Render the html and write it unless it was changed in the meantime
+
+        :return: True if the html was written.
+
+        """
+        model_label, name = self.field.rsplit('.', 1)
+        field = apps.get_model(model_label)._meta.get_field(name)
+        manager = field.model._default_manager
+
+        row = (manager.filter(pk=self.object_id)
+               .values_list(field.markdown_field.attname, field.hash_attname)
+               .first())
+        if row is None:
+            return False
+
+        source = row[0] or ''
+        hash_str = field.stored_hash(row[1])
+        if hash_str == HtmlCacheDescriptor.hash(source,
+                                                field.markdown_field.renderer):
+            # Rendered by a model save in the meantime
+            return False
+
+        columns = field.render_columns(source)
+        if columns[field.name].startswith(
+                HtmlCacheDescriptor.pending_hash(source)):
+            # Keep the task; it is retried when the lease expires
+            raise RenderTimeout('Render of %s %s exceeded its time budget' %
+                                (self.field, self.object_id))
+
+        # If the row doesn't hold the html that was read, it was
+        # re-rendered or edited (and queued again) in the meantime.
+        return manager.filter(field.unchanged(hash_str),
+                              pk=self.object_id).update(**columns) > 0
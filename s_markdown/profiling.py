@@ -0,0 +1,173 @@
+"""Per-extension render profiling
+
+When the `S_MARKDOWN_PROFILING` setting is true, renderers time every
+preprocessor, block processor, inline pattern, treeprocessor and
+postprocessor of their `markdown.Markdown` instances.
+
+Timings are inclusive: nested block processors are counted in their
+parents as well, and the `inline` treeprocessor includes the time
+spent in all inline patterns.
+
+After each render, its timings are added to the per-renderer totals
+(see `get_profile`) and logged to the `s_markdown.profiling` logger
+as a single json line.
+
+Use the `profile_markdown` command to profile renderers
+on the contents of the database.
+
+"""
+
+from django.conf import settings
+
+from timeit import default_timer
+import json
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return getattr(settings, 'S_MARKDOWN_PROFILING', False)
+
+
+class Profile(object):
+    def __init__(self):
+        """Aggregated timings of a renderer
+
+        Timings are stored as a dict that maps `(kind, name)` pairs
+        to `[calls, seconds]` lists.
+
+        """
+        self.renders = 0
+        self.seconds = 0
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def add(self, seconds, timings):
+        """Add timings of a single render"""
+        with self._lock:
+            self.renders += 1
+            self.seconds += seconds
+            for key, (calls, elapsed) in timings.items():
+                total = self.timings.setdefault(key, [0, 0])
+                total[0] += calls
+                total[1] += elapsed
+
+    def clear(self):
+        with self._lock:
+            self.renders = 0
+            self.seconds = 0
+            self.timings = {}
+
+    def as_dict(self):
+        """Returns the profile in a json-serializable form"""
+        with self._lock:
+            return {
+                'renders': self.renders,
+                'seconds': self.seconds,
+                'timings': [
+                    {'kind': kind, 'name': name,
+                     'calls': calls, 'seconds': elapsed}
+                    for (kind, name), (calls, elapsed)
+                    in sorted(self.timings.items(),
+                              key=lambda item: -item[1][1])
+                ],
+            }
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_profile(renderer):
+    """Returns aggregated timings of the renderer"""
+    with _profiles_lock:
+        return _profiles.setdefault(renderer.fingerprint, Profile())
+
+
+def _timed(timings, key, func):
+    """Wrap a function so that its calls are recorded in timings"""
+    def wrapper(*args, **kwargs):
+        start = default_timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = timings.setdefault(key, [0, 0])
+            total[0] += 1
+            total[1] += default_timer() - start
+    return wrapper
+
+
+class _TimedRegExp(object):
+    """Compiled regexp proxy that times matching"""
+
+    def __init__(self, regexp, timings, key):
+        self.regexp = regexp
+        self.match = _timed(timings, key, regexp.match)
+
+    def __getattr__(self, name):
+        return getattr(self.regexp, name)
+
+
+def instrument(md):
+    """Time all processors of a `markdown.Markdown` instance
+
+    Processors are instrumented in place. Timings are collected
+    into the `s_markdown_timings` dict of the instance.
+
+    :param md: A `markdown.Markdown` instance.
+
+    """
+    timings = md.s_markdown_timings = {}
+
+    for name, processor in md.preprocessors.items():
+        key = ('preprocessor', name)
+        processor.run = _timed(timings, key, processor.run)
+
+    for name, processor in md.parser.blockprocessors.items():
+        key = ('blockprocessor', name)
+        processor.test = _timed(timings, key, processor.test)
+        processor.run = _timed(timings, key, processor.run)
+
+    for name, pattern in md.inlinePatterns.items():
+        key = ('pattern', name)
+        regexp = _TimedRegExp(pattern.getCompiledRegExp(), timings, key)
+        pattern.getCompiledRegExp = lambda regexp=regexp: regexp
+        pattern.handleMatch = _timed(timings, key, pattern.handleMatch)
+
+    for name, processor in md.treeprocessors.items():
+        key = ('treeprocessor', name)
+        processor.run = _timed(timings, key, processor.run)
+
+    for name, processor in md.postprocessors.items():
+        key = ('postprocessor', name)
+        processor.run = _timed(timings, key, processor.run)
+
+
+def record(renderer, md, text, seconds):
+    """Add timings of the last render to the renderer profile and log them
+
+    :param renderer: A `BaseRenderer` instance.
+    :param md: An instrumented `markdown.Markdown` instance.
+    :param text: Source markdown string.
+    :param seconds: Total render time.
+
+    """
+    timings = dict(md.s_markdown_timings)
+    md.s_markdown_timings.clear()
+
+    get_profile(renderer).add(seconds, timings)
+
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    logger.info(json.dumps({
+        'event': 'markdown_render',
+        'renderer': renderer.fingerprint,
+        'length': len(text),
+        'seconds': seconds,
+        'timings': dict(('%s:%s' % key, elapsed)
+                        for key, (calls, elapsed) in timings.items()),
+    }, sort_keys=True))
@@ -0,0 +1,101 @@
+"""Shared renderers
+
+Renderers with equal fingerprints produce the same html, so there is
+no need to keep more than one of them. Each renderer builds its own
+`markdown.Markdown` instances (one per thread), and building one
+compiles every extension and inline pattern. Models that use identical
+extension stacks should therefore share one renderer.
+
+`intern` returns the shared instance for the configuration of the given
+renderer. `get_renderer` returns the shared renderer of a named profile:
+
+    content = MarkdownField(renderer=get_renderer('post'))
+
+Shared renderers deconstruct exactly as freshly built ones,
+so switching a field to the registry doesn't change its migrations.
+
+"""
+
+import threading
+
+from .renderer import BaseRenderer
+from .extensions import (FencedCodeExtension,
+                         EscapeHtmlExtension,
+                         SemiSaneListExtension,
+                         StrikethroughExtension,
+                         AutomailExtension,
+                         AutolinkExtension,
+                         CommentExtension,
+                         CutExtension)
+
+
+def _extensions(*extra):
+    """Extensions shared by all user content"""
+    return [
+        'markdown.extensions.smarty',
+        'markdown.extensions.abbr',
+        'markdown.extensions.def_list',
+        'markdown.extensions.tables',
+        'markdown.extensions.smart_strong',
+        FencedCodeExtension(),
+        EscapeHtmlExtension(),
+        SemiSaneListExtension(),
+        StrikethroughExtension(),
+        AutolinkExtension(),
+        AutomailExtension(),
+    ] + list(extra)
+
+
+# Renderer factories by profile name
+profiles = {
+    'default': lambda: BaseRenderer(),
+    'post': lambda: BaseRenderer(
+        extensions=_extensions(CutExtension(anchor='cut'))),
+    'comment': lambda: BaseRenderer(
+        extensions=_extensions(CommentExtension())),
+    'bio': lambda: BaseRenderer(
+        extensions=_extensions(CommentExtension())),
+}
+
+_renderers = {}
+_named = {}
+_lock = threading.Lock()
+
+
+def intern(renderer):
+    """Returns the shared renderer with the same configuration
+
+    If there is no such renderer, the given one becomes shared.
+
+    :param renderer: A `BaseRenderer` instance.
+
+    """
+    key = (type(renderer), renderer.fingerprint)
+    with _lock:
+        return _renderers.setdefault(key, renderer)
+
+
+def register(name, factory):
+    """Add a named profile
+
+    :param name: Profile name.
+    :param factory: A callable that builds a renderer.
+
+    """
+    with _lock:
+        profiles[name] = factory
+        _named.pop(name, None)
+
+
+def get_renderer(name):
+    """Returns the shared renderer of the named profile
+
+    :raise KeyError: If there is no such profile.
+
+    """
+    renderer = _named.get(name)
+    if renderer is None:
+        renderer = intern(profiles[name]())
+        with _lock:
+            renderer = _named.setdefault(name, renderer)
+    return renderer
@@ -1,30 +1,196 @@
 """Markdown renderers"""
 
 from django.utils.deconstruct import deconstructible
+from django.utils import encoding
+
+from hashlib import md5
+from timeit import default_timer
+import threading
 
 import markdown
 
+from .cache import get_render_cache
+from .isolation import get_isolated_renderer, fallback
+from . import profiling
+from . import incremental
+
+
+def describe(value):
+    """Build a stable text representation of a deconstructible value
+
+    Used to fingerprint renderer configurations. Unlike `repr`, the result
+    doesn't depend on object addresses or dict ordering.
+
+    """
+    if hasattr(value, 'deconstruct') and not isinstance(value, type):
+        path, args, kwargs = value.deconstruct()
+        return '%s(%s, %s)' % (path, describe(args), describe(kwargs))
+    elif isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(describe(v) for v in value)
+    elif isinstance(value, dict):
+        return '{%s}' % ', '.join(sorted('%s: %s' % (describe(k), describe(v))
+                                         for k, v in value.items()))
+    else:
+        return encoding.force_text(value)
+
 
 @deconstructible
-class BaseRenderer(markdown.Markdown):
-    # TODO test renderer and extensions
+class BaseRenderer(object):
+    # TODO test extensions
     def __init__(self, *args, **kwargs):
         """Default markdown renderer
 
         It's required that you add one renderer for each markdown field.
 
-        We need to subclass `markdown.Markdown` in order to provide
-        serialization and the `__call__` method.
+        All arguments are passed to the `markdown.Markdown` constructor.
+
+        `markdown.Markdown` instances are stateful (they hold the html stash,
+        link references, etc.) so one instance can't be shared between
+        threads. Instead, the renderer keeps a pool of `markdown.Markdown`
+        instances: one instance is lazily built for each thread that uses
+        the renderer. All instances are built from the same arguments,
+        so the renderer is deconstructed exactly as before.
+
+        :param version: Renderer version. It is a part of the `fingerprint`.
+          Bump it to invalidate all html rendered by this renderer
+          (e.g. when you update pygments).
 
         """
+        self.version = kwargs.pop('version', None)
         self.__args = args
         self.__kwargs = kwargs
-        super(BaseRenderer, self).__init__(*args, **kwargs)
+        self.__local = threading.local()
+        self.__fingerprint = None
+
+    def __getstate__(self):
+        """Pickle the configuration only, not the pool"""
+        state = self.__dict__.copy()
+        del state['_BaseRenderer__local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__local = threading.local()
+
+    @property
+    def fingerprint(self):
+        """A hash of the renderer configuration
+
+        It is derived from the deconstructed arguments (the extension list,
+        mostly) and the `version`. Two renderers with equal fingerprints
+        are expected to produce the same html.
+
+        """
+        if self.__fingerprint is None:
+            config = describe([self.__args, self.__kwargs, self.version])
+            self.__fingerprint = md5(config.encode('utf-8')).hexdigest()
+        return self.__fingerprint
+
+    def get_markdown(self):
+        """Returns a `markdown.Markdown` instance owned by the current thread
+
+        The instance is created on the first call. It is rebuilt
+        when profiling is turned on or off (see `s_markdown.profiling`).
+
+        """
+        md = getattr(self.__local, 'md', None)
+        profiled = profiling.is_enabled()
+        if md is None or self.__local.profiled != profiled:
+            md = markdown.Markdown(*self.__args, **self.__kwargs)
+            if profiled:
+                profiling.instrument(md)
+            self.__local.md = md
+            self.__local.profiled = profiled
+        return md
+
+    def convert(self, text):
+        """Convert markdown to html using the current thread's instance
+
+        The instance is reset after each conversion so no state leaks
+        from one document to another.
+
+        """
+        md = self.get_markdown()
+        start = default_timer()
+        try:
+            return md.convert(text)
+        finally:
+            md.reset()
+            if self.__local.profiled:
+                profiling.record(self, md, text, default_timer() - start)
+
+    def render(self, text):
+        """Convert markdown to html in a worker process if isolation is on
+
+        See `s_markdown.isolation`.
+
+        :return: Html or None if the render exceeded its time budget.
+
+        """
+        isolated = get_isolated_renderer()
+        if isolated is None:
+            return self.convert(text)
+        else:
+            return isolated.convert(self, text)
+
+    def render_blocks(self, blocks, cache):
+        """Render blocks that are not in the cache and join the results
+
+        :param blocks: Block sources (see `s_markdown.incremental.split`).
+        :param cache: The render cache.
+        :return: Html or None if any block exceeded its time budget.
+
+        """
+        parts = []
+
+        for block in blocks:
+            html = cache.get(self, block)
+            if html is None:
+                html = self.render(block)
+                if html is None:
+                    return None
+                cache.set(self, block, html)
+            if html:
+                parts.append(html)
+
+        return '\n'.join(parts)
 
     def __call__(self, text):
         """Convert markdown to serialized XHTML or HTML
 
         Note that this method is not guaranteed to return clean html.
 
+        If the render cache is enabled (see `s_markdown.cache`),
+        identical sources are rendered only once.
+
+        Long sources are rendered block by block if incremental
+        rendering is enabled (see `s_markdown.incremental`).
+
+        If the render exceeds its time budget, the source is returned
+        as escaped plain text (see `isolation.FallbackHtml`). Such results
+        are not cached.
+
         """
-        return self.convert(text)
+        cache = get_render_cache()
+
+        if cache is not None:
+            html = cache.get(self, text)
+            if html is not None:
+                return html
+
+        blocks = None
+        if cache is not None and incremental.is_enabled(text):
+            blocks = incremental.split(self.get_markdown(), text)
+
+        if blocks is not None:
+            html = self.render_blocks(blocks, cache)
+        else:
+            html = self.render(text)
+
+        if html is None:
+            return fallback(text)
+
+        if cache is not None:
+            cache.set(self, text, html)
+
+        return html
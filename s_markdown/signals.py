@@ -0,0 +1,8 @@
+"""Markdown signals"""
+
+from django.dispatch import Signal
+
+
+# Sent when an isolated render exceeds its time budget
+# (see `s_markdown.isolation`). The sender is the renderer.
+render_timeout = Signal(providing_args=['source', 'timeout'])
@@ -0,0 +1,75 @@
+/**
+ * Live preview for a CodeMirror markdown editor
+ *
+ * The source is sent to the server only after the user stops typing
+ * for `delay` milliseconds. Responses to outdated requests are ignored.
+ *
+ * @param editor: A CodeMirror instance.
+ * @param target: An element in which the preview is rendered.
+ * @param url: Url of the preview endpoint.
+ * @param field: Label of the markdown field, e.g. `collective_blog.Post.content`.
+ * @param delay: Debounce delay in milliseconds.
+ */
+function MarkdownPreview(editor, target, url, field, delay) {
+    var self = this;
+
+    self._init = function () {
+        self.editor = editor;
+        self.target = target;
+        self.url = url;
+        self.field = field;
+        self.delay = delay || 500;
+
+        self.timeout = null;
+        self.sent_source = null;
+        self.request_id = 0;
+
+        self.editor.on('change', self._onChange);
+        self._send();
+    };
+
+    self._onChange = function () {
+        if (self.timeout !== null) {
+            clearTimeout(self.timeout);
+        }
+        self.timeout = setTimeout(self._send, self.delay);
+    };
+
+    self._csrfToken = function () {
+        var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]*)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    };
+
+    self._send = function () {
+        self.timeout = null;
+
+        var source = self.editor.getValue();
+        if (source === self.sent_source) {
+            return;
+        }
+        self.sent_source = source;
+
+        var request_id = ++self.request_id;
+
+        var request = new XMLHttpRequest();
+        request.open('POST', self.url);
+        request.setRequestHeader('Content-Type', 'application/x-www-form-urlencoded');
+        request.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+        request.setRequestHeader('X-CSRFToken', self._csrfToken());
+        request.onload = function () {
+            if (request_id !== self.request_id) {
+                return;
+            }
+            if (request.status === 200) {
+                self.target.innerHTML = JSON.parse(request.responseText).html;
+            } else {
+                // Let the next edit retry
+                self.sent_source = null;
+            }
+        };
+        request.send('field=' + encodeURIComponent(self.field) +
+                     '&source=' + encodeURIComponent(source));
+    };
+
+    self._init();
+}
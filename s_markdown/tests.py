@@ -6,15 +6,46 @@ as it is the only thing that denormalizes the database.
 
 """
 
-from django.test import TransactionTestCase
+from django.test import (TestCase, TransactionTestCase, SimpleTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
 from django.core import validators
 from django.core import exceptions
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db import models
+from django.utils import six, timezone
 
 from django_fake_model.models import FakeModel
 
-from .models import MarkdownField, HtmlCacheField, HtmlCacheDescriptor
+from .models import (compress_html, decompress_html,
+                     MarkdownField, HtmlCacheField, HtmlCacheDescriptor,
+                     RenderTask)
 from .datatype import Markdown
 from .renderer import BaseRenderer
+from .cache import LRUCache, get_render_cache
+from .management.commands.rerender_markdown import Command as RerenderCommand
+from .management.commands.profile_markdown import Command as ProfileCommand
+from .management.commands.render_queue import Command as RenderQueueCommand
+from .management.commands.check_markdown_cache import Command as CheckCommand
+from .extensions import FencedCodeExtension, CutExtension
+from .extensions.fenced_code import highlight_cache, get_lexer
+from .signals import render_timeout
+from .profiling import get_profile
+from .registry import get_renderer, intern
+from .benchmarks import corpus, suite
+from .text import plain_text, word_count
+from . import bulk, incremental
+
+import datetime
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
 
 
 def md_validator(markdown):
@@ -35,6 +66,10 @@ class MarkdownDerived(Markdown):
     pass
 
 
+def html_length(html):
+    return len(html)
+
+
 class TestModel(FakeModel):
     """A model for test app"""
 
@@ -46,7 +81,8 @@ class TestModel(FakeModel):
     default3 = MarkdownField(default=Markdown(BaseRenderer(), 'Default', 'Html'))
 
     cached = MarkdownField(markdown=MarkdownDerived, blank=True)
-    cached_c = HtmlCacheField(cached)
+    cached_c = HtmlCacheField(cached, derived={'cached_length': html_length})
+    cached_length = models.IntegerField(null=True)
 
     html_validated = MarkdownField(html_validators=[validators.RegexValidator(r'!', inverse_match=True)], blank=True)
 
@@ -216,12 +252,28 @@ class MarkdownModelFieldTest(TransactionTestCase):
         self.assertEqual(test.cached.html, 'Cache is broken!')
         self.assertTrue(test.cached.is_dirty)
 
-        test.cached_c = HtmlCacheDescriptor.hash(source) + source
+        test.cached_c = HtmlCacheDescriptor.hash(source, test.cached_renderer) + source
 
         self.assertEqual(test.cached.source, source)
         self.assertEqual(test.cached.html, source)
         self.assertFalse(test.cached.is_dirty)
 
+    def test_renderer_fingerprint(self):
+        """Test that html rendered by another renderer is considered dirty"""
+        test = TestModel(raw='Source', raw2='Source2', cached='String')
+        source = test.cached.source
+
+        # No fingerprint (html rendered before fingerprints were introduced)
+        test.cached_c = HtmlCacheDescriptor.hash(source) + source
+        self.assertTrue(test.cached.is_dirty)
+
+        renderer = BaseRenderer(version=2)
+        test.cached_c = HtmlCacheDescriptor.hash(source, renderer) + source
+        self.assertTrue(test.cached.is_dirty)
+
+        test.cached_c = test.cached_c
+        self.assertFalse(test.cached.is_dirty)
+
     def test_cache_hash(self):
         """Test that hashing and splitting function works correctly"""
         source1 = 'string 1'
@@ -250,6 +302,208 @@ class MarkdownModelFieldTest(TransactionTestCase):
         self.assertEqual(_source2, str(source2))
         self.assertNotEqual(hash1, hash2)
 
+    def test_rerender_command(self):
+        """Test that `rerender_markdown` refreshes html cache"""
+        tests = [TestModel.objects.create(raw='Source', raw2='Source2',
+                                          cached='*%s*' % i)
+                 for i in range(5)]
+
+        TestModel.objects.update(cached_c='<!-- stale -->')
+
+        RerenderCommand().run([TestModel._meta.get_field('cached_c')],
+                              batch_size=2, verbosity=0)
+
+        for i, test in enumerate(tests):
+            test = TestModel.objects.get(pk=test.pk)
+            self.assertFalse(test.cached.is_dirty)
+            self.assertEqual(test.cached.html, '<p><em>%s</em></p>' % i)
+
+    def test_check_command(self):
+        """Test that `check_markdown_cache` finds and repairs stale html"""
+        tests = [TestModel.objects.create(raw='Source', raw2='Source2',
+                                          cached='*%s*' % i)
+                 for i in range(5)]
+        field = TestModel._meta.get_field('cached_c')
+
+        # Html of another source, e.g. after a queryset update of the source
+        stale = HtmlCacheDescriptor.hash('Other', field.markdown_field.renderer)
+        TestModel.objects.filter(pk__in=[tests[1].pk, tests[3].pk]).update(
+            cached_c=stale + 'Stale')
+        self.assertTrue(TestModel.objects.get(pk=tests[1].pk).cached.is_dirty)
+
+        stats = CheckCommand().run([field], batch_size=2, dry_run=True,
+                                   verbosity=0)
+        self.assertEqual(stats['django_fake_models.TestModel.cached_c'],
+                         dict(checked=5, stale=2, pending=0, repaired=0))
+        self.assertEqual(TestModel.objects.values_list('cached_c', flat=True)
+                         .get(pk=tests[1].pk), stale + 'Stale')
+
+        stats = CheckCommand().run([field], batch_size=2, verbosity=0)
+        self.assertEqual(stats['django_fake_models.TestModel.cached_c'],
+                         dict(checked=5, stale=2, pending=0, repaired=2))
+        for i, test in enumerate(tests):
+            test = TestModel.objects.get(pk=test.pk)
+            self.assertEqual(test.cached.html, '<p><em>%s</em></p>' % i)
+            self.assertEqual(test.cached_length, len(test.cached.html))
+
+    def test_derived_fields(self):
+        """Test that derived fields follow the html cache"""
+        test = TestModel.objects.create(raw='Source', raw2='Source2',
+                                        cached='*Text*')
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertEqual(test.cached_length, len('<p><em>Text</em></p>'))
+
+        test.cached = 'Text'
+        test.save(update_fields=['raw'])
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertEqual(test.cached_length, len('<p><em>Text</em></p>'))
+
+        TestModel.objects.update(cached_c='<!-- stale -->', cached_length=None)
+        RerenderCommand().run([TestModel._meta.get_field('cached_c')],
+                              verbosity=0)
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertEqual(test.cached_length, len('<p><em>Text</em></p>'))
+
+    def test_deferred_source(self):
+        """Test that the source is loaded on the first access"""
+        test = TestModel.objects.create(raw='Source', raw2='Source2',
+                                        cached='*Text*')
+
+        test = TestModel.objects.defer('cached').get(pk=test.pk)
+        self.assertIn('cached', test.get_deferred_fields())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(test.cached.source, '*Text*')
+            self.assertFalse(test.cached.is_dirty)
+            self.assertEqual(test.cached.html, '<p><em>Text</em></p>')
+
+        self.assertEqual(test.get_deferred_fields(), set())
+
+    def test_deferred_html(self):
+        """Test that the html is loaded with the source"""
+        test = TestModel.objects.create(raw='Source', raw2='Source2',
+                                        cached='*Text*')
+
+        test = TestModel.objects.only('raw').get(pk=test.pk)
+
+        with self.assertNumQueries(2):
+            self.assertFalse(test.cached.is_dirty)
+            self.assertEqual(test.cached.html, '<p><em>Text</em></p>')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(test.raw.source, 'Source')
+
+        test = TestModel.objects.defer('cached_c').get(pk=test.pk)
+        test.cached = '*New text*'
+        test.save()
+
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertFalse(test.cached.is_dirty)
+        self.assertEqual(test.cached.html, '<p><em>New text</em></p>')
+
+    def test_lazy_setup(self):
+        """Test that markdown objects of loaded rows are built on access"""
+        test = TestModel.objects.create(raw='Source', raw2='Source2',
+                                        cached='*Text*')
+
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertNotIsInstance(test.__dict__['cached'], Markdown)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(test.cached.is_dirty)
+            self.assertEqual(test.cached.html, '<p><em>Text</em></p>')
+        self.assertIsInstance(test.__dict__['cached'], MarkdownDerived)
+
+        # Html of another renderer is dirty even if the source is the same
+        renderer = BaseRenderer(version=2)
+        TestModel.objects.update(
+            cached_c=HtmlCacheDescriptor.hash('*Text*', renderer) + 'Old')
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertTrue(test.cached.is_dirty)
+
+        test = TestModel.objects.get(pk=test.pk)
+        test.cached = '*New text*'
+        self.assertTrue(test.cached.is_dirty)
+        test.save()
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertEqual(test.cached.html, '<p><em>New text</em></p>')
+
+    def test_update_cache_edited(self):
+        """Test that bulk updates don't overwrite html of edited rows"""
+        test = TestModel.objects.create(raw='Source', raw2='Source2',
+                                        cached='*Old*')
+        field = TestModel._meta.get_field('cached_c')
+        columns = field.render_columns('*Old*')
+        old_hash = HtmlCacheDescriptor.split(test.cached_c)[0]
+
+        test.cached = '*New*'
+        test.save()
+
+        bulk.update_cache(field, [(test.pk, columns)],
+                          hashes={test.pk: old_hash})
+        test = TestModel.objects.get(pk=test.pk)
+        self.assertFalse(test.cached.is_dirty)
+        self.assertEqual(test.cached.html, '<p><em>New</em></p>')
+
+        TestModel.objects.update(cached_length=None)
+        new_hash = HtmlCacheDescriptor.split(test.cached_c)[0]
+        bulk.update_cache(field, [(test.pk, field.render_columns('*New*'))],
+                          hashes={test.pk: new_hash})
+        self.assertEqual(TestModel.objects.get(pk=test.pk).cached_length,
+                         len('<p><em>New</em></p>'))
+
+    def test_pickle(self):
+        """Test that markdown objects are pickled with all protocols"""
+        markdown = Markdown(BaseRenderer(), '*Text*')
+        markdown.compile()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(markdown, protocol))
+            self.assertEqual(copy.source, '*Text*')
+            self.assertEqual(copy.html, '<p><em>Text</em></p>')
+            self.assertFalse(copy.is_dirty)
+
+        # State pickled before `_is_pending` was added
+        state = markdown.__getstate__()
+        del state['_is_pending']
+        copy = Markdown.__new__(Markdown)
+        copy.__setstate__(state)
+        self.assertFalse(copy.is_pending)
+
+    def test_profile_command(self):
+        """Test that `profile_markdown` renders rows of the given fields"""
+        for i in range(3):
+            TestModel.objects.create(raw='Source', raw2='Source2',
+                                     cached='*%s*' % i)
+
+        profiles = ProfileCommand().run([TestModel._meta.get_field('cached')],
+                                        limit=2)
+
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['renders'], 2)
+        self.assertEqual(profiles[0]['fields'],
+                         ['django_fake_models.TestModel.cached'])
+
+    def test_rerender_command_checkpoint(self):
+        """Test that `rerender_markdown` resumes from a checkpoint"""
+        tests = [TestModel.objects.create(raw='Source', raw2='Source2',
+                                          cached='*%s*' % i)
+                 for i in range(5)]
+
+        TestModel.objects.update(cached_c='<!-- stale -->')
+
+        fd, checkpoint = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'django_fake_models.TestModel.cached_c': tests[1].pk}, f)
+
+        RerenderCommand().run([TestModel._meta.get_field('cached_c')],
+                              checkpoint=checkpoint, verbosity=0)
+
+        self.assertFalse(os.path.exists(checkpoint))
+
+        for i, test in enumerate(tests):
+            test = TestModel.objects.get(pk=test.pk)
+            self.assertEqual(test.cached.is_dirty, i <= 1)
+
     def test_contribute_to_class(self):
         test = TestModel(raw='Source', raw2='Source2')
 
@@ -259,3 +513,668 @@ class MarkdownModelFieldTest(TransactionTestCase):
         self.assertIs(test.default2_cls, Markdown)
         self.assertIs(test.default3_cls, Markdown)
         self.assertIs(test.cached_cls, MarkdownDerived)
+
+
+@override_settings(S_MARKDOWN_BACKGROUND_RENDER={'MIN_LENGTH': 10})
+class RenderQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='queue')
+        cache.clear()
+
+    def test_queue(self):
+        """Test that long sources are rendered by the queue"""
+        from collective_blog.models import Post
+
+        post = Post.objects.create(author=self.user, heading='Queue',
+                                   content='*Long enough* <b>')
+
+        post = Post.objects.get(pk=post.pk)
+        self.assertTrue(post.content.is_pending)
+        self.assertFalse(post.content.is_dirty)
+        self.assertEqual(post.content.html_force,
+                         '<p>*Long enough* &lt;b&gt;</p>')
+        self.assertEqual(post.content_before_cut(), post.content.html)
+        self.assertEqual(RenderTask.objects.count(), 1)
+
+        self.assertEqual(RenderQueueCommand().run(verbosity=0), 1)
+        self.assertEqual(RenderTask.objects.count(), 0)
+
+        post = Post.objects.get(pk=post.pk)
+        self.assertFalse(post.content.is_pending)
+        self.assertFalse(post.content.is_dirty)
+        self.assertEqual(post.content.html,
+                         '<p><em>Long enough</em> &lt;b&gt;</p>')
+        self.assertEqual(post.content_before_cut(), post.content.html)
+
+    def test_edited(self):
+        """Test that stale renders are not written"""
+        from collective_blog.models import Post
+
+        post = Post.objects.create(author=self.user, heading='Queue',
+                                   content='*Long enough*')
+        post.content = 'Short'
+        post.save()
+
+        self.assertFalse(post.content.is_pending)
+        self.assertEqual(RenderTask.objects.count(), 1)
+
+        RenderQueueCommand().run(verbosity=0)
+
+        post = Post.objects.get(pk=post.pk)
+        self.assertFalse(post.content.is_dirty)
+        self.assertEqual(post.content.html, '<p>Short</p>')
+
+    def test_stale(self):
+        """Test that stale html found on load is re-rendered with derived
+        fields"""
+        from collective_blog.models import Post
+
+        post = Post.objects.create(author=self.user, heading='Queue',
+                                   content='*Short*')
+        # Rendered before the renderer was changed
+        old_hash = HtmlCacheDescriptor.hash('*Short*',
+                                            BaseRenderer(version='old'))
+        Post.objects.update(_content_html=old_hash + '<p>Old</p>',
+                            _content_hash=old_hash,
+                            _content_excerpt='<p>Old</p>')
+
+        post = Post.objects.get(pk=post.pk)
+        self.assertTrue(post.content.is_dirty)
+        self.assertEqual(RenderTask.objects.count(), 1)
+
+        # Later loads don't write, and don't reset the attempts
+        RenderTask.objects.update(attempts=3)
+        with self.assertNumQueries(1):
+            post = Post.objects.get(pk=post.pk)
+            self.assertTrue(post.content.is_dirty)
+        cache.clear()
+        post = Post.objects.get(pk=post.pk)
+        self.assertTrue(post.content.is_dirty)
+        self.assertEqual(RenderTask.objects.get().attempts, 3)
+
+        self.assertEqual(RenderQueueCommand().run(verbosity=0), 1)
+        post = Post.objects.get(pk=post.pk)
+        self.assertFalse(post.content.is_dirty)
+        self.assertEqual(post.content_before_cut(), '<p><em>Short</em></p>')
+        self.assertEqual(RenderTask.objects.count(), 0)
+
+    def test_retry(self):
+        """Test that failed tasks are retried when their lease expires"""
+        RenderTask.objects.create(field='collective_blog.Post.missing',
+                                  object_id='1')
+        command = RenderQueueCommand(stderr=six.StringIO())
+
+        self.assertEqual(command.run(verbosity=0, lease=60), 1)
+        self.assertEqual(RenderTask.objects.get().attempts, 1)
+
+        # The lease is still held
+        self.assertEqual(command.run(verbosity=0, lease=60), 0)
+
+        self.assertEqual(command.run(verbosity=0, lease=0), 1)
+        self.assertEqual(command.run(verbosity=0, lease=0, max_attempts=2), 0)
+        self.assertEqual(RenderTask.objects.get().attempts, 2)
+
+        # The lease doubles with each attempt
+        claimed = timezone.now() - datetime.timedelta(seconds=90)
+        RenderTask.objects.update(claimed_at=claimed)
+        self.assertEqual(command.run(verbosity=0, lease=60), 0)
+        RenderTask.objects.update(claimed_at=claimed - datetime.timedelta(
+            seconds=60))
+        self.assertEqual(command.run(verbosity=0, lease=60), 1)
+
+    def test_requeued(self):
+        """Test that tasks queued again while claimed are kept"""
+        from collective_blog.models import Post
+
+        post = Post.objects.create(author=self.user, heading='Queue',
+                                   content='*Long enough*')
+        task = RenderTask.objects.get()
+        self.assertTrue(task.claim(datetime.timedelta(minutes=1)))
+        self.assertFalse(task.claim(datetime.timedelta(minutes=1)))
+
+        post.content = '*Long enough again*'
+        post.save()
+
+        self.assertTrue(task.run())
+        self.assertFalse(task.done())
+        self.assertEqual(RenderTask.objects.count(), 1)
+
+
+class CompressedCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='compressed')
+
+    def raw_html(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT _content_html FROM collective_blog_post '
+                           'WHERE id = %s', [post.pk])
+            return cursor.fetchone()[0]
+
+    def test_storage(self):
+        """Test that html is compressed transparently"""
+        from collective_blog.models import Post
+
+        post = Post.objects.create(author=self.user, heading='Compressed',
+                                   content='```python\nx = 1\n```')
+
+        raw = self.raw_html(post)
+        self.assertNotIsInstance(raw, type(''))
+        self.assertEqual(decompress_html(raw), post._content_html)
+
+        post = Post.objects.get(pk=post.pk)
+        self.assertFalse(post.content.is_dirty)
+        self.assertIn('highlight', post.content.html)
+
+        RerenderCommand().run(bulk.html_cache_fields(['collective_blog.Post']),
+                              verbosity=0)
+        self.assertEqual(decompress_html(self.raw_html(post)),
+                         post._content_html)
+
+    def test_hash_field(self):
+        """Test that bulk writes compare the stored hash"""
+        from collective_blog.models import Post
+
+        post = Post.objects.create(author=self.user, heading='Compressed',
+                                   content='*Old*')
+        field = Post._meta.get_field('_content_html')
+        old_hash = HtmlCacheDescriptor.split(post._content_html)[0]
+        self.assertEqual(Post.objects.get(pk=post.pk)._content_hash, old_hash)
+
+        # The source is updated without the html
+        Post.objects.update(content=Markdown(BaseRenderer(), '*New*'))
+        post = Post.objects.get(pk=post.pk)
+        self.assertTrue(post.content.is_dirty)
+        self.assertEqual(post.content.html_force, '<p><em>New</em></p>')
+
+        post.content = '*Newer*'
+        post.save()
+
+        # Skipped rows are not counted
+        columns = field.render_columns('*New*')
+        self.assertEqual(bulk.update_cache(field, [(post.pk, columns)],
+                                           hashes={post.pk: old_hash}), 0)
+        self.assertEqual(Post.objects.get(pk=post.pk).content.html,
+                         '<p><em>Newer</em></p>')
+
+        batch = next(bulk.iter_batches(field, 10, with_hash=True))
+        self.assertEqual(batch, [(post.pk, '*Newer*',
+                                  Post.objects.get()._content_hash)])
+
+        # The html cache is checked without reading the html
+        with CaptureQueriesContext(connection) as queries:
+            stats = CheckCommand().run([field], dry_run=True, verbosity=0)
+        self.assertEqual(stats['collective_blog.Post._content_html'],
+                         dict(checked=1, stale=0, pending=0, repaired=0))
+        html = connection.ops.quote_name(field.column)
+        self.assertFalse([q for q in queries if html in q['sql']])
+
+    def test_legacy(self):
+        """Test that values stored before compression are read as is"""
+        self.assertEqual(decompress_html(compress_html('<p>Html</p>')),
+                         '<p>Html</p>')
+        self.assertEqual(decompress_html(b'<p>Html</p>'), '<p>Html</p>')
+        self.assertEqual(decompress_html('<p>Html</p>'), '<p>Html</p>')
+
+
+class PreviewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('preview', password='123')
+        self.client.login(username='preview', password='123')
+
+    def preview(self, source, field='collective_blog.Post.content'):
+        return self.client.post(reverse('markdown_preview'),
+                                {'field': field, 'source': source},
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_preview(self):
+        response = self.preview('*Preview*\n\n<cut>\n\nRest')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode()), {
+            'html': get_renderer('post')('*Preview*\n\n<cut>\n\nRest')})
+
+    def test_errors(self):
+        response = self.client.post(reverse('markdown_preview'),
+                                    {'field': 'collective_blog.Post.content',
+                                     'source': 'Preview'})
+        self.assertEqual(response.status_code, 418)
+
+        self.assertEqual(self.preview('x', 'collective_blog.Post.heading')
+                         .status_code, 400)
+        self.assertEqual(self.preview('x', 'collective_blog.Nope.content')
+                         .status_code, 400)
+
+        with override_settings(S_MARKDOWN_PREVIEW={'MAX_LENGTH': 3}):
+            self.assertEqual(self.preview('Long').status_code, 400)
+
+    @override_settings(S_MARKDOWN_PREVIEW={'RATE': 2})
+    def test_rate(self):
+        self.assertEqual(self.preview('1').status_code, 200)
+        self.assertEqual(self.preview('2').status_code, 200)
+        self.assertEqual(self.preview('3').status_code, 429)
+
+    def test_anonymous(self):
+        self.client.logout()
+        self.assertNotEqual(self.preview('x').status_code, 200)
+
+
+class RendererTest(SimpleTestCase):
+    def test_deconstruct(self):
+        """Test that the renderer is deconstructed as before"""
+        extension = FencedCodeExtension()
+        renderer = BaseRenderer(extensions=['markdown.extensions.abbr',
+                                            extension])
+
+        path, args, kwargs = renderer.deconstruct()
+
+        self.assertEqual(path, 's_markdown.renderer.BaseRenderer')
+        self.assertEqual(args, ())
+        self.assertEqual(kwargs, dict(extensions=['markdown.extensions.abbr',
+                                                  extension]))
+
+    def test_fingerprint(self):
+        """Test that fingerprint depends on extensions and version only"""
+        def renderer(*args, **kwargs):
+            return BaseRenderer(extensions=['markdown.extensions.abbr',
+                                            CutExtension(*args, **kwargs)])
+
+        self.assertEqual(renderer().fingerprint, renderer().fingerprint)
+        self.assertEqual(renderer(anchor='cut').fingerprint,
+                         renderer(anchor='cut').fingerprint)
+        self.assertNotEqual(renderer().fingerprint,
+                            renderer(anchor='cut').fingerprint)
+        self.assertNotEqual(BaseRenderer().fingerprint,
+                            BaseRenderer(version=1).fingerprint)
+        self.assertEqual(BaseRenderer(version=1).deconstruct(),
+                         ('s_markdown.renderer.BaseRenderer', (),
+                          dict(version=1)))
+
+    def test_state_is_reset(self):
+        """Test that references do not leak from one document to another"""
+        renderer = BaseRenderer()
+
+        self.assertIn('href="http://example.com"',
+                      renderer('[a][ref]\n\n[ref]: http://example.com'))
+        self.assertNotIn('href', renderer('[a][ref]'))
+
+    def test_pickle(self):
+        """Test that the renderer can be pickled"""
+        renderer = BaseRenderer(extensions=[CutExtension(anchor='cut')])
+        renderer('test')
+
+        renderer = pickle.loads(pickle.dumps(renderer))
+
+        self.assertEqual(renderer('test'), '<p>test</p>')
+
+    @override_settings(S_MARKDOWN_RENDER_CACHE=None)
+    def test_threads(self):
+        """Test that concurrent renders do not corrupt each other"""
+        renderer = BaseRenderer(extensions=[FencedCodeExtension(),
+                                            CutExtension()])
+
+        sources = ['Text %s\n\n```\ncode %s\n```\n\n----cut----\n\n%s'
+                   % (i, i, 'word ' * i) for i in range(20)]
+        expected = [renderer(source) for source in sources]
+
+        results = {}
+
+        def render(n):
+            for i in range(10):
+                for j, source in enumerate(sources):
+                    results[(n, i, j)] = renderer(source)
+
+        threads = [threading.Thread(target=render, args=(n, ))
+                   for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for (n, i, j), result in results.items():
+            self.assertEqual(result, expected[j])
+
+
+class RegistryTest(SimpleTestCase):
+    def test_intern(self):
+        """Test that identical configurations share one renderer"""
+        renderer = get_renderer('comment')
+
+        self.assertIs(get_renderer('comment'), renderer)
+        self.assertIs(get_renderer('bio'), renderer)
+        self.assertIsNot(get_renderer('post'), renderer)
+
+        self.assertIs(intern(BaseRenderer()), get_renderer('default'))
+        self.assertIs(MarkdownField().renderer, get_renderer('default'))
+
+    def test_deconstruct(self):
+        """Test that shared renderers deconstruct as usual"""
+        path, args, kwargs = get_renderer('post').deconstruct()
+
+        self.assertEqual(path, 's_markdown.renderer.BaseRenderer')
+        self.assertEqual(args, ())
+        self.assertEqual(kwargs['extensions'][0], 'markdown.extensions.smarty')
+
+
+class CountingRenderer(BaseRenderer):
+    def __init__(self, *args, **kwargs):
+        """Renderer that counts calls to the markdown engine"""
+        super(CountingRenderer, self).__init__(*args, **kwargs)
+        self.calls = 0
+
+    def convert(self, text):
+        self.calls += 1
+        return super(CountingRenderer, self).convert(text)
+
+
+class RenderCacheTest(SimpleTestCase):
+    def test_lru(self):
+        """Test that least recently used entries are evicted"""
+        cache = LRUCache(2)
+
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    @override_settings(S_MARKDOWN_RENDER_CACHE=None)
+    def test_disabled(self):
+        """Test that nothing is cached if the cache is not configured"""
+        renderer = CountingRenderer()
+
+        renderer('*text*')
+        renderer('*text*')
+
+        self.assertIsNone(get_render_cache())
+        self.assertEqual(renderer.calls, 2)
+
+    @override_settings(S_MARKDOWN_RENDER_CACHE={'SIZE': 10})
+    def test_local(self):
+        """Test that identical sources are rendered once"""
+        renderer = CountingRenderer()
+        other = CountingRenderer(version=2)
+
+        self.assertEqual(renderer('*text*'), '<p><em>text</em></p>')
+        self.assertEqual(renderer('*text*'), '<p><em>text</em></p>')
+        self.assertEqual(renderer.calls, 1)
+
+        self.assertEqual(CountingRenderer()('*text*'),
+                         '<p><em>text</em></p>')
+        self.assertEqual(renderer.calls, 1)
+
+        other('*text*')
+        self.assertEqual(other.calls, 1)
+
+        Markdown(renderer, '*text*').compile()
+        self.assertEqual(renderer.calls, 1)
+
+    @override_settings(S_MARKDOWN_RENDER_CACHE={'SIZE': 10,
+                                                'BACKEND': 'default',
+                                                'MAX_LENGTH': 10})
+    def test_backend(self):
+        """Test that the shared tier is used when the local one misses"""
+        renderer = CountingRenderer(version='test_backend')
+
+        renderer('*text*')
+        get_render_cache().local.clear()
+        renderer('*text*')
+
+        self.assertEqual(renderer.calls, 1)
+
+        renderer('*long text*')
+        renderer('*long text*')
+
+        self.assertEqual(renderer.calls, 3)
+
+
+@override_settings(S_MARKDOWN_RENDER_CACHE={'SIZE': 1000},
+                   S_MARKDOWN_INCREMENTAL={'MIN_LENGTH': 0})
+class IncrementalTest(SimpleTestCase):
+    @staticmethod
+    def normalize(html):
+        return '\n'.join(line for line in html.split('\n') if line.strip())
+
+    def test_equivalent(self):
+        """Test that block by block rendering gives the same html"""
+        renderer = get_renderer('post')
+        md = renderer.get_markdown()
+
+        sources = [
+            '- a\n\n- b\n\npara\n\n1. x\n\n    indented\n\ntext',
+            '> quote\n\n> quote\n\nafter',
+            'Term\n: def\n\nTerm\n: def\n\nTerm\n\n: def\n\npara',
+            'Some HTML [link][a]\n\n[a]: http://example.com\n'
+            '  "Title"\n\n*[HTML]: Hyper Text\n\nMore HTML [a]',
+            'para\n```python\ndef f():\n\n    return 1\n```\nafter\n\n'
+            '```\nunclosed\n\nx',
+        ]
+        for category, documents in corpus.generate(5, seed=1):
+            sources.extend(documents)
+
+        for source in sources:
+            blocks = incremental.split(md, source)
+            if blocks is None:
+                # Single paragraph comments
+                continue
+            self.assertEqual(
+                self.normalize(renderer.render_blocks(blocks,
+                                                      get_render_cache())),
+                self.normalize(renderer.convert(source)))
+
+    def test_not_split(self):
+        """Test that sources with cross-block constructs are not split"""
+        md = get_renderer('post').get_markdown()
+        self.assertIsNone(incremental.split(md, 'a\n\n----cut----\n\n'
+                                                'b\n\n----cut----'))
+        self.assertIsNone(incremental.split(md, 'single paragraph'))
+        self.assertIsNotNone(incremental.split(md, 'a\n\n<div>\n\nb'))
+
+        md = get_renderer('default').get_markdown()
+        self.assertIsNone(incremental.split(md, 'a\n\n<div>\n\nb'))
+
+    def test_edit(self):
+        """Test that only changed blocks are rendered"""
+        renderer = CountingRenderer(version='test_edit')
+
+        renderer('First\n\nSecond\n\nThird')
+        self.assertEqual(renderer.calls, 3)
+
+        html = renderer('First\n\n*Changed*\n\nThird')
+        self.assertEqual(renderer.calls, 4)
+        self.assertEqual(html, '<p>First</p>\n<p><em>Changed</em></p>\n'
+                               '<p>Third</p>')
+
+        renderer('First\n\nSecond [x]\n\nThird\n\n[x]: http://example.com')
+        self.assertEqual(renderer.calls, 8)
+
+
+class SlowRenderer(BaseRenderer):
+    """Renderer that hangs on sources that contain `slow`
+
+    Sources that contain `wait` take half a second.
+
+    """
+
+    def convert(self, text):
+        if 'slow' in text:
+            time.sleep(30)
+        if 'wait' in text:
+            time.sleep(0.5)
+        return super(SlowRenderer, self).convert(text)
+
+
+@override_settings(S_MARKDOWN_ISOLATION={'TIMEOUT': 1, 'PROCESSES': 1},
+                   S_MARKDOWN_RENDER_CACHE={'SIZE': 10})
+class IsolationTest(SimpleTestCase):
+    def test_timeout(self):
+        """Test that slow renders fall back to escaped text"""
+        renderer = SlowRenderer(version='test_timeout')
+        timeouts = []
+
+        def receiver(sender, source, **kwargs):
+            timeouts.append((sender, source))
+
+        render_timeout.connect(receiver)
+        try:
+            self.assertEqual(renderer('*slow* <b>'),
+                             '<p>*slow* &lt;b&gt;</p>')
+        finally:
+            render_timeout.disconnect(receiver)
+
+        self.assertEqual(timeouts, [(renderer, '*slow* <b>')])
+
+        # The fallback is not cached
+        self.assertIsNone(get_render_cache().get(renderer, '*slow* <b>'))
+
+        # Workers are restarted after the timeout
+        self.assertEqual(renderer('*fast*'), '<p><em>fast</em></p>')
+
+        # The fallback is saved as pending and is not rendered on load
+        field = HtmlCacheField(MarkdownField(renderer=renderer))
+        envelope = field.render('*slow*')
+        self.assertEqual(envelope, HtmlCacheDescriptor.pending_hash('*slow*') +
+                         '<p>*slow*</p>')
+
+        markdown = Markdown(renderer, '*slow*')
+        HtmlCacheDescriptor(field, field.markdown_field).load(markdown,
+                                                              envelope)
+        self.assertFalse(markdown.is_dirty)
+        self.assertTrue(markdown.is_pending)
+        self.assertEqual(markdown.html_force, '<p>*slow*</p>')
+
+    @override_settings(S_MARKDOWN_ISOLATION={'TIMEOUT': 1, 'PROCESSES': 2})
+    def test_timeout_concurrent(self):
+        """Test that a timeout doesn't break renders in other workers"""
+        renderer = SlowRenderer(version='test_timeout_concurrent')
+        results = {}
+
+        def render(text):
+            results[text] = renderer(text)
+
+        slow = threading.Thread(target=render, args=('*slow*', ))
+        slow.start()
+        time.sleep(0.7)
+        # Still rendering when the slow worker is killed
+        render('*wait*')
+        slow.join()
+
+        self.assertEqual(results, {'*slow*': '<p>*slow*</p>',
+                                   '*wait*': '<p><em>wait</em></p>'})
+
+
+class ProfilingTest(SimpleTestCase):
+    def test_profiling(self):
+        """Test that processors are timed when profiling is enabled"""
+        renderer = BaseRenderer(extensions=[FencedCodeExtension()],
+                                version='test_profiling')
+        profile = get_profile(renderer)
+
+        renderer.convert('*text*')
+        self.assertEqual(profile.renders, 0)
+
+        with override_settings(S_MARKDOWN_PROFILING=True):
+            renderer.convert('*text*\n\n```\ncode\n```')
+            renderer.convert('**text**')
+
+        renderer.convert('*text*')
+
+        self.assertEqual(profile.renders, 2)
+        self.assertEqual(profile.timings[('preprocessor', 'fenced_code_block')][0],
+                         2)
+        self.assertIn(('pattern', 'emphasis'), profile.timings)
+        self.assertIn(('treeprocessor', 'inline'), profile.timings)
+        self.assertIn(('blockprocessor', 'paragraph'), profile.timings)
+
+
+class BenchmarkTest(SimpleTestCase):
+    def test_corpus(self):
+        """Test that the corpus is reproducible"""
+        self.assertEqual(corpus.generate(2, seed=1), corpus.generate(2, seed=1))
+        self.assertNotEqual(corpus.generate(2, seed=1),
+                            corpus.generate(2, seed=2))
+
+    def test_compare(self):
+        """Test that slowdowns beyond the threshold are reported"""
+        def results(docs_per_sec, p99_ms):
+            return {'results': [{'renderer': 'post', 'corpus': 'urls',
+                                 'docs_per_sec': docs_per_sec,
+                                 'p99_ms': p99_ms}]}
+
+        baseline = results(100, 10)
+
+        report = suite.compare(baseline, results(90, 11), threshold=0.2)
+        self.assertEqual(report[0][2], [])
+
+        report = suite.compare(baseline, results(70, 13), threshold=0.2)
+        self.assertEqual(report[0][2], ['docs_per_sec', 'p99_ms'])
+
+
+class TextTest(SimpleTestCase):
+    def test_plain_text(self):
+        """Test that tags and entities are stripped"""
+        html = BaseRenderer(extensions=['markdown.extensions.tables'])(
+            '# Title\n\nSome *text* &amp; more\n\n'
+            '* one\n* two\n\n'
+            'a | b\n--- | ---\nc | d')
+
+        self.assertEqual(plain_text(html),
+                         'Title\nSome text & more\none\ntwo\na\nb\nc\nd')
+        self.assertEqual(word_count(plain_text(html)), 10)
+
+
+class FencedCodeTest(SimpleTestCase):
+    def test_highlight_cache(self):
+        """Test that highlighted blocks are reused"""
+        renderer = BaseRenderer(extensions=[FencedCodeExtension()])
+
+        code = '```python\nhighlight_cache = True\n```'
+        html = renderer('Text\n\n' + code)
+
+        self.assertIn('<pre><ol><li>', html)
+
+        size = len(highlight_cache)
+        other_html = renderer('Other text\n\n' + code)
+
+        self.assertEqual(len(highlight_cache), size)
+        self.assertEqual(html.replace('Text', 'Other text'), other_html)
+
+    def test_unknown_language(self):
+        """Test that code in unknown languages is escaped"""
+        renderer = BaseRenderer(extensions=[FencedCodeExtension()])
+
+        self.assertIsNone(get_lexer('no-such-language'))
+        self.assertEqual(renderer('```no-such-language\n<a>\nb\n\n```'),
+                         '<pre><ol><li>&lt;a&gt;</li><li>b</li></ol></pre>')
+        self.assertEqual(renderer('```\n<a>\nb\n```'),
+                         '<pre>&lt;a&gt;\nb</pre>')
+
+    def test_blocks(self):
+        """Test that blocks are matched with the nearest closing fence"""
+        renderer = BaseRenderer(extensions=[FencedCodeExtension()])
+
+        self.assertEqual(renderer('```\na\n```\nb\n```\nc\n```\n```'),
+                         '<pre>a</pre>\n\n<p>b</p>\n<pre>c</pre>\n\n<p>```</p>')
+        self.assertEqual(renderer('```x y\na\n```'),
+                         '<p><code>x y\na</code></p>')
+
+
+class CutTest(SimpleTestCase):
+    def test_cut(self):
+        """Test that only the first cut is replaced"""
+        renderer = BaseRenderer(extensions=[CutExtension()])
+
+        self.assertEqual(renderer('a\n\n---- cut ----\n\nb\n\n----cut----'),
+                         '<p>a</p>\n<!-- cut here -->\n\n<p>b</p>\n'
+                         '<p>----cut----</p>')
+
+    def test_caption(self):
+        """Test that a caption may span several lines"""
+        renderer = BaseRenderer(extensions=[CutExtension(anchor='cut')])
+
+        self.assertEqual(renderer('a\n\n----cut {{ More\nhere }}----\n\nb'),
+                         '<p>a</p>\n<!-- cut here {{  More\nhere  }} -->'
+                         '<a name="cut"></a>\n\n<p>b</p>')
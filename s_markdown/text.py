@@ -0,0 +1,52 @@
+"""Plain text projections of rendered html
+
+These functions are meant to be used as derived fields
+of an `HtmlCacheField`:
+
+    _content_html = HtmlCacheField(content, derived={
+        '_content_text': plain_text,
+        '_content_word_count': ('_content_text', word_count),
+    })
+
+`word_count` is computed from the plain text rather than from the html,
+so the html is only parsed once.
+
+"""
+
+from django.utils.html import strip_tags
+from django.utils.text import unescape_entities
+
+import re
+
+
+# Tags after which the text continues on a new line
+block_end_re = re.compile(r'(<br\s*/?>|</(p|li|td|th|h[1-6]|div|pre|tr|'
+                          r'dt|dd|blockquote)>)', re.IGNORECASE)
+
+word_re = re.compile(r'\w', re.UNICODE)
+
+
+def plain_text(html):
+    """Strip tags and entities from the html
+
+    Blocks (paragraphs, list items, table cells, etc.) are put on separate
+    lines, whitespace inside lines is collapsed, and empty lines are removed.
+
+    :param html: Rendered html.
+    :return: Plain text.
+
+    """
+    text = unescape_entities(strip_tags(block_end_re.sub(r'\1\n', html)))
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def word_count(text):
+    """Count words in the plain text
+
+    :param text: Plain text (see `plain_text`).
+    :return: Number of whitespace-separated words.
+      Punctuation (e.g. a dash between words) is not counted.
+
+    """
+    return sum(1 for word in text.split() if word_re.search(word))
@@ -0,0 +1,9 @@
+"""Markdown routing"""
+
+from django.conf.urls import url
+
+from .views import PreviewView
+
+urlpatterns = [
+    url(r'^preview/$', PreviewView.as_view(), name='markdown_preview'),
+]
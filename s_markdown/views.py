@@ -0,0 +1,92 @@
+"""Markdown views"""
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.utils.translation import ugettext as __
+from django.views.decorators.csrf import csrf_protect
+from django.views.generic import View
+
+from .bulk import get_field
+from .models import MarkdownField
+
+import json
+
+
+def get_preview_config():
+    """Preview settings
+
+    Configured with the `S_MARKDOWN_PREVIEW` setting:
+
+        S_MARKDOWN_PREVIEW = {
+            # Number of previews a user can request per period
+            'RATE': 60,
+            # Period length in seconds
+            'PERIOD': 60,
+            # Longer sources are not previewed
+            'MAX_LENGTH': 256 * 1024,
+            # Alias of a django cache used to count requests
+            'CACHE': 'default',
+        }
+
+    """
+    config = dict(RATE=60, PERIOD=60, MAX_LENGTH=256 * 1024, CACHE='default')
+    config.update(getattr(settings, 'S_MARKDOWN_PREVIEW', {}))
+    return config
+
+
+@method_decorator(csrf_protect, 'dispatch')
+@method_decorator(login_required, 'dispatch')
+class PreviewView(View):
+    """Render markdown with the renderer of a model field
+
+    Accepts `field` (e.g. `collective_blog.Post.content`) and `source`
+    POST parameters, returns `{"html": ...}`.
+
+    Renders go through the renderer, so the render cache and the render
+    time budget apply (see `s_markdown.cache`, `s_markdown.isolation`).
+
+    """
+
+    def post(self, request, *args, **kwargs):
+        if not request.is_ajax():
+            return HttpResponse('This page is ajax-only', status=418)
+
+        config = get_preview_config()
+
+        try:
+            field = get_field(request.POST['field'])
+            source = request.POST['source']
+            assert isinstance(field, MarkdownField)
+        except (KeyError, ValueError, LookupError, AssertionError):
+            return HttpResponse('Wrong data', status=400)
+
+        if len(source) > config['MAX_LENGTH']:
+            return HttpResponse(__('The text is too long to preview'),
+                                status=400)
+
+        if not self.check_rate(request.user, config):
+            return HttpResponse(__('Too many preview requests'), status=429)
+
+        html = field.renderer(source)
+
+        return HttpResponse(json.dumps({'html': html}),
+                            content_type='application/json')
+
+    @staticmethod
+    def check_rate(user, config):
+        """Count the request and check that the user is within the limit"""
+        cache = caches[config['CACHE']]
+        key = 's_markdown:preview:%s' % user.pk
+
+        cache.add(key, 0, config['PERIOD'])
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # The key has just expired
+            cache.add(key, 1, config['PERIOD'])
+            count = 1
+
+        return count <= config['RATE']
@@ -1,6 +1,7 @@
 """Markdown widgets"""
 
 from django import forms
+from django.core.urlresolvers import reverse
 from django.utils.safestring import mark_safe
 from django.utils.deconstruct import deconstructible
 
@@ -30,6 +31,11 @@ class CodeMirror(MarkdownTextarea):
         :param additional_modes: Load additional modes for `overlay` extension.
         :param js_var_format: A name of the js variable in which
           the codemirror instance is saved.
+        :param preview: A label of the markdown field whose renderer is used
+          for the live preview (e.g. `collective_blog.Post.content`).
+          If not set, there is no preview.
+        :param preview_delay: Number of milliseconds without edits after
+          which the preview is updated.
 
         """
         self.mode = kwargs.pop('mode', 'markdown')
@@ -40,6 +46,8 @@ class CodeMirror(MarkdownTextarea):
         self.options = kwargs.pop('options', {})
         self.additional_modes = kwargs.pop('additional_modes', [])
         self.js_var_format = kwargs.pop('js_var_format', None)
+        self.preview = kwargs.pop('preview', None)
+        self.preview_delay = kwargs.pop('preview_delay', 500)
 
         self.options.update(dict(mode=self.mode, theme=self.theme))
 
@@ -64,6 +72,8 @@ class CodeMirror(MarkdownTextarea):
             js.append('s_markdown/codemirror/mode/%s/%s.js' % (self.mode, self.mode))
         for mode in self.additional_modes:
             js.append('s_markdown/codemirror/mode/%s/%s.js' % (mode, mode))
+        if self.preview:
+            js.append('s_markdown/preview.js')
         return forms.Media(
             css=dict(all=css),
             js=js,
@@ -79,7 +89,14 @@ class CodeMirror(MarkdownTextarea):
 
         """
         if self.js_var_format is not None:
-            js_var_bit = 'var %s = ' % (self.js_var_format % name)
+            js_var = self.js_var_format % name
+        elif self.preview:
+            js_var = 's_markdown_editor_%s' % name
+        else:
+            js_var = None
+
+        if js_var is not None:
+            js_var_bit = 'var %s = ' % js_var
         else:
             js_var_bit = ''
         output = [super(CodeMirror, self).render(name, value, attrs),
@@ -88,4 +105,14 @@ class CodeMirror(MarkdownTextarea):
                   'document.getElementById(%s), %s);'
                   '</script>' %
                   (js_var_bit, '"id_%s"' % name, self.option_json)]
+        if self.preview:
+            output.append('<div class="markdown-preview" '
+                          'id="preview_id_%s"></div>' % name)
+            output.append('<script type="text/javascript">'
+                          'new MarkdownPreview(%s, '
+                          'document.getElementById(%s), %s, %s, %s);'
+                          '</script>' %
+                          (js_var, '"preview_id_%s"' % name,
+                           dumps(reverse('markdown_preview')),
+                           dumps(self.preview), dumps(self.preview_delay)))
         return mark_safe('\n'.join(output))
@@ -0,0 +1,223 @@
+"""Write-behind buffer for vote caches
+
+Every vote updates the rows of all its caches (see `VoteCacheField`).
+When a post is popular, all its votes update the same `Post.rating`
+and `Membership` rows and wait for each other's row locks.
+
+With the write-behind mode, votes are still saved synchronously, but
+cache deltas are collected in a per-process buffer and flushed
+periodically with a single update per cache field. Cache values lag
+behind the votes for up to the flush interval. Deltas that were not
+flushed (e.g. if the process was killed) are lost; cache values can be
+restored from the votes.
+
+The mode is configured with the `S_VOTING_WRITE_BEHIND` setting:
+
+    S_VOTING_WRITE_BEHIND = {
+        # Labels of buffered cache fields
+        'FIELDS': ['collective_blog.Post.rating'],
+        # Seconds between flushes
+        'INTERVAL': 5,
+    }
+
+If the setting is not set, caches are updated along with the votes.
+
+Votes don't lock or write rows that only hold buffered caches, so they
+don't wait for each other. Vote buckets of such rows (see
+`AbstractVoteBucket`) are buffered too. Values computed from buffered caches should
+be refreshed when deltas are flushed (see `signals.deltas_flushed`).
+
+"""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.db.models import Case, When, Value, F
+
+import atexit
+import logging
+import threading
+
+from .signals import deltas_flushed
+
+
+logger = logging.getLogger(__name__)
+
+
+def field_label(model, field_name):
+    return '%s.%s' % (model._meta.label, field_name)
+
+
+def apply_deltas(model, field_name, deltas):
+    """Add deltas to cache values with a single query
+
+    :param model: Model that holds the cache.
+    :param field_name: Name of a `VoteCacheField`.
+    :param deltas: A dict that maps primary keys to deltas.
+    :return: Number of updated rows.
+
+    """
+    deltas = dict((pk, d) for pk, d in deltas.items() if d != 0)
+    if not deltas:
+        return 0
+
+    field = model._meta.get_field(field_name)
+    return model._default_manager.filter(pk__in=list(deltas)).update(
+        **{field_name: F(field_name) + Case(
+            *[When(pk=pk, then=Value(d))
+              for pk, d in sorted(deltas.items())],
+            default=Value(0),
+            output_field=field)})
+
+
+class DeltaBuffer(object):
+    def __init__(self, fields, interval=5):
+        """Thread-safe buffer of vote cache deltas
+
+        :param fields: Labels of buffered fields, e.g.
+          `collective_blog.Post.rating`.
+        :param interval: Seconds between adding the first delta
+          and flushing. If None, deltas are only flushed by `flush`.
+
+        """
+        self.fields = set(fields)
+        self.interval = interval
+        self._deltas = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def is_buffered(self, model, field_name):
+        return field_label(model, field_name) in self.fields
+
+    def add(self, model, field_name, pks, delta):
+        """Add the delta to cache values of the given rows
+
+        :param model: Model that holds the cache.
+        :param field_name: Name of a `VoteCacheField`.
+        :param pks: Primary keys of updated rows.
+        :param delta: A number to add.
+
+        If the model has the `apply_deltas(field_name, deltas)`
+        class method, it is used to write the deltas instead of
+        the `apply_deltas` function, and `pks` may be any keys
+        that the method accepts (see `AbstractVoteBucket`).
+
+        """
+        with self._lock:
+            deltas = self._deltas.setdefault((model, field_name), {})
+            for pk in pks:
+                deltas[pk] = deltas.get(pk, 0) + delta
+
+            if self._timer is None and self.interval is not None:
+                self._timer = threading.Timer(self.interval, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self):
+        """Returns the number of rows that wait for a flush"""
+        with self._lock:
+            return sum(len(deltas) for deltas in self._deltas.values())
+
+    def flush(self):
+        """Write all collected deltas to the database
+
+        Rows are updated in a single transaction with one query
+        per cache field. If the transaction fails, deltas are kept
+        in the buffer.
+
+        :return: Number of updated rows.
+
+        """
+        with self._lock:
+            collected, self._deltas = self._deltas, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not collected:
+            return 0
+
+        updated = 0
+
+        try:
+            with transaction.atomic():
+                for (model, field_name), deltas in sorted(
+                        collected.items(),
+                        key=lambda item: field_label(*item[0])):
+                    if hasattr(model, 'apply_deltas'):
+                        updated += model.apply_deltas(field_name, deltas)
+                    else:
+                        updated += apply_deltas(model, field_name, deltas)
+                    deltas_flushed.send(sender=model, field_name=field_name,
+                                        pks=sorted(deltas))
+        except Exception:
+            for (model, field_name), deltas in collected.items():
+                for pk, delta in deltas.items():
+                    self.add(model, field_name, [pk], delta)
+            raise
+
+        return updated
+
+    def _flush(self):
+        """Flush from the timer thread"""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush vote cache deltas')
+        finally:
+            connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Returns the write-behind buffer configured in settings or None"""
+    global _buffer
+
+    config = getattr(settings, 'S_VOTING_WRITE_BEHIND', None)
+    if config is None:
+        return None
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = DeltaBuffer(fields=config.get('FIELDS', []),
+                                      interval=config.get('INTERVAL', 5))
+
+    return _buffer
+
+
+def is_buffered(model, field_name):
+    """Check if the cache field is buffered by the configured buffer"""
+    buffer = get_buffer()
+    return buffer is not None and buffer.is_buffered(model, field_name)
+
+
+def flush():
+    """Flush the configured buffer, if any
+
+    :return: Number of updated rows.
+
+    """
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
+
+
+def _reset_buffer(setting, **kwargs):
+    global _buffer
+    if setting == 'S_VOTING_WRITE_BEHIND':
+        _buffer = None
+
+
+setting_changed.connect(_reset_buffer)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Failed to flush vote cache deltas')
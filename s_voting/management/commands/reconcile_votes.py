@@ -0,0 +1,180 @@
+"""Recompute vote caches from votes
+
+Values of `VoteCacheField`s are only updated by `AbstractVote.vote_for`,
+so votes deleted by cascades or raw queries leave them wrong.
+This command sums votes with `GROUP BY` queries, one per batch of cache
+rows, and fixes the rows whose values differ.
+
+Deltas buffered by the write-behind mode (see `s_voting.buffer`)
+of other processes look like drift, so run the command when
+the buffers are flushed.
+
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from s_voting.buffer import apply_deltas, field_label, flush
+from s_voting.models import VoteCacheField
+
+
+def vote_cache_fields(labels=None):
+    """Find all `VoteCacheField`s of installed models
+
+    :param labels: A list of `app_label` or `app_label.Model` strings.
+      If given, only matching models are returned.
+    :return: A list of `VoteCacheField` instances.
+
+    """
+    result = []
+
+    for model in apps.get_models():
+        opts = model._meta
+        if opts.proxy or not opts.managed:
+            continue
+        if labels and not (opts.app_label in labels or
+                           opts.label in labels):
+            continue
+        result.extend(field for field in opts.concrete_fields
+                      if isinstance(field, VoteCacheField))
+
+    return result
+
+
+def check_batch(field, rows):
+    """Compute the drift of cache values
+
+    :param field: A `VoteCacheField` instance.
+    :param rows: A list of `(pk, value, key)` tuples, where `key` is
+      a tuple of values of the `group_by` lookups (in sorted order).
+    :return: A dict that maps primary keys to differences between
+      the sum of votes and the cached value. Rows without drift
+      are not included.
+
+    """
+    group_by = field.get_group_by()
+    lookups = [group_by[name] for name in sorted(group_by)]
+
+    # May select votes of rows from other batches; they are ignored
+    votes = field.vote_model.objects.filter(**dict(
+        ('%s__in' % lookup, set(key[i] for pk, value, key in rows))
+        for i, lookup in enumerate(lookups)))
+
+    totals = dict(
+        (tuple(row[:-1]), row[-1]) for row in
+        votes.order_by().values_list(*lookups).annotate(score=Sum('vote')))
+
+    drift = {}
+    for pk, value, key in rows:
+        delta = (totals.get(key) or 0) - value
+        if delta != 0:
+            drift[pk] = delta
+    return drift
+
+
+class Command(BaseCommand):
+    help = ('Recomputes vote caches from votes and fixes the values '
+            'that drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', nargs='*', metavar='app_label[.Model]',
+                            help='Only process the given apps or models.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of cache rows checked and updated '
+                                 'by a single query.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only report the drift, '
+                                 'don\'t write anything.')
+
+    def handle(self, *args, **options):
+        fields = vote_cache_fields(options['labels'])
+        for field in fields:
+            if field.get_group_by() is None:
+                raise CommandError(
+                    '%s: set `group_by` to recompute this cache' %
+                    field_label(field.model, field.name))
+        self.run(fields, **options)
+
+    def run(self, fields, batch_size=1000, dry_run=False, verbosity=1,
+            **kwargs):
+        """Check the given vote cache fields
+
+        :param fields: A list of `VoteCacheField` instances.
+        :return: A dict that maps field labels to dicts with numbers
+          of `checked`, `drifted` and `repaired` rows, and the sum
+          of absolute differences (`drift`).
+
+        """
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.verbosity = verbosity
+
+        if not dry_run:
+            flush()
+
+        return dict((field_label(field.model, field.name),
+                     self.process(field)) for field in fields)
+
+    def iter_batches(self, field):
+        """Yield lists of `(pk, value, key)` tuples (see `check_batch`)
+
+        Rows of each batch are locked until the end of the transaction
+        in which the batch is read.
+
+        """
+        names = sorted(field.get_group_by())
+        rows = field.model._default_manager.select_for_update().order_by(
+            'pk').values_list('pk', field.attname, *names)
+
+        last_pk = None
+        while True:
+            if last_pk is not None:
+                batch = list(rows.filter(pk__gt=last_pk)[:self.batch_size])
+            else:
+                batch = list(rows[:self.batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1][0]
+            yield [(row[0], row[1], tuple(row[2:])) for row in batch]
+
+    def process(self, field):
+        """Check all rows of the given field"""
+        label = field_label(field.model, field.name)
+
+        stats = dict(checked=0, drifted=0, drift=0, repaired=0)
+
+        batches = self.iter_batches(field)
+        while True:
+            # Cache rows of the batch are locked while votes are summed,
+            # so votes for them wait until the drift is applied.
+            # The drift is added to the cache rather than overwriting it,
+            # so votes counted after the check are kept.
+            with transaction.atomic():
+                batch = next(batches, None)
+                if batch is None:
+                    break
+
+                drift = check_batch(field, batch)
+
+                if drift and not self.dry_run:
+                    stats['repaired'] += apply_deltas(field.model,
+                                                      field.name, drift)
+
+            stats['checked'] += len(batch)
+            stats['drifted'] += len(drift)
+            stats['drift'] += sum(abs(d) for d in drift.values())
+
+            if drift and self.verbosity >= 2:
+                self.stdout.write('%s: drifted rows %s' % (
+                    label, ', '.join('%s (%+d)' % (pk, drift[pk])
+                                     for pk in sorted(drift))))
+
+        if self.verbosity >= 1:
+            self.stdout.write(
+                '%s: %d rows checked, %d drifted (total drift %d), '
+                '%d repaired' % (label, stats['checked'], stats['drifted'],
+                                 stats['drift'], stats['repaired']))
+
+        return stats
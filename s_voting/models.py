@@ -1,12 +1,18 @@
 """Abstract base for implementing voting subsystems"""
 
-from django.db import models
-from django.db.models import Sum, Count, QuerySet, ObjectDoesNotExist, F, Q
+from django.apps import apps
+from django.db import models, transaction, IntegrityError
+from django.db.models import Sum, Count, QuerySet, F, Q, Case, When, Value
+from django.utils import timezone
 from django.utils.translation import ugettext as __
 
 from collective_blog import settings
 from collective_blog.utils.errors import PermissionCheckFailed
 
+from functools import partial
+
+from .buffer import get_buffer, is_buffered
+
 
 class VotesQuerySet(QuerySet):
     """Queryset of votes
@@ -34,6 +40,21 @@ class VotesQuerySet(QuerySet):
         """Count all votes"""
         return self.score_query()['num_votes']
 
+    def user_votes(self, user, objects):
+        """Fetch votes of a user for many objects with a single query
+
+        :param user: Who votes.
+        :param objects: A list of voted objects.
+        :return: A dict that maps primary keys of voted objects to votes.
+          Objects that are not voted by the user are not included.
+
+        """
+        if user.is_anonymous():
+            return {}
+        return dict(self.filter(user=user,
+                                object__in=[obj.pk for obj in objects])
+                    .values_list('object', 'vote'))
+
 
 class VoteManager(models.Manager):
     """Wrap objects to the `VotesQuerySet`"""
@@ -55,6 +76,9 @@ class AbstractVote(models.Model):
     vote = models.SmallIntegerField(choices=SCORES)
     object = None  # Should be overwritten
 
+    # A model derived from `AbstractVoteBucket` (optional)
+    bucket_model = None
+
     objects = VoteManager()
 
     class Meta:
@@ -68,6 +92,10 @@ class AbstractVote(models.Model):
     def vote_for(cls, user, obj, vote):
         """Create or update a vote
 
+        The vote row and all vote caches (see `VoteCacheField`) are updated
+        in a single transaction, so concurrent votes can't leave caches
+        out of sync with the votes.
+
         :param user: Who votes.
         :param obj: For what votes.
         :param vote: +1, 0, or -1.
@@ -82,28 +110,121 @@ class AbstractVote(models.Model):
         if not user.is_active:
             raise PermissionCheckFailed(__("Your account is disabled"))
 
-        try:
-            v = cls.objects.get(user=user, object=obj)
-            delta = vote - v.vote
-            if vote == 0:
-                v.delete()
-            else:
-                v.vote = vote
-                v.save()
-        except ObjectDoesNotExist:
-            if vote != 0:
+        with transaction.atomic():
+            # Votes for the same object wait for each other here if caches
+            # of the object are updated along with the votes. Rows are
+            # always locked in the same order: the object, the vote,
+            # then the caches.
+            locks_object = cls._locks_object(type(obj))
+            if locks_object:
+                type(obj)._default_manager.select_for_update().filter(
+                    pk=obj.pk).exists()
+
+            # Missing vote rows are not locked: on some backends
+            # (e.g. MySQL InnoDB) that takes a gap lock, and concurrent
+            # inserts into the gap deadlock. New votes are serialized
+            # by the unique key instead (see `_insert`).
+            votes = cls.objects.filter(user=user, object=obj)
+            old = None
+            if votes.exists():
+                old = (votes.select_for_update()
+                       .values_list('vote', flat=True).first())
+
+            if old is None:
+                if vote == 0:
+                    return
+                old = cls._insert(user, obj, vote)
+
+            if old is None:
                 delta = vote
-                v = cls.objects.create(user=user, object=obj, vote=vote)
+            elif vote == 0:
+                votes.delete()
+                delta = -old
             else:
-                return
+                votes.update(vote=vote)
+                delta = vote - old
+
+            if delta != 0:
+                cls._update_caches(cls(user=user, object=obj, vote=vote),
+                                   delta)
+                if cls.bucket_model is not None:
+                    cls._update_bucket(obj, delta, locks_object)
+
+    @classmethod
+    def _locks_object(cls, model):
+        """Check if votes lock the row of the object they are for
+
+        Rows that only hold buffered caches (see `s_voting.buffer`)
+        are neither locked nor written by votes.
+
+        """
+        return any(not is_buffered(base_model, field_name)
+                   for base_model, field_name in getattr(cls, '_caches', {})
+                   if base_model is model)
+
+    @classmethod
+    def _update_bucket(cls, obj, delta, locks_object):
+        """Add the delta to the current bucket of the object
+
+        Votes that don't lock the object would wait for each other
+        on the bucket row instead, so they add the delta to the
+        write-behind buffer (see `s_voting.buffer`) when the
+        transaction is committed.
+
+        """
+        if locks_object:
+            cls.bucket_model.add(obj, delta)
+        else:
+            key = (obj.pk, cls.bucket_model.get_hour())
+            transaction.on_commit(partial(
+                get_buffer().add, cls.bucket_model, 'score', [key], delta))
+
+    @classmethod
+    def _insert(cls, user, obj, vote):
+        """Insert a new vote
+
+        Concurrent first votes of the same user are serialized
+        by the unique key.
+
+        :return: None if the vote was inserted, or the value of the vote
+          that was inserted concurrently (its row is locked then).
+
+        """
+        locked = cls.objects.select_for_update().filter(user=user,
+                                                        object=obj)
+        while True:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(user=user, object=obj, vote=vote)
+                return None
+            except IntegrityError:
+                old = locked.values_list('vote', flat=True).first()
+                if old is not None:
+                    return old
+                # Deleted concurrently, insert again
+
+    @classmethod
+    def _update_caches(cls, v, delta):
+        """Add the delta to all caches that depend on the vote
+
+        Deltas of buffered caches (see `s_voting.buffer`) are added
+        to the buffer when the transaction is committed.
 
-        if delta != 0:
-            print(delta, cls._caches)
-            for (base_model, field_name), query in cls._caches.items():
-                query = query(v)
-                base_model.objects.filter(query).update(
-                    **{field_name: F(field_name) + delta}
-                )
+        """
+        buffer = get_buffer()
+
+        caches = sorted(cls._caches.items(), key=lambda item: (
+            item[0][0]._meta.label, item[0][1]))
+
+        for (base_model, field_name), query in caches:
+            rows = base_model.objects.filter(query(v))
+            if buffer is not None and buffer.is_buffered(base_model,
+                                                         field_name):
+                pks = list(rows.values_list('pk', flat=True))
+                transaction.on_commit(partial(
+                    buffer.add, base_model, field_name, pks, delta))
+            else:
+                rows.update(**{field_name: F(field_name) + delta})
 
     @classmethod
     def _register(cls, field_name, base_model, query):
@@ -112,31 +233,153 @@ class AbstractVote(models.Model):
         cls._caches[(base_model, field_name)] = query
 
 
+class AbstractVoteBucket(models.Model):
+    """Sum of votes for an object received during an hour
+
+    Buckets are updated by `AbstractVote.vote_for` if the vote model
+    has the `bucket_model` set. Changing a vote adds the difference
+    to the bucket of the current hour. If votes don't lock the object
+    (see `AbstractVote._locks_object`), the differences are buffered
+    like the vote caches and written by `apply_deltas`.
+
+    """
+    hour = models.DateTimeField()
+    score = models.IntegerField(default=0)
+    object = None  # Should be overwritten
+
+    class Meta:
+        unique_together = (('object', 'hour'), )
+        # Objects voted during recent hours are found from the index alone
+        index_together = (('hour', 'object', 'score'), )
+        abstract = True
+
+    def __str__(self):
+        return '%s: %s at %s' % (self.object, self.score, self.hour)
+
+    @staticmethod
+    def get_hour(time=None):
+        """Start of the hour of the given time (now by default)"""
+        if time is None:
+            time = timezone.now()
+        return time.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def apply_deltas(cls, field_name, deltas):
+        """Add buffered deltas to buckets (see `s_voting.buffer`)
+
+        :param field_name: Name of the updated field, `score`.
+        :param deltas: A dict that maps `(object pk, hour)` pairs
+          to deltas.
+        :return: Number of updated or created buckets.
+
+        """
+        by_hour = {}
+        for (pk, hour), delta in deltas.items():
+            if delta != 0:
+                by_hour.setdefault(hour, {})[pk] = delta
+
+        object_attname = cls._meta.get_field('object').attname
+        count = 0
+
+        for hour, hour_deltas in sorted(by_hour.items()):
+            buckets = cls.objects.filter(hour=hour)
+            existing = set(buckets.filter(object__in=list(hour_deltas))
+                           .values_list(object_attname, flat=True))
+
+            if existing:
+                count += buckets.filter(object__in=list(existing)).update(
+                    score=F('score') + Case(
+                        *[When(object=pk, then=Value(hour_deltas[pk]))
+                          for pk in sorted(existing)],
+                        default=Value(0),
+                        output_field=cls._meta.get_field('score')))
+
+            missing = sorted(set(hour_deltas) - existing)
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create([
+                        cls(hour=hour, score=hour_deltas[pk],
+                            **{object_attname: pk})
+                        for pk in missing])
+            except IntegrityError:
+                # Created concurrently by a vote that locks the object
+                for pk in missing:
+                    cls.add(pk, hour_deltas[pk], hour)
+            count += len(missing)
+
+        return count
+
+    @classmethod
+    def add(cls, obj, delta, hour=None):
+        """Add the delta to the current bucket of the object
+
+        A bucket created concurrently (e.g. by a vote that doesn't lock
+        the object, see `AbstractVote.vote_for`) is updated instead.
+
+        :param obj: An object or its primary key.
+        :param hour: Start of the bucket hour (the current one by default).
+
+        """
+        if hour is None:
+            hour = cls.get_hour()
+        buckets = cls.objects.filter(object=obj, hour=hour)
+        if buckets.update(score=F('score') + delta):
+            return
+        object_attname = cls._meta.get_field('object').attname
+        try:
+            with transaction.atomic():
+                cls.objects.create(hour=hour, score=delta, **{
+                    object_attname: getattr(obj, 'pk', obj)})
+        except IntegrityError:
+            buckets.update(score=F('score') + delta)
+
+
 def _default_cache_query(v):
     return Q(pk=v.object.pk)
 
 
 class VoteCacheField(models.SmallIntegerField):
-    def __init__(self, vote_model, query=_default_cache_query, default=0):
+    def __init__(self, vote_model, query=_default_cache_query, default=0,
+                 group_by=None):
         """A field that caches the sum of all votes for a particular object
 
         Whenever an object voted using the `vote_model` model,
         all objects that match a `query` will be updated.
 
+        :param group_by: The `query` as a dict that maps lookups
+          on this model to lookups on the `vote_model`. A vote is counted
+          in all rows whose values equal to values of the vote.
+          It is used to recompute caches from votes
+          (see the `reconcile_votes` command). Not needed for
+          the default query.
+
         """
         self.vote_model = vote_model
         self.query = query
+        self.group_by = group_by
         super(VoteCacheField, self).__init__(default=default, editable=False)
 
     def deconstruct(self):
         """Returns enough information to recreate the field"""
         name, path, args, kwargs = super(VoteCacheField, self).deconstruct()
         kwargs.update(dict(vote_model=self.vote_model, query=self.query))
+        if self.group_by is not None:
+            kwargs.update(dict(group_by=self.group_by))
         kwargs.pop('editable')
 
         return name, path, args, kwargs
 
+    def get_group_by(self):
+        """Returns the `group_by` dict or None if it is unknown"""
+        if self.group_by is not None:
+            return self.group_by
+        if self.query is _default_cache_query:
+            return {'pk': 'object'}
+        return None
+
     def contribute_to_class(self, cls, name, virtual_only=False):
         super(VoteCacheField, self).contribute_to_class(cls, name, virtual_only)
-        # noinspection PyProtectedMember
-        self.vote_model._register(self.name, cls, self.query)
+        # Historical models built by migrations should not be updated
+        if cls._meta.apps is apps:
+            # noinspection PyProtectedMember
+            self.vote_model._register(self.name, cls, self.query)
@@ -0,0 +1,9 @@
+"""Voting signals"""
+
+from django.dispatch import Signal
+
+
+# Sent by the write-behind buffer (see `s_voting.buffer`) after deltas
+# of a cache field are written, within the same transaction.
+# The sender is the model that holds the cache.
+deltas_flushed = Signal(providing_args=['field_name', 'pks'])
@@ -9,7 +9,7 @@ class VoteData(object):
     def __init__(self, model, user, obj,
                  use_colors=True, color_tags=None, color_threshold=None,
                  disabled=False,
-                 score=None):
+                 score=None, self_vote=None):
         """Holds data about object rating and user's vote
 
         Used in voting template tag.
@@ -23,6 +23,10 @@ class VoteData(object):
         :param color_threshold: A range in which a color of the rating box
           becomes gray
         :param disabled: render buttons as disabled
+        :param score: Current rating of the object
+        :param self_vote: User's vote for the object. Pass in a value
+          fetched by `VotesQuerySet.user_votes` to avoid a query
+          per object
 
         """
         self.model = model
@@ -47,7 +51,7 @@ class VoteData(object):
             self.score = self.model.objects.filter(object=obj).score()
 
         self._color = None
-        self._self_vote = None
+        self._self_vote = self_vote
 
     @property
     def meta(self):
@@ -92,6 +96,7 @@ def vote(name, prefix, url, data, score=None):
       * color_threshold: A range in which a color of the rating box
         becomes gray
       * disabled: render buttons as disabled
+      * self_vote: user's vote for the object
     :param score: int -- current rating of an object. Pass in a cached value
     to avoid dynamic lookups
 
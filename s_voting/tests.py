@@ -1,3 +1,261 @@
-from django.test import TestCase
+from django.test import (TestCase, TransactionTestCase, skipUnlessDBFeature,
+                         override_settings)
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+import threading
+
+from collective_blog.models import (Blog, Membership, Post, PostVote,
+                                    PostVoteBucket, Comment, CommentVote)
+from collective_blog.models.post import hot_score
+
+from user.models import Profile, Karma
+
+from .buffer import get_buffer
+from .management.commands.reconcile_votes import (Command as ReconcileCommand,
+                                                  vote_cache_fields)
+
+
+def create_post(author, name='Votes'):
+    blog = Blog.objects.create(name=name, type='O')
+    Membership.objects.create(blog=blog, user=author)
+    return Post.objects.create(author=author, blog=blog, heading=name,
+                               content='Text', is_draft=False)
+
+
+class VoteForTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voter = User.objects.create(username='voter')
+        self.post = create_post(self.author)
+
+    def assertRating(self, rating):
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, rating)
+        self.assertEqual(PostVote.objects.filter(object=self.post).score(),
+                         rating)
+        self.assertEqual(Membership.objects.get(
+            user=self.author).overall_posts_rating, rating)
+
+    def test_vote_for(self):
+        PostVote.vote_for(self.voter, self.post, 1)
+        self.assertRating(1)
+
+        PostVote.vote_for(self.voter, self.post, 1)
+        self.assertRating(1)
+
+        PostVote.vote_for(self.voter, self.post, -1)
+        self.assertRating(-1)
+
+        PostVote.vote_for(self.voter, self.post, 0)
+        self.assertRating(0)
+        self.assertFalse(PostVote.objects.exists())
+
+        PostVote.vote_for(self.voter, self.post, 0)
+        self.assertRating(0)
+
+
+class BucketTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username='voter%d' % i)
+                       for i in range(3)]
+
+    def test_buckets(self):
+        post = create_post(self.author)
+        for voter in self.voters:
+            PostVote.vote_for(voter, post, 1)
+        PostVote.vote_for(self.voters[0], post, -1)
+
+        bucket = PostVoteBucket.objects.get()
+        self.assertEqual(bucket.score, 1)
+        self.assertEqual(bucket.hour, PostVoteBucket.get_hour())
+
+
+class UserVotesTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voter = User.objects.create(username='voter')
+        post = create_post(self.author)
+
+        self.comments = [
+            Comment.objects.create(author=self.author, post=post,
+                                   content='Comment %d' % i)
+            for i in range(8)]
+        for i, comment in enumerate(self.comments[::2]):
+            CommentVote.objects.create(user=self.voter, object=comment,
+                                       vote=1 if i % 2 else -1)
+
+    def test_user_votes(self):
+        with self.assertNumQueries(1):
+            votes = CommentVote.objects.all().user_votes(self.voter,
+                                                         self.comments)
+        self.assertEqual(len(votes), 4)
+        self.assertEqual(votes[self.comments[0].pk], -1)
+        self.assertEqual(votes[self.comments[2].pk], 1)
+        self.assertNotIn(self.comments[1].pk, votes)
+
+
+class ReconcileTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username='voter%d' % i)
+                       for i in range(3)]
+        self.post = create_post(self.author)
+        self.comment = Comment.objects.create(author=self.author,
+                                              post=self.post,
+                                              content='Comment')
+
+        for voter in self.voters:
+            PostVote.vote_for(voter, self.post, 1)
+            CommentVote.vote_for(voter, self.comment, -1)
+            Karma.objects.create(user=voter, object=self.author, vote=1)
+
+    def test_reconcile(self):
+        # Raw deletes and updates leave caches wrong
+        PostVote.objects.filter(user=self.voters[0]).delete()
+        Comment.objects.update(rating=5)
+        other = create_post(self.voters[0], name='Other')
+
+        fields = vote_cache_fields(['collective_blog', 'user'])
+        self.assertEqual(len(fields), 5)
+
+        command = ReconcileCommand()
+
+        stats = command.run(fields, batch_size=1, dry_run=True,
+                            verbosity=0)
+        self.assertEqual(stats['collective_blog.Post.rating'], dict(
+            checked=2, drifted=1, drift=1, repaired=0))
+        self.assertEqual(stats['collective_blog.Comment.rating'], dict(
+            checked=1, drifted=1, drift=8, repaired=0))
+        self.assertEqual(stats['user.Profile.karma']['drifted'], 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 3)
+
+        stats = command.run(fields, batch_size=1, verbosity=0)
+        self.assertEqual(stats['collective_blog.Post.rating']['repaired'], 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 2)
+        self.assertEqual(Post.objects.get(pk=other.pk).rating, 0)
+        self.assertEqual(Comment.objects.get().rating, -3)
+        self.assertEqual(Profile.objects.get(user=self.author).karma, 3)
+        membership = Membership.objects.get(user=self.author)
+        self.assertEqual(membership.overall_posts_rating, 2)
+        self.assertEqual(membership.overall_comments_rating, -3)
+
+        stats = command.run(fields, batch_size=1, verbosity=0)
+        self.assertEqual(sum(s['drifted'] for s in stats.values()), 0)
+
+
+@override_settings(S_VOTING_WRITE_BEHIND={
+    'FIELDS': ['collective_blog.Post.rating',
+               'collective_blog.Membership.overall_posts_rating'],
+    'INTERVAL': None,
+})
+class WriteBehindTest(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username='voter%d' % i)
+                       for i in range(3)]
+        self.post = create_post(self.author)
+
+    def tearDown(self):
+        # Deltas are kept in the buffer between tests
+        get_buffer().flush()
+
+    def test_write_behind(self):
+        buffer = get_buffer()
+
+        for voter in self.voters:
+            PostVote.vote_for(voter, self.post, 1)
+        PostVote.vote_for(self.voters[0], self.post, -1)
+        PostVote.vote_for(self.voters[0], self.post, 1)
+
+        self.assertEqual(PostVote.objects.filter(object=self.post).score(), 3)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 0)
+        self.assertFalse(PostVoteBucket.objects.exists())
+        self.assertEqual(buffer.pending(), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 3)
+        # Two caches and the hot score of the post; the bucket is created
+        self.assertEqual(len([q for q in queries.captured_queries
+                              if q['sql'].startswith('UPDATE')]), 3)
+
+        self.assertEqual(buffer.pending(), 0)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.rating, 3)
+        self.assertEqual(post.hot, hot_score(3, post.created))
+        self.assertEqual(Membership.objects.get(
+            user=self.author).overall_posts_rating, 3)
+        self.assertEqual(PostVoteBucket.objects.get().score, 3)
+
+        # Existing buckets are updated
+        PostVote.vote_for(self.voters[1], self.post, -1)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(PostVoteBucket.objects.get().score, 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(buffer.flush(), 0)
+
+    def test_no_object_lock(self):
+        """Test that buffered votes don't lock or write the post row"""
+        with CaptureQueriesContext(connection) as queries:
+            PostVote.vote_for(self.voters[0], self.post, 1)
+            PostVote.vote_for(self.voters[0], self.post, -1)
+
+        qn = connection.ops.quote_name
+        table = qn(Post._meta.db_table)
+        buckets = qn(PostVoteBucket._meta.db_table)
+        for query in queries.captured_queries:
+            self.assertNotIn(buckets, query['sql'])
+            self.assertNotIn('UPDATE %s' % table, query['sql'])
+            # The lock query (`FOR UPDATE` is omitted by some backends)
+            self.assertNotIn('SELECT (1) AS %s FROM %s' % (qn('a'), table),
+                             query['sql'])
+            if 'FOR UPDATE' in query['sql']:
+                self.assertNotIn('FROM %s' % table, query['sql'])
+
+        self.assertEqual(PostVote.objects.get().vote, -1)
+
+
+class ConcurrentVoteTest(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username='voter%d' % i)
+                       for i in range(8)]
+        self.post = create_post(self.author)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_votes(self):
+        errors = []
+        start = threading.Event()
+
+        def vote(user, votes):
+            try:
+                start.wait()
+                for v in votes:
+                    # Every voter votes from two threads at once
+                    PostVote.vote_for(user, self.post, v)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = []
+        for i, user in enumerate(self.voters):
+            votes = [1, -1, 0, 1, -1, 1][i % 3:]
+            threads.append(threading.Thread(target=vote, args=(user, votes)))
+            threads.append(threading.Thread(target=vote,
+                                            args=(user, votes[::-1])))
+
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+        rating = PostVote.objects.filter(object=self.post).score()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, rating)
+        self.assertEqual(Membership.objects.get(
+            user=self.author).overall_posts_rating, rating)
@@ -10,14 +10,7 @@ from .karma import Karma
 
 from s_markdown.models import MarkdownField, HtmlCacheField
 from s_markdown.datatype import Markdown
-from s_markdown.renderer import BaseRenderer
-from s_markdown.extensions import (FencedCodeExtension,
-                                   EscapeHtmlExtension,
-                                   SemiSaneListExtension,
-                                   StrikethroughExtension,
-                                   AutomailExtension,
-                                   AutolinkExtension,
-                                   CommentExtension)
+from s_markdown.registry import get_renderer
 
 
 def _karma_cache_query(v):
@@ -47,22 +40,7 @@ class Profile(models.Model):
 
     about = MarkdownField(blank=True,
                           markdown=Markdown,
-                          renderer=BaseRenderer(
-                              extensions=[
-                                  'markdown.extensions.smarty',
-                                  'markdown.extensions.abbr',
-                                  'markdown.extensions.def_list',
-                                  'markdown.extensions.tables',
-                                  'markdown.extensions.smart_strong',
-                                  FencedCodeExtension(),
-                                  EscapeHtmlExtension(),
-                                  SemiSaneListExtension(),
-                                  StrikethroughExtension(),
-                                  AutolinkExtension(),
-                                  AutomailExtension(),
-                                  CommentExtension(),
-                              ]
-                          ),
+                          renderer=get_renderer('bio'),
                           verbose_name=_('About'),
                           help_text=_('Tell us about yourself '
                                       '(use the markdown, Luke!)'))
@@ -74,7 +52,8 @@ class Profile(models.Model):
 
     # To go: liked tags
 
-    karma = VoteCacheField(Karma, _karma_cache_query)
+    karma = VoteCacheField(Karma, _karma_cache_query,
+                           group_by={'user': 'object'})
 
     # Common methods
     # --------------
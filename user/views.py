@@ -85,6 +85,7 @@ class ProfileView(DetailView):
                 ),
                 is_draft=False,
                 author=self.object)
+            .only('slug', 'heading', 'rating')
             .distinct()
             .order_by('-rating')
         )